@@ -0,0 +1,171 @@
+"""
+Load-test ChatMock offline against the bundled Responses stub.
+
+Starts `chatmock stub` and `chatmock serve --upstream-base-url <stub>` (with throwaway credentials) in separate
+processes, then drives /v1/chat/completions, /v1/completions and /api/chat, streaming and not, at a fixed
+concurrency. Reports throughput, time to first byte and end-to-end latency (p50/p99) per scenario.
+
+    python benchmarks/chatmock_load.py --concurrency 16 --requests 400 --tokens 200
+    python benchmarks/chatmock_load.py --tokens-per-second 200 --first-token-delay 0.3 --error-rate 0.01
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+
+SCENARIOS = {
+    "chat": ("/v1/chat/completions", {"model": "gpt-5", "messages": [{"role": "user", "content": "Say something."}]}),
+    "completions": ("/v1/completions", {"model": "gpt-5", "prompt": "Say something."}),
+    "ollama": ("/api/chat", {"model": "gpt-5", "messages": [{"role": "user", "content": "Say something."}]}),
+}
+
+
+def percentile(values, pct: float) -> float:
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def spawn(args, env) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, "-m", "chatmock.cli"] + args,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+async def wait_ready(client: httpx.AsyncClient, url: str) -> None:
+    for _ in range(100):
+        try:
+            await client.get(url)
+            return
+        except httpx.TransportError:
+            await asyncio.sleep(0.1)
+    raise RuntimeError(f"{url} did not start")
+
+
+async def one_request(client: httpx.AsyncClient, path: str, body: dict) -> tuple:
+    started = time.perf_counter()
+    ttfb = None
+    async with client.stream("POST", path, json=body) as resp:
+        async for chunk in resp.aiter_raw():
+            if ttfb is None and chunk:
+                ttfb = time.perf_counter() - started
+    elapsed = time.perf_counter() - started
+    return resp.status_code, ttfb if ttfb is not None else elapsed, elapsed
+
+
+async def run_scenario(client: httpx.AsyncClient, path: str, body: dict, requests: int, concurrency: int) -> dict:
+    remaining = requests
+    ttfbs, latencies = [], []
+    errors = 0
+
+    async def worker():
+        nonlocal remaining, errors
+        while remaining > 0:
+            remaining -= 1
+            try:
+                status, ttfb, elapsed = await one_request(client, path, body)
+            except httpx.HTTPError:
+                errors += 1
+                continue
+            if status >= 400:
+                errors += 1
+                continue
+            ttfbs.append(ttfb)
+            latencies.append(elapsed)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - started
+    return {"ok": len(latencies), "errors": errors, "rps": len(latencies) / wall, "ttfb": ttfbs, "latency": latencies}
+
+
+async def run(args, base_url: str) -> None:
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=120) as client:
+        await wait_ready(client, "/health")
+        print(
+            f"{'scenario':<20} {'ok':>6} {'err':>5} {'req/s':>8} "
+            f"{'ttfb p50':>9} {'ttfb p99':>9} {'lat p50':>9} {'lat p99':>9}  (ms)"
+        )
+        for name in args.scenarios:
+            path, body = SCENARIOS[name]
+            for stream in (False, True):
+                label = f"{name}/{'stream' if stream else 'plain'}"
+                payload = {**body, "stream": stream}
+                await run_scenario(client, path, payload, args.warmup, args.concurrency)
+                r = await run_scenario(client, path, payload, args.requests, args.concurrency)
+                print(
+                    f"{label:<20} {r['ok']:>6} {r['errors']:>5} {r['rps']:>8.1f} "
+                    f"{percentile(r['ttfb'], 50) * 1000:>9.1f} {percentile(r['ttfb'], 99) * 1000:>9.1f} "
+                    f"{percentile(r['latency'], 50) * 1000:>9.1f} {percentile(r['latency'], 99) * 1000:>9.1f}"
+                )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=400, help="Requests per scenario")
+    parser.add_argument("--warmup", type=int, default=20, help="Unmeasured requests before each scenario")
+    parser.add_argument("--scenarios", nargs="+", choices=sorted(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--tokens", type=int, default=200, help="Output deltas per stubbed answer")
+    parser.add_argument("--tokens-per-second", type=float, default=0.0)
+    parser.add_argument("--first-token-delay", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--recording", default=None, help="Replay this recorded Responses stream instead")
+    parser.add_argument("--stub-port", type=int, default=8100)
+    parser.add_argument("--port", type=int, default=8101, help="Port for the ChatMock under test")
+    parser.add_argument("--chatmock-url", default=None, help="Drive an already running ChatMock instead")
+    args = parser.parse_args()
+
+    if args.chatmock_url:
+        asyncio.run(run(args, args.chatmock_url))
+        return
+
+    home = tempfile.mkdtemp(prefix="chatmock-load-")
+    with open(os.path.join(home, "auth.json"), "w") as f:
+        json.dump({"tokens": {"access_token": "stub", "account_id": "stub", "id_token": "stub"}}, f)
+    env = {**os.environ, "PYTHONPATH": SRC + os.pathsep + os.environ.get("PYTHONPATH", ""), "CHATGPT_LOCAL_HOME": home}
+
+    stub_args = [
+        "stub",
+        "--port", str(args.stub_port),
+        "--tokens", str(args.tokens),
+        "--tokens-per-second", str(args.tokens_per_second),
+        "--first-token-delay", str(args.first_token_delay),
+        "--error-rate", str(args.error_rate),
+        "--seed", "0",
+    ]
+    if args.recording:
+        stub_args += ["--recording", args.recording]
+    procs = [
+        spawn(stub_args, env),
+        spawn(
+            ["serve", "--port", str(args.port), "--upstream-base-url", f"http://127.0.0.1:{args.stub_port}"],
+            env,
+        ),
+    ]
+    try:
+        asyncio.run(run(args, f"http://127.0.0.1:{args.port}"))
+    finally:
+        for proc in procs:
+            proc.terminate()
+            proc.wait()
+        shutil.rmtree(home, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
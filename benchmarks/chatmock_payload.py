@@ -0,0 +1,139 @@
+"""
+Measure ChatMock's per-request CPU for building the outbound Responses API payload.
+
+Compares the previous path (canonicalize and hash the full instructions for the prompt-cache fingerprint, then
+json.dumps the whole payload dict) with the current one (precomputed instruction digest, body assembled from
+pre-encoded pieces), with and without the tool cache. Uses the real instructions and a synthetic tool list.
+
+    python benchmarks/chatmock_payload.py --iterations 5000 --tools 50
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from chatmock.config import BASE_INSTRUCTIONS, GPT5_CODEX_INSTRUCTIONS  # noqa: E402
+from chatmock.payload import build_responses_body, prepare_instructions, prepare_tools  # noqa: E402
+from chatmock.session import _canonicalize_first_user_message, _fingerprint  # noqa: E402
+
+
+def make_tools(count: int) -> list:
+    return [
+        {
+            "type": "function",
+            "name": f"tool_{i}",
+            "description": "Does something useful with the given arguments. " * 4,
+            "strict": False,
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "path": {"type": "string", "description": "File path"},
+                    "limit": {"type": "integer", "description": "Maximum number of results"},
+                    "flags": {"type": "array", "items": {"type": "string"}},
+                },
+                "required": ["path"],
+            },
+        }
+        for i in range(count)
+    ]
+
+
+def make_input() -> list:
+    return [
+        {"type": "message", "role": "user", "content": [{"type": "input_text", "text": "Refactor the parser module."}]},
+        {"type": "message", "role": "assistant", "content": [{"type": "output_text", "text": "Sure, looking at it now."}]},
+        {"type": "message", "role": "user", "content": [{"type": "input_text", "text": "Keep the public API."}]},
+    ]
+
+
+def legacy(instructions: str, input_items: list, tools: list) -> bytes:
+    prefix = {}
+    if instructions.strip():
+        prefix["instructions"] = instructions.strip()
+    first_user = _canonicalize_first_user_message(input_items)
+    if first_user is not None:
+        prefix["first_user_message"] = first_user
+    session_id = hashlib.sha256(json.dumps(prefix, sort_keys=True, separators=(",", ":")).encode("utf-8")).hexdigest()
+    payload = {
+        "model": "gpt-5-codex",
+        "instructions": instructions,
+        "input": input_items,
+        "tools": tools,
+        "tool_choice": "auto",
+        "parallel_tool_calls": False,
+        "store": False,
+        "stream": True,
+        "prompt_cache_key": session_id,
+        "include": ["reasoning.encrypted_content"],
+        "reasoning": {"effort": "medium", "summary": "auto"},
+    }
+    # requests' json= serializes with the default separators
+    return json.dumps(payload).encode("utf-8")
+
+
+def current(instructions: str, input_items: list, tools: list) -> bytes:
+    prepared = prepare_instructions(instructions)
+    session_id = _fingerprint(prepared, input_items)
+    return build_responses_body(
+        "gpt-5-codex",
+        prepared,
+        input_items,
+        json.dumps(tools, separators=(",", ":")),
+        "auto",
+        False,
+        session_id,
+        include=["reasoning.encrypted_content"],
+        reasoning_param={"effort": "medium", "summary": "auto"},
+    )
+
+
+def current_cached_tools(instructions: str, input_items: list, tools: list) -> bytes:
+    # The tool cache still hashes the raw tool list on every request
+    tools_encoded = prepare_tools(tools, list, "bench").encoded
+    prepared = prepare_instructions(instructions)
+    session_id = _fingerprint(prepared, input_items)
+    return build_responses_body(
+        "gpt-5-codex",
+        prepared,
+        input_items,
+        tools_encoded,
+        "auto",
+        False,
+        session_id,
+        include=["reasoning.encrypted_content"],
+        reasoning_param={"effort": "medium", "summary": "auto"},
+    )
+
+
+def timed(fn, iterations: int, *args) -> float:
+    fn(*args)
+    t0 = time.perf_counter()
+    for _ in range(iterations):
+        fn(*args)
+    return (time.perf_counter() - t0) / iterations * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=5000)
+    parser.add_argument("--tools", type=int, default=50, help="Number of function tools in each request")
+    args = parser.parse_args()
+
+    tools = make_tools(args.tools)
+    input_items = make_input()
+
+    print(f"{'instructions':<14}{'size':>8}{'legacy_us':>12}{'current_us':>12}{'cached_tools_us':>17}")
+    for name, text in (("base", BASE_INSTRUCTIONS), ("codex", GPT5_CODEX_INSTRUCTIONS)):
+        before = timed(legacy, args.iterations, text, input_items, tools)
+        after = timed(current, args.iterations, text, input_items, tools)
+        cached = timed(current_cached_tools, args.iterations, text, input_items, tools)
+        print(f"{name:<14}{len(text):>8}{before:>12.1f}{after:>12.1f}{cached:>17.1f}")
+
+
+if __name__ == "__main__":
+    main()
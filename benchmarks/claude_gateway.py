@@ -0,0 +1,127 @@
+"""
+Measure the overhead claude_code_api adds on top of the Claude CLI itself.
+
+Runs the gateway in-process (httpx over ASGI, no sockets) against the fake Claude CLI from
+src/claude_code_api/tests/fake_claude.py with zero delays, so what's left is the gateway's own work: spawning
+the CLI, parsing its stream-json, converting to OpenAI chunks and the session database writes. The baseline is
+the fake CLI spawned directly with the same arguments; overhead is gateway latency minus that baseline.
+
+    python benchmarks/claude_gateway.py --requests 200 --concurrency 1 4 16 --messages 4 --text-bytes 500
+"""
+
+import argparse
+import asyncio
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SRC = os.path.join(HERE, "..", "src")
+FAKE_CLAUDE = os.path.join(SRC, "claude_code_api", "tests", "fake_claude.py")
+
+
+def percentile(values, pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def run_concurrent(fn, requests: int, concurrency: int) -> tuple:
+    remaining = requests
+    latencies = []
+
+    async def worker():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            t0 = time.perf_counter()
+            await fn()
+            latencies.append(time.perf_counter() - t0)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, time.perf_counter() - started
+
+
+async def spawn_cli() -> None:
+    proc = await asyncio.create_subprocess_exec(
+        FAKE_CLAUDE, "-p", "Say something.", "--model", "claude-3-5-haiku-20241022",
+        "--output-format", "stream-json", "--verbose", "--dangerously-skip-permissions",
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    await proc.communicate()
+
+
+async def main_async(args) -> None:
+    import httpx
+
+    from claude_code_api.main import app
+
+    body = {"model": "claude-3-5-haiku-20241022", "messages": [{"role": "user", "content": "Say something."}]}
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://gateway", timeout=120) as client:
+
+            async def plain():
+                resp = await client.post("/v1/chat/completions", json=body)
+                resp.raise_for_status()
+
+            async def stream():
+                async with client.stream("POST", "/v1/chat/completions", json={**body, "stream": True}) as resp:
+                    resp.raise_for_status()
+                    async for _ in resp.aiter_raw():
+                        pass
+
+            scenarios = [("cli only", spawn_cli), ("gateway plain", plain), ("gateway stream", stream)]
+            print(f"{'scenario':<16} {'conc':>5} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'overhead p50 ms':>16}")
+            for concurrency in args.concurrency:
+                baseline = None
+                for name, fn in scenarios:
+                    await run_concurrent(fn, args.warmup, concurrency)
+                    latencies, wall = await run_concurrent(fn, args.requests, concurrency)
+                    p50 = statistics.median(latencies)
+                    if baseline is None:
+                        baseline = p50
+                    overhead = "" if fn is spawn_cli else f"{(p50 - baseline) * 1000:.2f}"
+                    print(
+                        f"{name:<16} {concurrency:>5} {len(latencies) / wall:>8.1f} {p50 * 1000:>8.2f} "
+                        f"{percentile(latencies, 99) * 1000:>8.2f} {overhead:>16}"
+                    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200, help="Requests per scenario and concurrency level")
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--messages", type=int, default=2, help="Assistant text messages per fake CLI run")
+    parser.add_argument("--text-bytes", type=int, default=200, help="Size of each assistant text message")
+    parser.add_argument("--tool-uses", type=int, default=1, help="tool_use/tool_result round trips per run")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="claude-gateway-bench-")
+    # Settings are read at import time, so the environment has to be in place before the app is imported
+    os.environ.update(
+        {
+            "CLAUDE_BINARY_PATH": FAKE_CLAUDE,
+            "DATABASE_URL": f"sqlite:///{workdir}/bench.db",
+            "PROJECT_ROOT": os.path.join(workdir, "projects"),
+            "MAX_CONCURRENT_SESSIONS": str(max(args.concurrency) * 2),
+            "FAKE_CLAUDE_MESSAGES": str(args.messages),
+            "FAKE_CLAUDE_TEXT_BYTES": str(args.text_bytes),
+            "FAKE_CLAUDE_TOOL_USES": str(args.tool_uses),
+        }
+    )
+    sys.path.insert(0, SRC)
+    try:
+        asyncio.run(main_async(args))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Measure stream-json decoding on multi-MB Claude Code transcripts.
+
+Transcripts come from the fake Claude CLI in src/claude_code_api/tests/fake_claude.py, with large tool results
+and (with --partial) one stream_event line per word. Every transcript is decoded line by line four ways: the
+standard library or orjson, each with and without Pydantic validation (what settings.debug switches on).
+"parse" is ClaudeOutputParser.parse_line; "stream" is the gateway's own path, decode_message followed by
+OpenAIStreamConverter and SSE framing.
+
+    python benchmarks/claude_parse.py --megabytes 4 32 --partial
+"""
+
+import argparse
+import math
+import os
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SRC = os.path.join(HERE, "..", "src")
+FAKE_CLAUDE = os.path.join(SRC, "claude_code_api", "tests", "fake_claude.py")
+
+
+def transcript(messages: int, args) -> bytes:
+    env = {
+        **os.environ,
+        "FAKE_CLAUDE_MESSAGES": str(messages),
+        "FAKE_CLAUDE_TOOL_USES": str(messages),
+        "FAKE_CLAUDE_TEXT_BYTES": str(args.text_bytes),
+        "FAKE_CLAUDE_TOOL_RESULT_BYTES": str(args.tool_result_bytes),
+    }
+    cmd = [sys.executable, FAKE_CLAUDE, "-p", "Say something.", "--output-format", "stream-json"]
+    if args.partial:
+        cmd.append("--include-partial-messages")
+    return subprocess.run(cmd, env=env, capture_output=True, check=True).stdout
+
+
+def make_transcript(megabytes: float, args) -> list:
+    # Size one small run, then scale the message count up to the target
+    probe = len(transcript(10, args))
+    data = transcript(max(1, math.ceil(megabytes * 1024 * 1024 / probe * 10)), args)
+    return data.splitlines()
+
+
+def run_parse(lines: list) -> None:
+    from claude_code_api.utils.parser import ClaudeOutputParser
+
+    output_parser = ClaudeOutputParser()
+    for line in lines:
+        output_parser.parse_line(line)
+
+
+def run_stream(lines: list) -> None:
+    from claude_code_api.utils.parser import decode_message
+    from claude_code_api.utils.streaming import OpenAIStreamConverter, SSEFormatter
+
+    converter = OpenAIStreamConverter("claude-3-5-haiku-20241022", "bench")
+    for line in lines:
+        for delta in converter.convert_message(decode_message(line)):
+            SSEFormatter.format_event(converter.chunk(delta))
+
+
+def timed(fn, lines: list, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn(lines)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--megabytes", type=float, nargs="+", default=[4, 32], help="Transcript sizes to decode")
+    parser.add_argument("--partial", action="store_true", help="Include per-word stream_event lines")
+    parser.add_argument("--text-bytes", type=int, default=2000, help="Size of each assistant text message")
+    parser.add_argument("--tool-result-bytes", type=int, default=64 * 1024, help="Size of each tool result")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per measurement; the fastest is reported")
+    args = parser.parse_args()
+
+    sys.path.insert(0, SRC)
+    from claude_code_api.core.config import settings
+    from claude_code_api.utils import parser as claude_parser
+
+    backends = [("json", None)]
+    if claude_parser.orjson is not None:
+        backends.insert(0, ("orjson", claude_parser.orjson))
+    else:
+        print("orjson is not installed; only the standard library is measured")
+
+    print(f"{'MB':>6} {'lines':>8} {'backend':<7} {'validate':<8} {'parse MB/s':>11} {'stream MB/s':>12} {'stream lines/s':>15}")
+    for megabytes in args.megabytes:
+        lines = make_transcript(megabytes, args)
+        size = sum(len(line) + 1 for line in lines) / (1024 * 1024)
+        for name, backend in backends:
+            claude_parser.orjson = backend
+            for validate in (False, True):
+                settings.debug = validate
+                parse = timed(run_parse, lines, args.repeat)
+                stream = timed(run_stream, lines, args.repeat)
+                print(
+                    f"{size:>6.1f} {len(lines):>8} {name:<7} {'yes' if validate else 'no':<8} "
+                    f"{size / parse:>11.1f} {size / stream:>12.1f} {len(lines) / stream:>15.0f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
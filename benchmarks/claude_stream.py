@@ -0,0 +1,140 @@
+"""
+Measure how fast claude_code_api turns long Claude Code runs into OpenAI stream chunks.
+
+Two measurements per run length, both fed by the fake Claude CLI from src/claude_code_api/tests/fake_claude.py
+with --include-partial-messages, so a run is mostly one-word text deltas plus tool calls and tool results:
+
+    convert   OpenAIStreamConverter alone over a pre-recorded transcript: events/s, and the peak memory the
+              conversion allocates (it should not grow with the number of events)
+    gateway   a streaming /v1/chat/completions request against the in-process app (spawning the CLI, the bounded
+              output queue and SSE framing included): events/s and total time
+
+    python benchmarks/claude_stream.py --events 1000 10000 100000
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SRC = os.path.join(HERE, "..", "src")
+FAKE_CLAUDE = os.path.join(SRC, "claude_code_api", "tests", "fake_claude.py")
+TEXT_BYTES = 400
+
+
+def fake_env(events: int) -> dict:
+    # A text message with partial events is roughly one event per word (~6 bytes) plus a few framing events
+    per_message = TEXT_BYTES // 6 + 12
+    return {
+        **os.environ,
+        "FAKE_CLAUDE_MESSAGES": str(max(1, events // per_message)),
+        "FAKE_CLAUDE_TEXT_BYTES": str(TEXT_BYTES),
+        "FAKE_CLAUDE_TOOL_USES": str(max(1, events // per_message // 4)),
+    }
+
+
+def record(events: int) -> list:
+    out = subprocess.run(
+        [sys.executable, FAKE_CLAUDE, "-p", "Say something.", "--output-format", "stream-json", "--include-partial-messages"],
+        env=fake_env(events),
+        capture_output=True,
+        check=True,
+    ).stdout
+    return [json.loads(line) for line in out.splitlines()]
+
+
+def convert(messages: list) -> int:
+    from claude_code_api.utils.streaming import OpenAIStreamConverter, SSEFormatter
+
+    converter = OpenAIStreamConverter("claude-3-5-haiku-20241022", "bench")
+    chunks = 0
+    for message in messages:
+        for delta in converter.convert_message(message):
+            SSEFormatter.format_event(converter.chunk(delta))
+            chunks += 1
+    return chunks
+
+
+def bench_convert(messages: list) -> tuple:
+    started = time.perf_counter()
+    chunks = convert(messages)
+    elapsed = time.perf_counter() - started
+    # Separate pass, tracemalloc slows allocation down too much to time under it
+    tracemalloc.start()
+    convert(messages)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return chunks, elapsed, peak
+
+
+async def bench_gateway(client, events: int) -> tuple:
+    os.environ.update({key: value for key, value in fake_env(events).items() if key.startswith("FAKE_CLAUDE_")})
+    body = {
+        "model": "claude-3-5-haiku-20241022",
+        "messages": [{"role": "user", "content": "Say something."}],
+        "stream": True,
+    }
+    started = time.perf_counter()
+    chunks = 0
+    async with client.stream("POST", "/v1/chat/completions", json=body) as resp:
+        resp.raise_for_status()
+        async for line in resp.aiter_lines():
+            if line.startswith("data: "):
+                chunks += 1
+    return chunks, time.perf_counter() - started
+
+
+async def main_async(args) -> None:
+    import httpx
+
+    from claude_code_api.main import app
+
+    print(f"{'events':>8} {'stage':<8} {'chunks':>8} {'events/s':>10} {'total ms':>9} {'peak KB':>8}")
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://gateway", timeout=600) as client:
+            for events in args.events:
+                messages = record(events)
+                chunks, elapsed, peak = bench_convert(messages)
+                print(
+                    f"{len(messages):>8} {'convert':<8} {chunks:>8} {len(messages) / elapsed:>10.0f} "
+                    f"{elapsed * 1000:>9.1f} {peak / 1024:>8.0f}"
+                )
+                chunks, elapsed = await bench_gateway(client, events)
+                print(
+                    f"{len(messages):>8} {'gateway':<8} {chunks:>8} {len(messages) / elapsed:>10.0f} "
+                    f"{elapsed * 1000:>9.1f}"
+                )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, nargs="+", default=[1000, 10000], help="Approximate stream-json events per run")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="claude-stream-bench-")
+    # Settings are read at import time, so the environment has to be in place before the app is imported
+    os.environ.update(
+        {
+            "CLAUDE_BINARY_PATH": FAKE_CLAUDE,
+            "DATABASE_URL": f"sqlite:///{workdir}/bench.db",
+            "PROJECT_ROOT": os.path.join(workdir, "projects"),
+            "CLAUDE_PARTIAL_MESSAGES": "true",
+        }
+    )
+    sys.path.insert(0, SRC)
+    try:
+        asyncio.run(main_async(args))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
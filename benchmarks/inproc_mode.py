@@ -0,0 +1,136 @@
+"""
+Compare the default multi-process layout with `coder2api serve --inproc`.
+
+Multi-process: the proxy forwards /codex and /cc over loopback HTTP to ChatMock and Claude Code API running as
+their own processes. In-process: both apps are mounted inside the proxy. The benchmark drives endpoints that
+don't need upstream credentials (/codex/v1/models and /cc/v1/models) and reports latency,
+throughput and the combined resident memory of the processes involved.
+
+    python benchmarks/inproc_mode.py --requests 2000 --concurrency 16
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+ENDPOINTS = ("/codex/v1/models", "/cc/v1/models")
+
+
+def rss_mb(pids) -> float:
+    total = 0
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1])
+        except OSError:
+            pass
+    return total / 1024
+
+
+def start(cmd, env, workdir):
+    return subprocess.Popen(cmd, env=env, cwd=workdir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def launch(mode: str, args, workdir: str):
+    env = os.environ.copy()
+    env["CODER2API_CODEX_PORT"] = str(args.base_port + 1)
+    env["CODER2API_CC_PORT"] = str(args.base_port + 2)
+    procs = []
+    if mode == "inproc":
+        env["CODER2API_INPROC"] = "1"
+    else:
+        procs.append(start([sys.executable, "-m", "chatmock.cli", "serve", "--port", env["CODER2API_CODEX_PORT"]], env, workdir))
+        procs.append(start(
+            [sys.executable, "-m", "uvicorn", "claude_code_api.main:app", "--port", env["CODER2API_CC_PORT"], "--log-level", "warning"],
+            env,
+            workdir,
+        ))
+    procs.append(start(
+        [sys.executable, "-m", "uvicorn", "coder2api.server:app", "--port", str(args.base_port), "--log-level", "warning"],
+        env,
+        workdir,
+    ))
+    return procs
+
+
+async def wait_ready(client: httpx.AsyncClient) -> None:
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            statuses = [(await client.get(path)).status_code for path in ENDPOINTS]
+            if all(status == 200 for status in statuses):
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("services did not become ready")
+
+
+async def drive(args) -> dict:
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{args.base_port}", timeout=30) as client:
+        await wait_ready(client)
+        latencies = {path: [] for path in ENDPOINTS}
+        queue = asyncio.Queue()
+        for i in range(args.requests):
+            queue.put_nowait(ENDPOINTS[i % len(ENDPOINTS)])
+
+        async def worker():
+            while not queue.empty():
+                path = queue.get_nowait()
+                t0 = time.perf_counter()
+                r = await client.get(path)
+                r.raise_for_status()
+                latencies[path].append(time.perf_counter() - t0)
+
+        t0 = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - t0
+
+    out = {"req_per_s": args.requests / elapsed}
+    for path, values in latencies.items():
+        values.sort()
+        out[f"{path} p50_ms"] = statistics.median(values) * 1000
+        out[f"{path} p99_ms"] = values[min(len(values) - 1, int(len(values) * 0.99))] * 1000
+    return out
+
+
+def bench(mode: str, args) -> dict:
+    # Claude Code API creates its SQLite database in the working directory
+    with tempfile.TemporaryDirectory(prefix="coder2api-bench-") as workdir:
+        procs = launch(mode, args, workdir)
+        try:
+            result = asyncio.run(drive(args))
+            result["rss_mb"] = rss_mb(p.pid for p in procs)
+            result["processes"] = len(procs)
+            return result
+        finally:
+            for p in procs:
+                p.terminate()
+            for p in procs:
+                p.wait()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--base-port", type=int, default=18170, help="Proxy port; backends use the next two ports")
+    args = parser.parse_args()
+
+    results = {mode: bench(mode, args) for mode in ("separate", "inproc")}
+    print(f"{'metric':<28}{'separate':>12}{'inproc':>12}")
+    for metric in results["separate"]:
+        print(f"{metric:<28}{results['separate'][metric]:>12.2f}{results['inproc'][metric]:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
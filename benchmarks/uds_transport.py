@@ -0,0 +1,159 @@
+"""
+Compare loopback TCP and Unix domain sockets for the proxy -> backend hop.
+
+Starts a small streaming ASGI backend twice (once on a TCP port, once on a socket) in a separate process and
+drives it with the same long-lived httpx client setup the proxy uses. Reports per-request latency for small
+JSON calls and per-chunk cost for SSE-style streams.
+
+    python benchmarks/uds_transport.py --requests 2000 --streams 50 --chunks 2000 --chunk-size 256
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+
+def backend_app(chunk_size: int):
+    payload = b'{"ok":true}'
+
+    async def app(scope, receive, send):
+        if scope["type"] != "http":
+            return
+        if scope["path"] == "/stream":
+            query = dict(p.split("=", 1) for p in scope["query_string"].decode().split("&") if "=" in p)
+            chunks = int(query.get("n", "100"))
+            data = b"data: " + b"x" * max(chunk_size - 8, 0) + b"\n\n"
+            await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"text/event-stream")]})
+            for _ in range(chunks):
+                await send({"type": "http.response.body", "body": data, "more_body": True})
+            await send({"type": "http.response.body", "body": b""})
+            return
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(payload)).encode())],
+        })
+        await send({"type": "http.response.body", "body": payload})
+
+    return app
+
+
+def serve_backend(args) -> None:
+    import uvicorn
+
+    config = {"log_level": "warning", "access_log": False}
+    if args.uds:
+        config["uds"] = args.uds
+    else:
+        config["host"] = "127.0.0.1"
+        config["port"] = args.port
+    uvicorn.run(backend_app(args.chunk_size), **config)
+
+
+def percentile(values, pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def wait_ready(client: httpx.AsyncClient) -> None:
+    for _ in range(100):
+        try:
+            await client.get("/ping")
+            return
+        except httpx.TransportError:
+            await asyncio.sleep(0.1)
+    raise RuntimeError("backend did not start")
+
+
+async def run_client(client: httpx.AsyncClient, args) -> dict:
+    await wait_ready(client)
+
+    latencies = []
+    for _ in range(args.requests):
+        t0 = time.perf_counter()
+        r = await client.get("/ping")
+        r.read()
+        latencies.append(time.perf_counter() - t0)
+
+    stream_times = []
+    total_bytes = 0
+    for _ in range(args.streams):
+        t0 = time.perf_counter()
+        async with client.stream("GET", f"/stream?n={args.chunks}") as r:
+            async for chunk in r.aiter_raw():
+                total_bytes += len(chunk)
+        stream_times.append(time.perf_counter() - t0)
+
+    per_chunk = [t / args.chunks for t in stream_times]
+    return {
+        "request_mean_us": statistics.mean(latencies) * 1e6,
+        "request_p50_us": percentile(latencies, 50) * 1e6,
+        "request_p99_us": percentile(latencies, 99) * 1e6,
+        "chunk_mean_us": statistics.mean(per_chunk) * 1e6,
+        "stream_mb_per_s": total_bytes / sum(stream_times) / 1e6,
+    }
+
+
+def bench(transport: str, args) -> dict:
+    cmd = [sys.executable, os.path.abspath(__file__), "--serve-backend", "--chunk-size", str(args.chunk_size)]
+    sock_dir = None
+    if transport == "uds":
+        sock_dir = tempfile.mkdtemp(prefix="coder2api-bench-")
+        sock = os.path.join(sock_dir, "backend.sock")
+        cmd += ["--uds", sock]
+        client = httpx.AsyncClient(base_url="http://localhost", transport=httpx.AsyncHTTPTransport(uds=sock))
+    else:
+        cmd += ["--port", str(args.port)]
+        client = httpx.AsyncClient(base_url=f"http://127.0.0.1:{args.port}")
+
+    proc = subprocess.Popen(cmd)
+    try:
+        async def main():
+            async with client:
+                return await run_client(client, args)
+
+        return asyncio.run(main())
+    finally:
+        proc.terminate()
+        proc.wait()
+        if sock_dir:
+            for name in os.listdir(sock_dir):
+                os.unlink(os.path.join(sock_dir, name))
+            os.rmdir(sock_dir)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000, help="Small JSON requests per transport")
+    parser.add_argument("--streams", type=int, default=50, help="Streams per transport")
+    parser.add_argument("--chunks", type=int, default=2000, help="Chunks per stream")
+    parser.add_argument("--chunk-size", type=int, default=256, help="Bytes per chunk")
+    parser.add_argument("--port", type=int, default=18765)
+    parser.add_argument("--uds", help=argparse.SUPPRESS)
+    parser.add_argument("--serve-backend", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve_backend:
+        serve_backend(args)
+        return
+
+    results = {transport: bench(transport, args) for transport in ("tcp", "uds")}
+    print(f"{'metric':<18}{'tcp':>12}{'uds':>12}{'saving':>10}")
+    for metric in results["tcp"]:
+        tcp, uds = results["tcp"][metric], results["uds"][metric]
+        if metric.endswith("per_s"):
+            saving = (uds - tcp) / tcp * 100 if tcp else 0.0
+        else:
+            saving = (tcp - uds) / tcp * 100 if tcp else 0.0
+        print(f"{metric:<18}{tcp:>12.1f}{uds:>12.1f}{saving:>9.1f}%")
+
+
+if __name__ == "__main__":
+    main()
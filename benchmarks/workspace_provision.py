@@ -0,0 +1,99 @@
+"""
+Measure how long claude_code_api takes to hand out a project workspace created from a template.
+
+A synthetic template (many small source files plus a few large blobs) is generated, then workspaces are
+provisioned with each clone method this machine supports. "cold" is a clone made on the request path; "pooled"
+is a clone prepared ahead of time and renamed into place. Overlay mounts need root or fuse-overlayfs; reflink
+needs btrfs, XFS or a similar filesystem under --root.
+
+    python benchmarks/workspace_provision.py --megabytes 1024 --root /var/tmp
+"""
+
+import argparse
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SRC = os.path.join(HERE, "..", "src")
+
+
+def make_template(path: str, megabytes: int, files: int) -> None:
+    # Half the size in small files spread over directories, half in a handful of large ones
+    small = max(1, megabytes * 1024 * 1024 // 2 // files)
+    for i in range(files):
+        directory = os.path.join(path, "src", f"pkg{i % 100}")
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, f"module{i}.py"), "wb") as f:
+            f.write(os.urandom(small))
+    blobs = os.path.join(path, "assets")
+    os.makedirs(blobs, exist_ok=True)
+    for i in range(4):
+        with open(os.path.join(blobs, f"blob{i}.bin"), "wb") as f:
+            for _ in range(megabytes // 8):
+                f.write(os.urandom(1024 * 1024))
+
+
+async def measure(manager, method: str, runs: int) -> tuple:
+    cold, pooled = [], []
+    for i in range(runs):
+        if method != "overlay":
+            manager.pools["app"].clear()
+        started = time.perf_counter()
+        path = await manager.provision(f"{method}-cold-{i}", "app")
+        cold.append(time.perf_counter() - started)
+        await manager.release(path)
+        if method == "overlay":
+            continue
+        while len(manager.pools["app"]) < manager.pool_size:
+            await asyncio.sleep(0.01)
+        started = time.perf_counter()
+        path = await manager.provision(f"{method}-pooled-{i}", "app")
+        pooled.append(time.perf_counter() - started)
+        await manager.release(path)
+    return min(cold), min(pooled) if pooled else None
+
+
+async def main_async(args, root: str, template: str) -> None:
+    from claude_code_api.core import workspace
+    from claude_code_api.core.workspace import WorkspaceManager
+
+    methods = ["copy", "hardlink"]
+    probe = WorkspaceManager(root, {"app": template}, "auto", pool_size=0)
+    if await probe._method_for("app") == "reflink":
+        methods.insert(0, "reflink")
+    if workspace._overlay_available():
+        methods.insert(0, "overlay")
+
+    print(f"{'method':<9} {'cold ms':>10} {'pooled ms':>10}")
+    for method in methods:
+        manager = WorkspaceManager(root, {"app": template}, method, pool_size=1)
+        await manager.start()
+        cold, pooled = await measure(manager, method, args.runs)
+        await manager.stop()
+        print(f"{method:<9} {cold * 1000:>10.1f} {'-' if pooled is None else f'{pooled * 1000:.1f}':>10}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--megabytes", type=int, default=256, help="Template size")
+    parser.add_argument("--files", type=int, default=5000, help="Number of small files in the template")
+    parser.add_argument("--runs", type=int, default=3, help="Workspaces per method; the fastest is reported")
+    parser.add_argument("--root", default=None, help="Directory to put the template and workspaces in")
+    args = parser.parse_args()
+
+    sys.path.insert(0, SRC)
+    workdir = tempfile.mkdtemp(prefix="workspace-bench-", dir=args.root)
+    try:
+        template = os.path.join(workdir, "template")
+        make_template(template, args.megabytes, args.files)
+        asyncio.run(main_async(args, os.path.join(workdir, "projects"), template))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,16 @@
 from __future__ import annotations
 
-from flask import Flask, jsonify
+import time
 
-from .config import BASE_INSTRUCTIONS, GPT5_CODEX_INSTRUCTIONS
+from flask import Flask, Response, g, jsonify, request
+
+from . import metrics, timing, tool_rejections
+from .config import BASE_INSTRUCTIONS, CHATGPT_RESPONSES_URL, GPT5_CODEX_INSTRUCTIONS
 from .http import build_cors_headers
+from .payload import prepare_instructions
 from .routes_openai import openai_bp
 from .routes_ollama import ollama_bp
+from .session import configure_sessions
 
 
 def create_app(
@@ -17,8 +22,16 @@ def create_app(
     debug_model: str | None = None,
     expose_reasoning_models: bool = False,
     default_web_search: bool = False,
+    session_store: str | None = None,
+    session_ttl: float | None = None,
+    tool_rejection_ttl: float | None = None,
+    keepalive_seconds: float = 15.0,
+    server_timing: bool = False,
+    upstream_base_url: str | None = None,
 ) -> Flask:
     app = Flask(__name__)
+    configure_sessions(ttl_seconds=session_ttl, store_path=session_store)
+    tool_rejections.configure_tool_rejections(ttl_seconds=tool_rejection_ttl)
 
     app.config.update(
         VERBOSE=bool(verbose),
@@ -31,6 +44,14 @@ def create_app(
         GPT5_CODEX_INSTRUCTIONS=GPT5_CODEX_INSTRUCTIONS,
         EXPOSE_REASONING_MODELS=bool(expose_reasoning_models),
         DEFAULT_WEB_SEARCH=bool(default_web_search),
+        KEEPALIVE_SECONDS=float(keepalive_seconds or 0),
+        SERVER_TIMING=bool(server_timing),
+        RESPONSES_URL=f"{upstream_base_url.rstrip('/')}/responses" if upstream_base_url else CHATGPT_RESPONSES_URL,
+    )
+    # Digest and JSON encoding of the (multi-KB) instructions are computed once here instead of per request
+    app.config.update(
+        PREPARED_BASE_INSTRUCTIONS=prepare_instructions(app.config["BASE_INSTRUCTIONS"]),
+        PREPARED_CODEX_INSTRUCTIONS=prepare_instructions(app.config["GPT5_CODEX_INSTRUCTIONS"]),
     )
 
     @app.get("/")
@@ -38,12 +59,49 @@ def create_app(
     def health():
         return jsonify({"status": "ok"})
 
+    @app.get("/metrics")
+    def prometheus_metrics():
+        return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+    @app.get("/debug/tool-rejections")
+    def tool_rejection_state():
+        return jsonify(tool_rejections.snapshot())
+
+    @app.before_request
+    def _metrics_start():
+        g.metrics_start = time.perf_counter()
+        g.metrics_route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        g.metrics_model = ""
+        metrics.INFLIGHT.inc(route=g.metrics_route)
+        if app.config["SERVER_TIMING"]:
+            g.stage_timer = timing.StageTimer(g.metrics_start)
+
     @app.after_request
     def _cors(resp):
         for k, v in build_cors_headers().items():
             resp.headers.setdefault(k, v)
         return resp
 
+    @app.after_request
+    def _timing_finish(resp):
+        timer = g.get("stage_timer")
+        if timer is not None:
+            timing.instrument_response(resp, timer, g.metrics_route)
+        return resp
+
+    @app.after_request
+    def _metrics_finish(resp):
+        metrics.instrument_response(resp, g.metrics_route, g.metrics_model, g.metrics_start, time.perf_counter)
+        g.metrics_done = True
+        return resp
+
+    @app.teardown_request
+    def _metrics_abort(exc):
+        # after_request is skipped when a view raises; make sure the request still leaves the in-flight gauge
+        if "metrics_start" in g and not g.get("metrics_done"):
+            metrics.REQUESTS.inc(route=g.metrics_route, model=g.metrics_model, status="500")
+            metrics.INFLIGHT.dec(route=g.metrics_route)
+
     app.register_blueprint(openai_bp)
     app.register_blueprint(ollama_bp)
 
@@ -12,6 +12,7 @@ from .app import create_app
 from .config import CLIENT_ID_DEFAULT
 from .limits import RateLimitWindow, compute_reset_at, load_rate_limit_snapshot
 from .oauth import OAuthHTTPServer, OAuthHandler, REQUIRED_PORT, URL_BASE
+from .stub import create_stub_app, load_recording, synthetic_events
 from .utils import eprint, get_home_dir, load_chatgpt_tokens, parse_jwt_claims, read_auth_file
 
 
@@ -270,6 +271,13 @@ def cmd_serve(
     debug_model: str | None,
     expose_reasoning_models: bool,
     default_web_search: bool,
+    uds: str | None = None,
+    session_store: str | None = None,
+    session_ttl: float | None = None,
+    tool_rejection_ttl: float | None = None,
+    keepalive_seconds: float = 15.0,
+    server_timing: bool = False,
+    upstream_base_url: str | None = None,
 ) -> int:
     app = create_app(
         verbose=verbose,
@@ -280,8 +288,48 @@ def cmd_serve(
         debug_model=debug_model,
         expose_reasoning_models=expose_reasoning_models,
         default_web_search=default_web_search,
+        session_store=session_store,
+        session_ttl=session_ttl,
+        tool_rejection_ttl=tool_rejection_ttl,
+        keepalive_seconds=keepalive_seconds,
+        server_timing=server_timing,
+        upstream_base_url=upstream_base_url,
     )
 
+    if uds:
+        # werkzeug binds an AF_UNIX socket for "unix://" hosts; a stale socket from a previous run would make bind fail
+        try:
+            os.unlink(uds)
+        except FileNotFoundError:
+            pass
+        host = f"unix://{uds}"
+    app.run(host=host, debug=False, use_reloader=False, port=port, threaded=True)
+    return 0
+
+
+def cmd_stub(
+    host: str,
+    port: int,
+    recording: str | None,
+    tokens: int,
+    tokens_per_second: float,
+    first_token_delay: float,
+    error_rate: float,
+    seed: int | None,
+) -> int:
+    try:
+        events = load_recording(recording) if recording else synthetic_events(tokens)
+    except (OSError, ValueError) as e:
+        eprint(f"ERROR: {e}")
+        return 1
+    app = create_stub_app(
+        events,
+        tokens_per_second=tokens_per_second,
+        first_token_delay=first_token_delay,
+        error_rate=error_rate,
+        seed=seed,
+    )
+    eprint(f"Stub Responses upstream on http://{host}:{port} (serve with --upstream-base-url http://{host}:{port})")
     app.run(host=host, debug=False, use_reloader=False, port=port, threaded=True)
     return 0
 
@@ -297,6 +345,11 @@ def main() -> None:
     p_serve = sub.add_parser("serve", help="Run local OpenAI-compatible server")
     p_serve.add_argument("--host", default="127.0.0.1")
     p_serve.add_argument("--port", type=int, default=8000)
+    p_serve.add_argument(
+        "--uds",
+        default=os.getenv("CHATGPT_LOCAL_UDS") or None,
+        help="Listen on this Unix domain socket path instead of --host/--port (also CHATGPT_LOCAL_UDS)",
+    )
     p_serve.add_argument("--verbose", action="store_true", help="Enable verbose logging")
     p_serve.add_argument(
         "--verbose-obfuscation",
@@ -349,6 +402,86 @@ def main() -> None:
         ),
     )
 
+    p_serve.add_argument(
+        "--session-store",
+        default=os.getenv("CHATGPT_LOCAL_SESSION_STORE") or None,
+        help=(
+            "SQLite file that keeps prompt_cache_key mappings across restarts and shares them between workers "
+            "(also CHATGPT_LOCAL_SESSION_STORE). In-memory only when unset."
+        ),
+    )
+    p_serve.add_argument(
+        "--session-ttl",
+        type=float,
+        default=float(os.getenv("CHATGPT_LOCAL_SESSION_TTL") or 24 * 3600),
+        help="Seconds an idle conversation keeps its prompt_cache_key (default: 86400)",
+    )
+    p_serve.add_argument(
+        "--tool-rejection-ttl",
+        type=float,
+        default=float(os.getenv("CHATGPT_LOCAL_TOOL_REJECTION_TTL") or 3600),
+        help=(
+            "Seconds to keep sending requests without responses_tools that upstream rejected for a model "
+            "before trying them again (default: 3600)"
+        ),
+    )
+    p_serve.add_argument(
+        "--keepalive-interval",
+        type=float,
+        default=float(os.getenv("CHATGPT_LOCAL_KEEPALIVE_SECONDS") or 15),
+        help=(
+            "Write an SSE comment to streaming clients after this many idle seconds, e.g. during long reasoning "
+            "(default: 15, 0 disables)"
+        ),
+    )
+    p_serve.add_argument(
+        "--server-timing",
+        action="store_true",
+        default=(os.getenv("CHATGPT_LOCAL_SERVER_TIMING") or "").strip().lower() in ("1", "true", "yes", "on"),
+        help=(
+            "Record per-stage timings (parse, convert, auth, encode, upstream connect/TTFB/read, translate) and return "
+            "them in a Server-Timing header, or a trailing SSE comment on streams; also exported on /metrics"
+        ),
+    )
+
+    p_serve.add_argument(
+        "--upstream-base-url",
+        default=None,
+        help=(
+            "Base URL of the ChatGPT Codex backend; requests go to <base>/responses "
+            "(default: https://chatgpt.com/backend-api/codex, also CHATGPT_LOCAL_UPSTREAM_BASE_URL)"
+        ),
+    )
+
+    p_stub = sub.add_parser("stub", help="Run a local stand-in for the ChatGPT Responses endpoint, for load tests")
+    p_stub.add_argument("--host", default="127.0.0.1")
+    p_stub.add_argument("--port", type=int, default=8100)
+    p_stub.add_argument(
+        "--recording",
+        default=None,
+        help="Replay the 'data: ' events of this recorded Responses SSE stream instead of a synthetic answer",
+    )
+    p_stub.add_argument("--tokens", type=int, default=200, help="Output deltas in the synthetic answer (default: 200)")
+    p_stub.add_argument(
+        "--tokens-per-second",
+        type=float,
+        default=0.0,
+        help="Pace delta events at this rate (default: 0, as fast as possible)",
+    )
+    p_stub.add_argument(
+        "--first-token-delay",
+        type=float,
+        default=0.0,
+        help="Seconds to wait before the first event, to simulate upstream TTFB (default: 0)",
+    )
+    p_stub.add_argument(
+        "--error-rate",
+        type=float,
+        default=0.0,
+        help="Fraction of requests answered with HTTP 500 (default: 0)",
+    )
+    p_stub.add_argument("--seed", type=int, default=None, help="Seed for the error injection")
+
     p_info = sub.add_parser("info", help="Print current stored tokens and derived account id")
     p_info.add_argument("--json", action="store_true", help="Output raw auth.json contents")
 
@@ -369,6 +502,26 @@ def main() -> None:
                 debug_model=args.debug_model,
                 expose_reasoning_models=args.expose_reasoning_models,
                 default_web_search=args.enable_web_search,
+                uds=args.uds,
+                session_store=args.session_store,
+                session_ttl=args.session_ttl,
+                tool_rejection_ttl=args.tool_rejection_ttl,
+                keepalive_seconds=args.keepalive_interval,
+                server_timing=args.server_timing,
+                upstream_base_url=args.upstream_base_url,
+            )
+        )
+    elif args.command == "stub":
+        sys.exit(
+            cmd_stub(
+                host=args.host,
+                port=args.port,
+                recording=args.recording,
+                tokens=args.tokens,
+                tokens_per_second=args.tokens_per_second,
+                first_token_delay=args.first_token_delay,
+                error_rate=args.error_rate,
+                seed=args.seed,
             )
         )
     elif args.command == "info":
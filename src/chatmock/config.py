@@ -9,7 +9,9 @@ CLIENT_ID_DEFAULT = os.getenv("CHATGPT_LOCAL_CLIENT_ID") or "app_EMoamEEZ73f0CkX
 OAUTH_ISSUER_DEFAULT = os.getenv("CHATGPT_LOCAL_ISSUER") or "https://auth.openai.com"
 OAUTH_TOKEN_URL = f"{OAUTH_ISSUER_DEFAULT}/oauth/token"
 
-CHATGPT_RESPONSES_URL = "https://chatgpt.com/backend-api/codex/responses"
+# Point at a local stub (`chatmock stub`) to exercise the proxy without ChatGPT credentials
+CHATGPT_UPSTREAM_BASE_URL = (os.getenv("CHATGPT_LOCAL_UPSTREAM_BASE_URL") or "https://chatgpt.com/backend-api/codex").rstrip("/")
+CHATGPT_RESPONSES_URL = f"{CHATGPT_UPSTREAM_BASE_URL}/responses"
 
 
 def _read_prompt_text(filename: str) -> str | None:
@@ -0,0 +1,165 @@
+from __future__ import annotations
+
+import json
+import time
+from typing import Any, Callable, Dict, Iterator, List
+
+
+def extract_usage(evt: Dict[str, Any]) -> Dict[str, int] | None:
+    """
+    Chat Completions style usage from a Responses event carrying `response.usage`, if any.
+    """
+    try:
+        usage = (evt.get("response") or {}).get("usage")
+        if not isinstance(usage, dict):
+            return None
+        pt = int(usage.get("input_tokens") or 0)
+        ct = int(usage.get("output_tokens") or 0)
+        tt = int(usage.get("total_tokens") or (pt + ct))
+        return {"prompt_tokens": pt, "completion_tokens": ct, "total_tokens": tt}
+    except Exception:
+        return None
+
+
+# Event types that carry generated output, as opposed to lifecycle events such as response.created
+OUTPUT_EVENTS = frozenset(
+    (
+        "response.output_text.delta",
+        "response.reasoning_summary_text.delta",
+        "response.reasoning_text.delta",
+        "response.output_item.done",
+    )
+)
+
+
+class EventStream:
+    """
+    Iterates the JSON events of an upstream Responses SSE stream. Iteration ends at `data: [DONE]` (recorded in
+    `done`) or when the upstream body ends; closing the upstream response is left to the caller.
+    """
+
+    def __init__(self, upstream, vlog: Callable[[str], Any] | None = None) -> None:
+        self.upstream = upstream
+        self.vlog = vlog
+        self.done = False
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        vlog = self.vlog
+        for raw in self.upstream.iter_lines(decode_unicode=False):
+            if not raw:
+                continue
+            line = raw.decode("utf-8", errors="ignore") if isinstance(raw, (bytes, bytearray)) else raw
+            if vlog is not None:
+                vlog(line)
+            if not line.startswith("data: "):
+                continue
+            data = line[len("data: "):].strip()
+            if not data:
+                continue
+            if data == "[DONE]":
+                self.done = True
+                return
+            try:
+                evt = json.loads(data)
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                continue
+            if isinstance(evt, dict):
+                yield evt
+
+
+class ResponseAggregate:
+    """
+    State of one Responses stream: response id, usage, completion or failure and when output started.
+
+    The non-streaming endpoints also collect the output (``collect=True``): deltas go into lists that are joined
+    once, so the cost stays linear in the output size however long the reasoning trace gets. The streaming
+    translators feed every event through one with ``collect=False`` and only format the deltas themselves.
+    """
+
+    def __init__(self, response_id: str, collect: bool = True) -> None:
+        self.response_id = response_id
+        self.collect = collect
+        self.text_parts: List[str] = []
+        self.reasoning_summary_parts: List[str] = []
+        self.reasoning_full_parts: List[str] = []
+        self.tool_calls: List[Dict[str, Any]] = []
+        self.usage: Dict[str, int] | None = None
+        self.error_message: str | None = None
+        self.completed = False
+        # The full response object carried by response.completed
+        self.response: Dict[str, Any] | None = None
+        # perf_counter() when the first output delta or tool call arrived
+        self.first_output_at: float | None = None
+
+    @property
+    def text(self) -> str:
+        return "".join(self.text_parts)
+
+    @property
+    def reasoning_summary(self) -> str:
+        return "".join(self.reasoning_summary_parts)
+
+    @property
+    def reasoning_full(self) -> str:
+        return "".join(self.reasoning_full_parts)
+
+    def feed(self, evt: Dict[str, Any]) -> bool:
+        """
+        Apply one event; returns False once the response is complete or has failed.
+        """
+        kind = evt.get("type")
+        if self.first_output_at is None and kind in OUTPUT_EVENTS:
+            self.first_output_at = time.perf_counter()
+        response = evt.get("response")
+        if isinstance(response, dict):
+            if isinstance(response.get("id"), str):
+                self.response_id = response.get("id") or self.response_id
+            usage = extract_usage(evt)
+            if usage:
+                self.usage = usage
+        if not self.collect and kind not in ("response.failed", "response.completed"):
+            return True
+        if kind == "response.output_text.delta":
+            self.text_parts.append(evt.get("delta") or "")
+        elif kind == "response.reasoning_summary_text.delta":
+            self.reasoning_summary_parts.append(evt.get("delta") or "")
+        elif kind == "response.reasoning_text.delta":
+            self.reasoning_full_parts.append(evt.get("delta") or "")
+        elif kind == "response.output_item.done":
+            item = evt.get("item") or {}
+            if isinstance(item, dict) and item.get("type") == "function_call":
+                call_id = item.get("call_id") or item.get("id") or ""
+                name = item.get("name") or ""
+                args = item.get("arguments") or ""
+                if isinstance(call_id, str) and isinstance(name, str) and isinstance(args, str):
+                    self.tool_calls.append(
+                        {
+                            "id": call_id,
+                            "type": "function",
+                            "function": {"name": name, "arguments": args},
+                        }
+                    )
+        elif kind == "response.failed":
+            error = response.get("error") if isinstance(response, dict) else None
+            self.error_message = (error.get("message") if isinstance(error, dict) else None) or "response.failed"
+            return False
+        elif kind == "response.completed":
+            self.completed = True
+            self.response = response if isinstance(response, dict) else None
+            return False
+        return True
+
+
+def aggregate_response(upstream, response_id: str) -> ResponseAggregate:
+    """
+    Consume an upstream Responses stream into a ResponseAggregate, stopping at `response.completed` or at the
+    first `response.failed`, and close the upstream response.
+    """
+    result = ResponseAggregate(response_id)
+    try:
+        for evt in EventStream(upstream):
+            if not result.feed(evt):
+                break
+    finally:
+        upstream.close()
+    return result
@@ -1,7 +1,17 @@
 from __future__ import annotations
 
+import queue
+import threading
+from typing import Callable, Iterable, Iterator
+
 from flask import Response, jsonify, request
 
+# SSE comment lines are ignored by clients but keep proxies and IDE clients from timing out an idle stream
+SSE_KEEPALIVE = b": keep-alive\n\n"
+# Headers for event streams: no proxy buffering (nginx honours X-Accel-Buffering), no caching
+SSE_HEADERS = {"Cache-Control": "no-cache", "Connection": "keep-alive", "X-Accel-Buffering": "no"}
+_END = object()
+
 
 def build_cors_headers() -> dict:
     origin = request.headers.get("Origin", "*")
@@ -22,3 +32,97 @@ def json_error(message: str, status: int = 400) -> Response:
         response.headers.setdefault(k, v)
     return response
 
+
+
+def sse_event_chunks(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """
+    Regroup raw SSE bytes so every piece ends on an event boundary (a blank line), so a heartbeat written
+    between pieces by `with_keepalive` never lands inside an event. A trailing partial event is flushed at the end.
+    """
+    buffer = bytearray()
+    for chunk in chunks:
+        if not chunk:
+            continue
+        # Earlier bytes hold no boundary (they would have been flushed); only look where a new one can start
+        scan_from = max(0, len(buffer) - 3)
+        buffer += chunk
+        lf = buffer.rfind(b"\n\n", scan_from)
+        crlf = buffer.rfind(b"\r\n\r\n", scan_from)
+        end = max(lf + 2 if lf >= 0 else 0, crlf + 4 if crlf >= 0 else 0)
+        if end:
+            yield bytes(buffer[:end])
+            del buffer[:end]
+    if buffer:
+        yield bytes(buffer)
+
+
+def with_keepalive(
+    chunks: Iterable[bytes],
+    interval: float,
+    heartbeat: bytes = SSE_KEEPALIVE,
+    on_abort: Callable[[], object] | None = None,
+) -> Iterator[bytes]:
+    """
+    Relay `chunks`, writing `heartbeat` whenever nothing has been sent for `interval` seconds, e.g. while upstream
+    is reasoning and the translator has nothing to emit. An empty chunk goes first so the server flushes the
+    response headers right away. The source is read on a helper thread; `on_abort` (typically closing the
+    upstream response) unblocks it when the client goes away mid-stream.
+    """
+    if not interval or interval <= 0:
+        yield b""
+        yield from chunks
+        return
+
+    pending: "queue.Queue[object]" = queue.Queue(maxsize=64)
+    stop = threading.Event()
+
+    def _pump() -> None:
+        source = iter(chunks)
+        try:
+            for chunk in source:
+                if stop.is_set():
+                    return
+                pending.put(chunk)
+            pending.put(_END)
+        except BaseException as exc:
+            if not stop.is_set():
+                pending.put(exc)
+        finally:
+            close = getattr(source, "close", None)
+            if callable(close):
+                try:
+                    close()
+                except Exception:
+                    pass
+
+    threading.Thread(target=_pump, name="sse-keepalive", daemon=True).start()
+    finished = False
+    try:
+        yield b""
+        while True:
+            try:
+                item = pending.get(timeout=interval)
+            except queue.Empty:
+                yield heartbeat
+                continue
+            if item is _END:
+                finished = True
+                return
+            if isinstance(item, BaseException):
+                finished = True
+                raise item
+            yield item
+    finally:
+        if not finished:
+            stop.set()
+            # Let a pump blocked on a full queue see the stop flag
+            while True:
+                try:
+                    pending.get_nowait()
+                except queue.Empty:
+                    break
+            if on_abort is not None:
+                try:
+                    on_abort()
+                except Exception:
+                    pass
@@ -0,0 +1,252 @@
+from __future__ import annotations
+
+import bisect
+import threading
+from typing import Dict, Iterable, List, Tuple
+
+
+# Latency buckets (seconds) cover fast local calls up to multi-minute reasoning runs
+LATENCY_BUCKETS: Tuple[float, ...] = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0,
+)
+# Per-stage buckets reach down to 100us: conversion and encoding stages are typically sub-millisecond
+STAGE_BUCKETS: Tuple[float, ...] = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)
+TOKEN_BUCKETS: Tuple[float, ...] = (16, 64, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768, 65536)
+
+# Client-controlled label values (model names) are capped so a misbehaving client can't grow memory unbounded
+_MAX_SERIES_PER_METRIC = 512
+_OVERFLOW_LABEL = "other"
+
+_LOCK = threading.Lock()
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == int(value):
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.label_names: Tuple[str, ...] = tuple(labels)
+
+    def _key(self, labels: Dict[str, str], series: dict) -> Tuple[str, ...]:
+        key = tuple(str(labels.get(n, "") or "") for n in self.label_names)
+        if key not in series and len(series) >= _MAX_SERIES_PER_METRIC:
+            key = tuple(_OVERFLOW_LABEL for _ in self.label_names)
+        return key
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: Iterable[str] = ()):
+        super().__init__(name, help_text, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        with _LOCK:
+            key = self._key(labels, self._values)
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        with _LOCK:
+            items = list(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}")
+        return lines
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1.0, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels: str) -> None:
+        with _LOCK:
+            key = self._key(labels, self._values)
+            self._values[key] = value
+
+    def set_max(self, value: float, **labels: str) -> None:
+        with _LOCK:
+            key = self._key(labels, self._values)
+            if value > self._values.get(key, 0.0):
+                self._values[key] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: Iterable[str] = (), buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+        # per series: [count per bucket..., +Inf count], sum
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        idx = bisect.bisect_left(self.buckets, value)
+        with _LOCK:
+            key = self._key(labels, self._series)
+            row = self._series.get(key)
+            if row is None:
+                row = [0.0] * (len(self.buckets) + 2)
+                self._series[key] = row
+            row[idx] += 1
+            row[-1] += value
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        with _LOCK:
+            items = [(k, list(v)) for k, v in self._series.items()]
+        for key, row in items:
+            cumulative = 0.0
+            for bound, count in zip(self.buckets, row):
+                cumulative += count
+                le = 'le="%s"' % _format_value(bound)
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, le)} {_format_value(cumulative)}")
+            cumulative += row[len(self.buckets)]
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, le)} {_format_value(cumulative)}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, key)} {repr(float(row[-1]))}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, key)} {_format_value(cumulative)}")
+        return lines
+
+
+_REGISTRY: List[_Metric] = []
+
+
+def _register(metric: _Metric):
+    _REGISTRY.append(metric)
+    return metric
+
+
+REQUESTS = _register(Counter("chatmock_requests_total", "Requests handled, by route and response status.", ("route", "model", "status")))
+INFLIGHT = _register(Gauge("chatmock_inflight_requests", "Requests currently being handled or streamed.", ("route",)))
+TTFB = _register(Histogram("chatmock_ttfb_seconds", "Time from request arrival to the first response byte.", ("route", "model")))
+LATENCY = _register(Histogram("chatmock_request_duration_seconds", "Time from request arrival to the last response byte.", ("route", "model")))
+QUEUE_WAIT = _register(
+    Histogram("chatmock_queue_wait_seconds", "Time from request arrival until the upstream request is dispatched.", ("route", "model"))
+)
+STREAM_DURATION = _register(Histogram("chatmock_stream_duration_seconds", "Duration of streamed responses.", ("route", "model")))
+STREAM_BYTES = _register(Counter("chatmock_stream_bytes_total", "Bytes written to clients on streamed responses.", ("route", "model")))
+TOKENS_OUT = _register(
+    Histogram("chatmock_output_tokens", "Output tokens per completion, as reported by upstream usage.", ("route", "model"), TOKEN_BUCKETS)
+)
+UPSTREAM_STATUS = _register(Counter("chatmock_upstream_responses_total", "Upstream ChatGPT responses by status code.", ("model", "status")))
+SESSION_LOOKUPS = _register(
+    Counter(
+        "chatmock_session_lookups_total",
+        "prompt_cache_key lookups by result (hit, store_hit, expired, miss, client-supplied).",
+        ("result",),
+    )
+)
+SESSION_ENTRIES = _register(Gauge("chatmock_session_entries", "Fingerprints held in the in-memory session map."))
+SESSION_EVICTIONS = _register(Counter("chatmock_session_evictions_total", "Sessions evicted from the in-memory map by the LRU bound."))
+TOOL_CACHE_LOOKUPS = _register(
+    Counter("chatmock_tool_cache_lookups_total", "Tool list conversions served from the tool cache (hit) or converted (miss).", ("result",))
+)
+TOOL_CACHE_ENTRIES = _register(Gauge("chatmock_tool_cache_entries", "Converted tool lists held in the tool cache."))
+TOOL_REJECTIONS = _register(
+    Counter(
+        "chatmock_responses_tool_rejections_total",
+        "Passthrough responses_tools upstream rejected while accepting the request without them.",
+        ("model", "tool_type"),
+    )
+)
+TOOL_REJECTION_SKIPS = _register(
+    Counter("chatmock_responses_tool_skips_total", "Requests that skipped known-rejected responses_tools up front.", ("model",))
+)
+TOOL_REJECTIONS_LEARNED = _register(Gauge("chatmock_responses_tool_rejections_learned", "(model, tool type) rejections currently remembered."))
+MESSAGE_CONVERSIONS = _register(
+    Counter("chatmock_message_conversions_total", "Chat messages converted to Responses input, by memo cache result.", ("result",))
+)
+STAGE_SECONDS = _register(
+    Histogram(
+        "chatmock_stage_seconds",
+        "Time spent per request stage (parse, convert, auth, encode, upstream_connect, upstream_ttfb, upstream_read, "
+        "translate, total); recorded only with --server-timing.",
+        ("route", "stage"),
+        STAGE_BUCKETS,
+    )
+)
+
+
+def render() -> str:
+    lines: List[str] = []
+    for metric in _REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def observe_usage(route: str, model: str, usage: Dict[str, int] | None) -> None:
+    if not isinstance(usage, dict):
+        return
+    completion_tokens = usage.get("completion_tokens")
+    if isinstance(completion_tokens, int):
+        TOKENS_OUT.observe(completion_tokens, route=route, model=model)
+
+
+def instrument_response(resp, route: str, model: str, started: float, clock) -> None:
+    """
+    Record request metrics for a Flask response. Streamed bodies are wrapped so TTFB, duration and bytes are
+    measured when the client actually receives them; in-flight accounting ends when the body is exhausted.
+    """
+    status = str(resp.status_code)
+    if not resp.is_streamed:
+        elapsed = clock() - started
+        TTFB.observe(elapsed, route=route, model=model)
+        LATENCY.observe(elapsed, route=route, model=model)
+        REQUESTS.inc(route=route, model=model, status=status)
+        INFLIGHT.dec(route=route)
+        return
+
+    body = resp.response
+
+    def _gen():
+        first = True
+        sent = 0
+        try:
+            for chunk in body:
+                # Empty chunks only flush headers (see http.with_keepalive); TTFB is the first actual body byte
+                if first and chunk:
+                    TTFB.observe(clock() - started, route=route, model=model)
+                    first = False
+                sent += len(chunk)
+                yield chunk
+        finally:
+            elapsed = clock() - started
+            LATENCY.observe(elapsed, route=route, model=model)
+            STREAM_DURATION.observe(elapsed, route=route, model=model)
+            STREAM_BYTES.inc(sent, route=route, model=model)
+            REQUESTS.inc(route=route, model=model, status=status)
+            INFLIGHT.dec(route=route)
+            close = getattr(body, "close", None)
+            if callable(close):
+                try:
+                    close()
+                except Exception:
+                    pass
+
+    resp.response = _gen()
@@ -0,0 +1,198 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import marshal
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Tuple
+
+from . import metrics
+
+
+_LOCK = threading.Lock()
+# (conversion, digest of the raw tool list) -> PreparedTools; agents resend the same tool set on every turn
+_TOOLS: "OrderedDict[Tuple[str, bytes], PreparedTools]" = OrderedDict()
+_TOOLS_BYTES = 0
+_TOOLS_MAX_ENTRIES = 256
+_TOOLS_MAX_BYTES = 16 * 1024 * 1024
+
+
+def _encode(value: Any) -> str:
+    return json.dumps(value, separators=(",", ":"))
+
+
+def content_digest(value: Any) -> Tuple[bytes, int]:
+    """
+    Stable digest of a JSON-like value for use as a cache key, plus the size of the serialized form it covers.
+    """
+    # marshal is C-level and an order of magnitude cheaper than json.dumps here, both for tool lists (many small
+    # strings) and for messages carrying multi-MB image data URLs. Format version 2 predates object references, so
+    # equal values always serialize identically; dicts with the same items in a different order just miss.
+    data = marshal.dumps(value, 2)
+    return hashlib.sha256(data).digest(), len(data)
+
+
+@dataclass(frozen=True)
+class PreparedInstructions:
+    """
+    Instructions with everything derived from them computed once: the stripped-text digest used for the
+    prompt-cache fingerprint and the JSON-encoded value spliced into outbound payloads.
+    """
+
+    text: str
+    digest: str
+    encoded: str
+
+
+@lru_cache(maxsize=16)
+def prepare_instructions(text: str | None) -> PreparedInstructions | None:
+    if not isinstance(text, str):
+        return None
+    stripped = text.strip()
+    digest = hashlib.sha256(stripped.encode("utf-8")).hexdigest() if stripped else ""
+    return PreparedInstructions(text=text, digest=digest, encoded=_encode(text))
+
+
+def as_prepared(instructions: "str | PreparedInstructions | None") -> PreparedInstructions | None:
+    if isinstance(instructions, PreparedInstructions) or instructions is None:
+        return instructions
+    return prepare_instructions(instructions)
+
+
+@dataclass(frozen=True)
+class PreparedTools:
+    """
+    A converted Responses tool list with its compact JSON encoding, and the size the responses_tools limit is
+    checked against (the default json.dumps encoding, as before caching).
+    """
+
+    tools: Tuple[Dict[str, Any], ...]
+    encoded: str
+    size: int
+
+
+EMPTY_TOOLS = PreparedTools(tools=(), encoded="[]", size=2)
+
+
+def prepare_tools(raw: Any, convert: Callable[[Any], List[Dict[str, Any]]], kind: str) -> PreparedTools:
+    """
+    Convert a request's tool list with `convert`, reusing the result of an earlier request that sent the same
+    tools. `kind` names the conversion so different converters never share entries.
+    """
+    global _TOOLS_BYTES
+    if not raw:
+        return EMPTY_TOOLS
+    key = (kind, content_digest(raw)[0])
+    with _LOCK:
+        cached = _TOOLS.get(key)
+        if cached is not None:
+            _TOOLS.move_to_end(key)
+    if cached is not None:
+        metrics.TOOL_CACHE_LOOKUPS.inc(result="hit")
+        return cached
+
+    metrics.TOOL_CACHE_LOOKUPS.inc(result="miss")
+    tools = convert(raw)
+    prepared = PreparedTools(tools=tuple(tools), encoded=_encode(tools), size=len(json.dumps(tools)))
+    if len(prepared.encoded) > _TOOLS_MAX_BYTES // 4:
+        return prepared
+    with _LOCK:
+        if key not in _TOOLS:
+            _TOOLS[key] = prepared
+            _TOOLS_BYTES += len(prepared.encoded)
+        while len(_TOOLS) > _TOOLS_MAX_ENTRIES or _TOOLS_BYTES > _TOOLS_MAX_BYTES:
+            _, evicted = _TOOLS.popitem(last=False)
+            _TOOLS_BYTES -= len(evicted.encoded)
+        metrics.TOOL_CACHE_ENTRIES.set(len(_TOOLS))
+    return prepared
+
+
+def concat_tools(first: PreparedTools, second: PreparedTools) -> PreparedTools:
+    if not second.tools:
+        return first
+    if not first.tools:
+        return second
+    return PreparedTools(
+        tools=first.tools + second.tools,
+        encoded=first.encoded[:-1] + "," + second.encoded[1:],
+        size=first.size + second.size,
+    )
+
+
+def as_prepared_tools(tools: "List[Dict[str, Any]] | PreparedTools | None") -> PreparedTools:
+    if isinstance(tools, PreparedTools):
+        return tools
+    if not tools:
+        return EMPTY_TOOLS
+    return PreparedTools(tools=tuple(tools), encoded=_encode(tools), size=len(json.dumps(tools)))
+
+
+def build_responses_body(
+    model: str,
+    instructions: PreparedInstructions | None,
+    input_items: List[Dict[str, Any]],
+    tools_encoded: str,
+    tool_choice: Any,
+    parallel_tool_calls: bool,
+    session_id: str,
+    include: List[str] | None = None,
+    reasoning_param: Dict[str, Any] | None = None,
+) -> bytes:
+    # Same fields and order as the dict previously passed to requests' json=, but the instructions (and tools,
+    # when the caller has them cached) are spliced in pre-encoded instead of being re-serialized per request
+    parts = [
+        '{"model":',
+        _encode(model),
+        ',"instructions":',
+        instructions.encoded if instructions is not None else "null",
+        ',"input":',
+        _encode(input_items),
+        ',"tools":',
+        tools_encoded,
+        ',"tool_choice":',
+        _encode(tool_choice),
+        ',"parallel_tool_calls":',
+        "true" if parallel_tool_calls else "false",
+        ',"store":false,"stream":true,"prompt_cache_key":',
+        _encode(session_id),
+    ]
+    if include:
+        parts.append(',"include":')
+        parts.append(_encode(include))
+    if reasoning_param is not None:
+        parts.append(',"reasoning":')
+        parts.append(_encode(reasoning_param))
+    parts.append("}")
+    return "".join(parts).encode("utf-8")
+
+
+# Fields the passthrough route sets itself; everything else in a client's Responses request is forwarded as sent
+PASSTHROUGH_RESERVED = ("model", "instructions", "input", "store", "stream", "prompt_cache_key")
+
+
+def build_passthrough_body(
+    model: str,
+    instructions: PreparedInstructions | None,
+    input_items: List[Dict[str, Any]],
+    fields: Dict[str, Any],
+    session_id: str,
+) -> bytes:
+    extra = {k: v for k, v in fields.items() if k not in PASSTHROUGH_RESERVED}
+    parts = [
+        '{"model":',
+        _encode(model),
+        ',"instructions":',
+        instructions.encoded if instructions is not None else "null",
+        ',"input":',
+        _encode(input_items),
+    ]
+    if extra:
+        parts.append(",")
+        parts.append(_encode(extra)[1:-1])
+    parts.append(',"store":false,"stream":true,"prompt_cache_key":')
+    parts.append(_encode(session_id))
+    parts.append("}")
+    return "".join(parts).encode("utf-8")
@@ -5,12 +5,16 @@ import datetime
 import time
 from typing import Any, Dict, List
 
-from flask import Blueprint, Response, current_app, jsonify, make_response, request, stream_with_context
+from flask import Blueprint, Response, current_app, g, jsonify, make_response, request, stream_with_context
 
+from . import metrics, timing
 from .config import BASE_INSTRUCTIONS, GPT5_CODEX_INSTRUCTIONS
+from .events import EventStream, ResponseAggregate, aggregate_response
 from .limits import record_rate_limits_from_response
 from .http import build_cors_headers
+from .payload import PreparedInstructions, as_prepared, concat_tools, prepare_tools
 from .reasoning import build_reasoning_param, extract_reasoning_from_model_name
+from .tool_rejections import record_rejection, split_rejected
 from .transform import convert_ollama_messages, normalize_ollama_tools
 from .upstream import normalize_model_name, start_upstream_request
 from .utils import convert_chat_messages_to_responses_input, convert_tools_chat_to_responses
@@ -65,23 +69,45 @@ def ollama_version() -> Response:
     return resp
 
 
-def _instructions_for_model(model: str) -> str:
-    base = current_app.config.get("BASE_INSTRUCTIONS", BASE_INSTRUCTIONS)
+def _instructions_for_model(model: str) -> PreparedInstructions | None:
+    base = current_app.config.get("PREPARED_BASE_INSTRUCTIONS") or as_prepared(BASE_INSTRUCTIONS)
     if model == "gpt-5-codex" or model == "gpt-5.1-codex":
-        codex = current_app.config.get("GPT5_CODEX_INSTRUCTIONS") or GPT5_CODEX_INSTRUCTIONS
-        if isinstance(codex, str) and codex.strip():
+        codex = current_app.config.get("PREPARED_CODEX_INSTRUCTIONS") or as_prepared(GPT5_CODEX_INSTRUCTIONS)
+        if codex is not None and codex.digest:
             return codex
     return base
 
 
-_OLLAMA_FAKE_EVAL = {
-    "total_duration": 8497226791,
-    "load_duration": 1747193958,
-    "prompt_eval_count": 24,
-    "prompt_eval_duration": 269219750,
-    "eval_count": 247,
-    "eval_duration": 6413802458,
-}
+def _convert_ollama_tools(tools: Any) -> List[Dict[str, Any]]:
+    return convert_tools_chat_to_responses(normalize_ollama_tools(tools))
+
+
+def _ns(seconds: float) -> int:
+    return max(0, int(seconds * 1_000_000_000))
+
+
+def _eval_stats(
+    started: float,
+    connected: float,
+    first_output: float | None,
+    finished: float,
+    usage: Dict[str, int] | None,
+) -> Dict[str, int]:
+    """
+    Ollama's timing fields from measured perf_counter() marks: load is request arrival to upstream headers,
+    prompt eval is upstream time to the first output event, eval is generation up to completion. Token counts
+    come from upstream usage and are 0 when upstream reported none, since Ollama clients expect both fields.
+    """
+    first = first_output if first_output is not None else finished
+    usage = usage or {}
+    return {
+        "total_duration": _ns(finished - started),
+        "load_duration": _ns(connected - started),
+        "prompt_eval_count": int(usage.get("prompt_tokens") or 0),
+        "prompt_eval_duration": _ns(first - connected),
+        "eval_count": int(usage.get("completion_tokens") or 0),
+        "eval_duration": _ns(finished - first),
+    }
 
 
 @ollama_bp.route("/api/tags", methods=["GET"])
@@ -200,6 +226,7 @@ def ollama_chat() -> Response:
         if verbose:
             _log_json("OUT POST /api/chat", err)
         return jsonify(err), 400
+    timing.lap("parse")
 
     model = payload.get("model")
     raw_messages = payload.get("messages")
@@ -217,7 +244,7 @@ def ollama_chat() -> Response:
         stream_req = True
     stream_req = bool(stream_req)
     tools_req = payload.get("tools") if isinstance(payload.get("tools"), list) else []
-    tools_responses = convert_tools_chat_to_responses(normalize_ollama_tools(tools_req))
+    tools_responses = prepare_tools(tools_req, _convert_ollama_tools, "ollama")
     tool_choice = payload.get("tool_choice", "auto")
     parallel_tool_calls = bool(payload.get("parallel_tool_calls", False))
 
@@ -240,19 +267,22 @@ def ollama_chat() -> Response:
             if not (isinstance(rtc, str) and rtc == "none"):
                 extra_tools = [{"type": "web_search"}]
         if extra_tools:
-            import json as _json
             MAX_TOOLS_BYTES = 32768
-            try:
-                size = len(_json.dumps(extra_tools))
-            except Exception:
-                size = 0
-            if size > MAX_TOOLS_BYTES:
+            extras = prepare_tools(extra_tools, list, "responses")
+            if extras.size > MAX_TOOLS_BYTES:
                 err = {"error": "responses_tools too large"}
                 if verbose:
                     _log_json("OUT POST /api/chat", err)
                 return jsonify(err), 400
-            had_responses_tools = True
-            tools_responses = (tools_responses or []) + extra_tools
+            # Skip straight to the configuration upstream accepted last time instead of paying for a rejected attempt
+            extra_tools, skipped_tools = split_rejected(normalize_model_name(model), extra_tools)
+            if skipped_tools:
+                if verbose:
+                    print("[Passthrough] Skipping responses_tools upstream recently rejected for", model)
+                extras = prepare_tools(extra_tools, list, "responses")
+            if extra_tools:
+                had_responses_tools = True
+                tools_responses = concat_tools(tools_responses, extras)
 
     rtc = payload.get("responses_tool_choice")
     if isinstance(rtc, str) and rtc in ("auto", "none"):
@@ -290,6 +320,7 @@ def ollama_chat() -> Response:
             except Exception:
                 pass
         return error_resp
+    connected = time.perf_counter()
 
     record_rate_limits_from_response(upstream)
 
@@ -301,7 +332,7 @@ def ollama_chat() -> Response:
         if had_responses_tools:
             if verbose:
                 print("[Passthrough] Upstream rejected tools; retrying without extras (args redacted)")
-            base_tools_only = convert_tools_chat_to_responses(normalize_ollama_tools(tools_req))
+            base_tools_only = prepare_tools(tools_req, _convert_ollama_tools, "ollama")
             safe_choice = payload.get("tool_choice", "auto")
             upstream2, err2 = start_upstream_request(
                 normalize_model_name(model),
@@ -314,7 +345,9 @@ def ollama_chat() -> Response:
             )
             record_rate_limits_from_response(upstream2)
             if err2 is None and upstream2 is not None and upstream2.status_code < 400:
+                record_rejection(normalize_model_name(model), extra_tools, upstream.status_code)
                 upstream = upstream2
+                connected = time.perf_counter()
             else:
                 err = {"error": {"message": (err_body.get("error", {}) or {}).get("message", "Upstream error"), "code": "RESPONSES_TOOLS_REJECTED"}}
                 if verbose:
@@ -330,6 +363,7 @@ def ollama_chat() -> Response:
 
     created_at = datetime.datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
     model_out = model if isinstance(model, str) and model.strip() else normalized_model
+    started, metrics_route, metrics_model = g.metrics_start, g.metrics_route, g.metrics_model
 
     if stream_req:
         def _gen():
@@ -339,23 +373,11 @@ def ollama_chat() -> Response:
             saw_any_summary = False
             pending_summary_paragraph = False
             full_parts: List[str] = []
+            state = ResponseAggregate("", collect=False)
             try:
-                for raw_line in upstream.iter_lines(decode_unicode=False):
-                    if not raw_line:
-                        continue
-                    line = raw_line.decode("utf-8", errors="ignore") if isinstance(raw_line, (bytes, bytearray)) else raw_line
-                    if not line.startswith("data: "):
-                        continue
-                    data = line[len("data: "):].strip()
-                    if not data:
-                        continue
-                    if data == "[DONE]":
-                        break
-                    try:
-                        evt = json.loads(data)
-                    except Exception:
-                        continue
+                for evt in EventStream(upstream):
                     kind = evt.get("type")
+                    state.feed(evt)
                     if kind == "response.reasoning_summary_part.added":
                         if compat in ("think-tags", "o3"):
                             if saw_any_summary:
@@ -490,7 +512,8 @@ def ollama_chat() -> Response:
                     "message": {"role": "assistant", "content": ""},
                     "done": True,
                 }
-                done_obj.update(_OLLAMA_FAKE_EVAL)
+                done_obj.update(_eval_stats(started, connected, state.first_output_at, time.perf_counter(), state.usage))
+                metrics.observe_usage(metrics_route, metrics_model, state.usage)
                 yield json.dumps(done_obj) + "\n"
         if verbose:
             print("OUT POST /api/chat (streaming response)")
@@ -505,52 +528,20 @@ def ollama_chat() -> Response:
             resp.headers.setdefault(k, v)
         return resp
 
-    full_text = ""
-    reasoning_summary_text = ""
-    reasoning_full_text = ""
-    tool_calls: List[Dict[str, Any]] = []
-    try:
-        for raw in upstream.iter_lines(decode_unicode=False):
-            if not raw:
-                continue
-            line = raw.decode("utf-8", errors="ignore") if isinstance(raw, (bytes, bytearray)) else raw
-            if not line.startswith("data: "):
-                continue
-            data = line[len("data: "):].strip()
-            if not data:
-                continue
-            if data == "[DONE]":
-                break
-            try:
-                evt = json.loads(data)
-            except Exception:
-                continue
-            kind = evt.get("type")
-            if kind == "response.output_text.delta":
-                full_text += evt.get("delta") or ""
-            elif kind == "response.reasoning_summary_text.delta":
-                reasoning_summary_text += evt.get("delta") or ""
-            elif kind == "response.reasoning_text.delta":
-                reasoning_full_text += evt.get("delta") or ""
-            elif kind == "response.output_item.done":
-                item = evt.get("item") or {}
-                if isinstance(item, dict) and item.get("type") == "function_call":
-                    call_id = item.get("call_id") or item.get("id") or ""
-                    name = item.get("name") or ""
-                    args = item.get("arguments") or ""
-                    if isinstance(call_id, str) and isinstance(name, str) and isinstance(args, str):
-                        tool_calls.append(
-                            {
-                                "id": call_id,
-                                "type": "function",
-                                "function": {"name": name, "arguments": args},
-                            }
-                        )
-            elif kind == "response.completed":
-                break
-    finally:
-        upstream.close()
+    result = aggregate_response(upstream, "")
+    if result.error_message:
+        err = {"error": result.error_message}
+        if verbose:
+            _log_json("OUT POST /api/chat", err)
+        resp = make_response(jsonify(err), 502)
+        for k, v in build_cors_headers().items():
+            resp.headers.setdefault(k, v)
+        return resp
 
+    full_text = result.text
+    reasoning_summary_text = result.reasoning_summary
+    reasoning_full_text = result.reasoning_full
+    tool_calls = result.tool_calls
     if (current_app.config.get("REASONING_COMPAT", "think-tags") or "think-tags").strip().lower() == "think-tags":
         rtxt_parts = []
         if isinstance(reasoning_summary_text, str) and reasoning_summary_text.strip():
@@ -568,7 +559,8 @@ def ollama_chat() -> Response:
         "done": True,
         "done_reason": "stop",
     }
-    out_json.update(_OLLAMA_FAKE_EVAL)
+    out_json.update(_eval_stats(started, connected, result.first_output_at, time.perf_counter(), result.usage))
+    metrics.observe_usage(metrics_route, metrics_model, result.usage)
     if verbose:
         _log_json("OUT POST /api/chat", out_json)
     resp = make_response(jsonify(out_json), 200)
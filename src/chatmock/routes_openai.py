@@ -2,15 +2,20 @@ from __future__ import annotations
 
 import json
 import time
+from functools import partial
 from typing import Any, Dict, List
 
-from flask import Blueprint, Response, current_app, jsonify, make_response, request
+from flask import Blueprint, Response, current_app, g, jsonify, make_response, request
 
+from . import metrics, timing
 from .config import BASE_INSTRUCTIONS, GPT5_CODEX_INSTRUCTIONS
+from .events import aggregate_response
 from .limits import record_rate_limits_from_response
-from .http import build_cors_headers
+from .http import SSE_HEADERS, build_cors_headers, sse_event_chunks, with_keepalive
+from .payload import PreparedInstructions, as_prepared, concat_tools, prepare_tools
 from .reasoning import apply_reasoning_to_message, build_reasoning_param, extract_reasoning_from_model_name
-from .upstream import normalize_model_name, start_upstream_request
+from .tool_rejections import record_rejection, split_rejected
+from .upstream import normalize_model_name, start_passthrough_request, start_upstream_request
 from .utils import (
     convert_chat_messages_to_responses_input,
     convert_tools_chat_to_responses,
@@ -52,11 +57,11 @@ def _wrap_stream_logging(label: str, iterator, enabled: bool):
     return _gen()
 
 
-def _instructions_for_model(model: str) -> str:
-    base = current_app.config.get("BASE_INSTRUCTIONS", BASE_INSTRUCTIONS)
+def _instructions_for_model(model: str) -> PreparedInstructions | None:
+    base = current_app.config.get("PREPARED_BASE_INSTRUCTIONS") or as_prepared(BASE_INSTRUCTIONS)
     if model == "gpt-5-codex" or model == "gpt-5.1-codex":
-        codex = current_app.config.get("GPT5_CODEX_INSTRUCTIONS") or GPT5_CODEX_INSTRUCTIONS
-        if isinstance(codex, str) and codex.strip():
+        codex = current_app.config.get("PREPARED_CODEX_INSTRUCTIONS") or as_prepared(GPT5_CODEX_INSTRUCTIONS)
+        if codex is not None and codex.digest:
             return codex
     return base
 
@@ -87,6 +92,7 @@ def chat_completions() -> Response:
                 _log_json("OUT POST /v1/chat/completions", err)
             return jsonify(err), 400
 
+    timing.lap("parse")
     requested_model = payload.get("model")
     model = normalize_model_name(requested_model, debug_model)
     messages = payload.get("messages")
@@ -112,7 +118,7 @@ def chat_completions() -> Response:
     stream_options = payload.get("stream_options") if isinstance(payload.get("stream_options"), dict) else {}
     include_usage = bool(stream_options.get("include_usage", False))
 
-    tools_responses = convert_tools_chat_to_responses(payload.get("tools"))
+    tools_responses = prepare_tools(payload.get("tools"), convert_tools_chat_to_responses, "chat")
     tool_choice = payload.get("tool_choice", "auto")
     parallel_tool_calls = bool(payload.get("parallel_tool_calls", False))
     responses_tools_payload = payload.get("responses_tools") if isinstance(payload.get("responses_tools"), list) else []
@@ -140,19 +146,22 @@ def chat_completions() -> Response:
                 extra_tools = [{"type": "web_search"}]
 
         if extra_tools:
-            import json as _json
             MAX_TOOLS_BYTES = 32768
-            try:
-                size = len(_json.dumps(extra_tools))
-            except Exception:
-                size = 0
-            if size > MAX_TOOLS_BYTES:
+            extras = prepare_tools(extra_tools, list, "responses")
+            if extras.size > MAX_TOOLS_BYTES:
                 err = {"error": {"message": "responses_tools too large", "code": "RESPONSES_TOOLS_TOO_LARGE"}}
                 if verbose:
                     _log_json("OUT POST /v1/chat/completions", err)
                 return jsonify(err), 400
-            had_responses_tools = True
-            tools_responses = (tools_responses or []) + extra_tools
+            # Skip straight to the configuration upstream accepted last time instead of paying for a rejected attempt
+            extra_tools, skipped_tools = split_rejected(model, extra_tools)
+            if skipped_tools:
+                if verbose:
+                    print("[Passthrough] Skipping responses_tools upstream recently rejected for", model)
+                extras = prepare_tools(extra_tools, list, "responses")
+            if extra_tools:
+                had_responses_tools = True
+                tools_responses = concat_tools(tools_responses, extras)
 
     responses_tool_choice = payload.get("responses_tool_choice")
     if isinstance(responses_tool_choice, str) and responses_tool_choice in ("auto", "none"):
@@ -203,7 +212,7 @@ def chat_completions() -> Response:
         if had_responses_tools:
             if verbose:
                 print("[Passthrough] Upstream rejected tools; retrying without extra tools (args redacted)")
-            base_tools_only = convert_tools_chat_to_responses(payload.get("tools"))
+            base_tools_only = prepare_tools(payload.get("tools"), convert_tools_chat_to_responses, "chat")
             safe_choice = payload.get("tool_choice", "auto")
             upstream2, err2 = start_upstream_request(
                 model,
@@ -216,6 +225,7 @@ def chat_completions() -> Response:
             )
             record_rate_limits_from_response(upstream2)
             if err2 is None and upstream2 is not None and upstream2.status_code < 400:
+                record_rejection(model, extra_tools, upstream.status_code)
                 upstream = upstream2
             else:
                 err = {
@@ -246,98 +256,35 @@ def chat_completions() -> Response:
             vlog=print if verbose_obfuscation else None,
             reasoning_compat=reasoning_compat,
             include_usage=include_usage,
+            on_usage=partial(metrics.observe_usage, g.metrics_route, g.metrics_model),
         )
         stream_iter = _wrap_stream_logging("STREAM OUT /v1/chat/completions", stream_iter, verbose)
+        stream_iter = with_keepalive(stream_iter, current_app.config.get("KEEPALIVE_SECONDS", 0), on_abort=upstream.close)
         resp = Response(
             stream_iter,
             status=upstream.status_code,
             mimetype="text/event-stream",
-            headers={"Cache-Control": "no-cache", "Connection": "keep-alive"},
+            headers=SSE_HEADERS,
         )
         for k, v in build_cors_headers().items():
             resp.headers.setdefault(k, v)
         return resp
 
-    full_text = ""
-    reasoning_summary_text = ""
-    reasoning_full_text = ""
-    response_id = "chatcmpl"
-    tool_calls: List[Dict[str, Any]] = []
-    error_message: str | None = None
-    usage_obj: Dict[str, int] | None = None
-
-    def _extract_usage(evt: Dict[str, Any]) -> Dict[str, int] | None:
-        try:
-            usage = (evt.get("response") or {}).get("usage")
-            if not isinstance(usage, dict):
-                return None
-            pt = int(usage.get("input_tokens") or 0)
-            ct = int(usage.get("output_tokens") or 0)
-            tt = int(usage.get("total_tokens") or (pt + ct))
-            return {"prompt_tokens": pt, "completion_tokens": ct, "total_tokens": tt}
-        except Exception:
-            return None
-    try:
-        for raw in upstream.iter_lines(decode_unicode=False):
-            if not raw:
-                continue
-            line = raw.decode("utf-8", errors="ignore") if isinstance(raw, (bytes, bytearray)) else raw
-            if not line.startswith("data: "):
-                continue
-            data = line[len("data: "):].strip()
-            if not data:
-                continue
-            if data == "[DONE]":
-                break
-            try:
-                evt = json.loads(data)
-            except Exception:
-                continue
-            kind = evt.get("type")
-            mu = _extract_usage(evt)
-            if mu:
-                usage_obj = mu
-            if isinstance(evt.get("response"), dict) and isinstance(evt["response"].get("id"), str):
-                response_id = evt["response"].get("id") or response_id
-            if kind == "response.output_text.delta":
-                full_text += evt.get("delta") or ""
-            elif kind == "response.reasoning_summary_text.delta":
-                reasoning_summary_text += evt.get("delta") or ""
-            elif kind == "response.reasoning_text.delta":
-                reasoning_full_text += evt.get("delta") or ""
-            elif kind == "response.output_item.done":
-                item = evt.get("item") or {}
-                if isinstance(item, dict) and item.get("type") == "function_call":
-                    call_id = item.get("call_id") or item.get("id") or ""
-                    name = item.get("name") or ""
-                    args = item.get("arguments") or ""
-                    if isinstance(call_id, str) and isinstance(name, str) and isinstance(args, str):
-                        tool_calls.append(
-                            {
-                                "id": call_id,
-                                "type": "function",
-                                "function": {"name": name, "arguments": args},
-                            }
-                        )
-            elif kind == "response.failed":
-                error_message = evt.get("response", {}).get("error", {}).get("message", "response.failed")
-            elif kind == "response.completed":
-                break
-    finally:
-        upstream.close()
-
-    if error_message:
-        resp = make_response(jsonify({"error": {"message": error_message}}), 502)
+    result = aggregate_response(upstream, "chatcmpl")
+    if result.error_message:
+        resp = make_response(jsonify({"error": {"message": result.error_message}}), 502)
         for k, v in build_cors_headers().items():
             resp.headers.setdefault(k, v)
         return resp
 
+    full_text = result.text
     message: Dict[str, Any] = {"role": "assistant", "content": full_text if full_text else None}
-    if tool_calls:
-        message["tool_calls"] = tool_calls
-    message = apply_reasoning_to_message(message, reasoning_summary_text, reasoning_full_text, reasoning_compat)
+    if result.tool_calls:
+        message["tool_calls"] = result.tool_calls
+    message = apply_reasoning_to_message(message, result.reasoning_summary, result.reasoning_full, reasoning_compat)
+    usage_obj = result.usage
     completion = {
-        "id": response_id or "chatcmpl",
+        "id": result.response_id or "chatcmpl",
         "object": "chat.completion",
         "created": created,
         "model": requested_model or model,
@@ -350,6 +297,7 @@ def chat_completions() -> Response:
         ],
         **({"usage": usage_obj} if usage_obj else {}),
     }
+    metrics.observe_usage(g.metrics_route, g.metrics_model, usage_obj)
     if verbose:
         _log_json("OUT POST /v1/chat/completions", completion)
     resp = make_response(jsonify(completion), upstream.status_code)
@@ -380,6 +328,7 @@ def completions() -> Response:
             _log_json("OUT POST /v1/completions", err)
         return jsonify(err), 400
 
+    timing.lap("parse")
     requested_model = payload.get("model")
     model = normalize_model_name(requested_model, debug_model)
     prompt = payload.get("prompt")
@@ -440,71 +389,39 @@ def completions() -> Response:
             verbose=verbose_obfuscation,
             vlog=(print if verbose_obfuscation else None),
             include_usage=include_usage,
+            on_usage=partial(metrics.observe_usage, g.metrics_route, g.metrics_model),
         )
         stream_iter = _wrap_stream_logging("STREAM OUT /v1/completions", stream_iter, verbose)
+        stream_iter = with_keepalive(stream_iter, current_app.config.get("KEEPALIVE_SECONDS", 0), on_abort=upstream.close)
         resp = Response(
             stream_iter,
             status=upstream.status_code,
             mimetype="text/event-stream",
-            headers={"Cache-Control": "no-cache", "Connection": "keep-alive"},
+            headers=SSE_HEADERS,
         )
         for k, v in build_cors_headers().items():
             resp.headers.setdefault(k, v)
         return resp
 
-    full_text = ""
-    response_id = "cmpl"
-    usage_obj: Dict[str, int] | None = None
-    def _extract_usage(evt: Dict[str, Any]) -> Dict[str, int] | None:
-        try:
-            usage = (evt.get("response") or {}).get("usage")
-            if not isinstance(usage, dict):
-                return None
-            pt = int(usage.get("input_tokens") or 0)
-            ct = int(usage.get("output_tokens") or 0)
-            tt = int(usage.get("total_tokens") or (pt + ct))
-            return {"prompt_tokens": pt, "completion_tokens": ct, "total_tokens": tt}
-        except Exception:
-            return None
-    try:
-        for raw_line in upstream.iter_lines(decode_unicode=False):
-            if not raw_line:
-                continue
-            line = raw_line.decode("utf-8", errors="ignore") if isinstance(raw_line, (bytes, bytearray)) else raw_line
-            if not line.startswith("data: "):
-                continue
-            data = line[len("data: "):].strip()
-            if not data or data == "[DONE]":
-                if data == "[DONE]":
-                    break
-                continue
-            try:
-                evt = json.loads(data)
-            except Exception:
-                continue
-            if isinstance(evt.get("response"), dict) and isinstance(evt["response"].get("id"), str):
-                response_id = evt["response"].get("id") or response_id
-            mu = _extract_usage(evt)
-            if mu:
-                usage_obj = mu
-            kind = evt.get("type")
-            if kind == "response.output_text.delta":
-                full_text += evt.get("delta") or ""
-            elif kind == "response.completed":
-                break
-    finally:
-        upstream.close()
+    result = aggregate_response(upstream, "cmpl")
+    if result.error_message:
+        resp = make_response(jsonify({"error": {"message": result.error_message}}), 502)
+        for k, v in build_cors_headers().items():
+            resp.headers.setdefault(k, v)
+        return resp
 
+    usage_obj = result.usage
     completion = {
-        "id": response_id or "cmpl",
+        "id": result.response_id or "cmpl",
         "object": "text_completion",
         "created": created,
         "model": requested_model or model,
         "choices": [
-            {"index": 0, "text": full_text, "finish_reason": "stop", "logprobs": None}
+            {"index": 0, "text": result.text, "finish_reason": "stop", "logprobs": None}
         ],
         **({"usage": usage_obj} if usage_obj else {}),
     }
+    metrics.observe_usage(g.metrics_route, g.metrics_model, usage_obj)
     if verbose:
         _log_json("OUT POST /v1/completions", completion)
     resp = make_response(jsonify(completion), upstream.status_code)
@@ -513,6 +430,117 @@ def completions() -> Response:
     return resp
 
 
+@openai_bp.route("/v1/responses", methods=["POST"])
+def responses() -> Response:
+    verbose = bool(current_app.config.get("VERBOSE"))
+    reasoning_effort = current_app.config.get("REASONING_EFFORT", "medium")
+    reasoning_summary = current_app.config.get("REASONING_SUMMARY", "auto")
+    debug_model = current_app.config.get("DEBUG_MODEL")
+
+    raw = request.get_data(cache=True) or b""
+    if verbose:
+        try:
+            print("IN POST /v1/responses\n" + raw.decode("utf-8", errors="replace"))
+        except Exception:
+            pass
+    try:
+        payload = json.loads(raw) if raw else {}
+    except Exception:
+        payload = None
+    if not isinstance(payload, dict):
+        err = {"error": {"message": "Invalid JSON body"}}
+        if verbose:
+            _log_json("OUT POST /v1/responses", err)
+        return jsonify(err), 400
+
+    timing.lap("parse")
+    requested_model = payload.get("model")
+    model = normalize_model_name(requested_model, debug_model)
+    input_items = payload.get("input")
+    if isinstance(input_items, str):
+        input_items = [{"type": "message", "role": "user", "content": [{"type": "input_text", "text": input_items}]}]
+    if not isinstance(input_items, list):
+        err = {"error": {"message": "Request must include input"}}
+        if verbose:
+            _log_json("OUT POST /v1/responses", err)
+        return jsonify(err), 400
+    client_instructions = payload.get("instructions")
+    if isinstance(client_instructions, str) and client_instructions.strip():
+        # Upstream only accepts ChatMock's own instructions; like system messages on /v1/chat/completions, the
+        # client's go first as a user message
+        input_items = [
+            {"type": "message", "role": "user", "content": [{"type": "input_text", "text": client_instructions}]}
+        ] + input_items
+
+    fields = payload
+    if not isinstance(payload.get("reasoning"), dict):
+        model_reasoning = extract_reasoning_from_model_name(requested_model)
+        reasoning_param = build_reasoning_param(reasoning_effort, reasoning_summary, model_reasoning)
+        fields = {**payload, "reasoning": reasoning_param}
+    prompt_cache_key = payload.get("prompt_cache_key")
+
+    upstream, error_resp = start_passthrough_request(
+        model,
+        input_items,
+        fields,
+        instructions=_instructions_for_model(model),
+        client_session_id=prompt_cache_key if isinstance(prompt_cache_key, str) else None,
+    )
+    if error_resp is not None:
+        return error_resp
+
+    record_rate_limits_from_response(upstream)
+
+    if upstream.status_code >= 400:
+        try:
+            body = upstream.content
+        finally:
+            upstream.close()
+        if verbose:
+            print("Upstream error status=", upstream.status_code)
+        resp = make_response(body, upstream.status_code)
+        resp.headers["Content-Type"] = upstream.headers.get("Content-Type") or "application/json"
+        for k, v in build_cors_headers().items():
+            resp.headers.setdefault(k, v)
+        return resp
+
+    if bool(payload.get("stream")):
+        # Upstream already speaks this protocol: relay the SSE bytes as they arrive without parsing events, cut on
+        # event boundaries so keep-alives are only ever written between events
+        def _relay():
+            try:
+                yield from sse_event_chunks(upstream.iter_content(chunk_size=None))
+            finally:
+                upstream.close()
+
+        stream_iter = _wrap_stream_logging("STREAM OUT /v1/responses", _relay(), verbose)
+        stream_iter = with_keepalive(stream_iter, current_app.config.get("KEEPALIVE_SECONDS", 0), on_abort=upstream.close)
+        resp = Response(
+            stream_iter,
+            status=upstream.status_code,
+            mimetype="text/event-stream",
+            headers=SSE_HEADERS,
+        )
+        for k, v in build_cors_headers().items():
+            resp.headers.setdefault(k, v)
+        return resp
+
+    result = aggregate_response(upstream, "")
+    if result.error_message or result.response is None:
+        message = result.error_message or "Upstream stream ended before response.completed"
+        resp = make_response(jsonify({"error": {"message": message}}), 502)
+        for k, v in build_cors_headers().items():
+            resp.headers.setdefault(k, v)
+        return resp
+    metrics.observe_usage(g.metrics_route, g.metrics_model, result.usage)
+    if verbose:
+        _log_json("OUT POST /v1/responses", result.response)
+    resp = make_response(jsonify(result.response), upstream.status_code)
+    for k, v in build_cors_headers().items():
+        resp.headers.setdefault(k, v)
+    return resp
+
+
 @openai_bp.route("/v1/models", methods=["GET"])
 def list_models() -> Response:
     expose_variants = bool(current_app.config.get("EXPOSE_REASONING_MODELS"))
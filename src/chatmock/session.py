@@ -2,15 +2,25 @@ from __future__ import annotations
 
 import hashlib
 import json
+import os
+import sqlite3
 import threading
+import time
 import uuid
+from collections import OrderedDict
 from typing import Any, Dict, List, Tuple
 
+from . import metrics
+from .payload import PreparedInstructions, as_prepared
+
 
 _LOCK = threading.Lock()
-_FINGERPRINT_TO_UUID: Dict[str, str] = {}
-_ORDER: List[str] = []
+# fingerprint -> (prompt_cache_key, last used, last written to the store); LRU order, most recently used last
+_SESSIONS: "OrderedDict[str, Tuple[str, float, float]]" = OrderedDict()
 _MAX_ENTRIES = 10000
+# Conversations idle for longer than this get a fresh prompt_cache_key; upstream's prompt cache is long gone by then
+_TTL_SECONDS = 24 * 3600.0
+_STORE: "SessionStore | None" = None
 
 
 def _canonicalize_first_user_message(input_items: List[Dict[str, Any]]) -> Dict[str, Any] | None:
@@ -46,44 +56,167 @@ def _canonicalize_first_user_message(input_items: List[Dict[str, Any]]) -> Dict[
     return None
 
 
-def canonicalize_prefix(instructions: str | None, input_items: List[Dict[str, Any]]) -> str:
-    prefix: Dict[str, Any] = {}
-    if isinstance(instructions, str) and instructions.strip():
-        prefix["instructions"] = instructions.strip()
+def _fingerprint(instructions: str | PreparedInstructions | None, input_items: List[Dict[str, Any]]) -> str:
+    # The instructions contribute their precomputed digest, so the multi-KB prompt isn't re-encoded and re-hashed
+    # on every request; only the (usually short) first user message is canonicalized here
+    prepared = as_prepared(instructions)
+    h = hashlib.sha256()
+    h.update(prepared.digest.encode("ascii") if prepared is not None else b"")
+    h.update(b"\0")
     first_user = _canonicalize_first_user_message(input_items)
     if first_user is not None:
-        prefix["first_user_message"] = first_user
-    return json.dumps(prefix, sort_keys=True, separators=(",", ":"))
+        h.update(json.dumps(first_user, sort_keys=True, separators=(",", ":")).encode("utf-8"))
+    return h.hexdigest()
+
+
+class SessionStore:
+    """
+    SQLite-backed fingerprint -> prompt_cache_key map. It survives restarts and, being a plain file in WAL mode,
+    can be shared by several ChatMock workers; the first worker to insert a fingerprint wins.
+    """
 
+    # last_used is only rewritten when it is this stale, so hits don't turn into a write per request
+    TOUCH_INTERVAL = 60.0
+    _PRUNE_EVERY = 500
 
-def _fingerprint(s: str) -> str:
-    return hashlib.sha256(s.encode("utf-8")).hexdigest()
+    def __init__(self, path: str, ttl_seconds: float, max_entries: int):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._inserts = 0
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions (fingerprint TEXT PRIMARY KEY, session_id TEXT NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS sessions_last_used ON sessions(last_used)")
 
+    def get(self, fp: str, now: float) -> Tuple[str, float] | None:
+        row = self._conn.execute("SELECT session_id, last_used FROM sessions WHERE fingerprint = ?", (fp,)).fetchone()
+        if row is None:
+            return None
+        sid, last_used = row
+        if now - last_used > self.ttl_seconds:
+            return None
+        if now - last_used > self.TOUCH_INTERVAL:
+            self.touch(fp, now)
+            last_used = now
+        return sid, last_used
 
-def _remember(fp: str, sid: str) -> None:
-    if fp in _FINGERPRINT_TO_UUID:
-        return
-    _FINGERPRINT_TO_UUID[fp] = sid
-    _ORDER.append(fp)
-    if len(_ORDER) > _MAX_ENTRIES:
-        oldest = _ORDER.pop(0)
-        _FINGERPRINT_TO_UUID.pop(oldest, None)
+    def touch(self, fp: str, now: float) -> None:
+        self._conn.execute("UPDATE sessions SET last_used = ? WHERE fingerprint = ?", (now, fp))
+
+    def insert(self, fp: str, sid: str, now: float) -> str:
+        # Replace expired rows, keep live ones: another worker may have raced us to this fingerprint
+        self._conn.execute(
+            "INSERT INTO sessions (fingerprint, session_id, last_used) VALUES (?, ?, ?)"
+            " ON CONFLICT(fingerprint) DO UPDATE SET session_id = excluded.session_id, last_used = excluded.last_used"
+            " WHERE sessions.last_used < ?",
+            (fp, sid, now, now - self.ttl_seconds),
+        )
+        row = self._conn.execute("SELECT session_id FROM sessions WHERE fingerprint = ?", (fp,)).fetchone()
+        self._inserts += 1
+        if self._inserts % self._PRUNE_EVERY == 0:
+            self.prune(now)
+        return row[0] if row else sid
+
+    def prune(self, now: float) -> None:
+        self._conn.execute("DELETE FROM sessions WHERE last_used < ?", (now - self.ttl_seconds,))
+        self._conn.execute(
+            "DELETE FROM sessions WHERE fingerprint IN"
+            " (SELECT fingerprint FROM sessions ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+def configure_sessions(
+    max_entries: int | None = None,
+    ttl_seconds: float | None = None,
+    store_path: str | None = None,
+) -> None:
+    global _MAX_ENTRIES, _TTL_SECONDS, _STORE
+    with _LOCK:
+        if max_entries is not None:
+            _MAX_ENTRIES = max(1, int(max_entries))
+        if ttl_seconds is not None:
+            _TTL_SECONDS = float(ttl_seconds)
+        if _STORE is not None:
+            _STORE.close()
+            _STORE = None
+        if store_path:
+            _STORE = SessionStore(store_path, _TTL_SECONDS, _MAX_ENTRIES)
+        _SESSIONS.clear()
+        metrics.SESSION_ENTRIES.set(0)
+
+
+def _remember(fp: str, sid: str, now: float) -> None:
+    _SESSIONS[fp] = (sid, now, now)
+    _SESSIONS.move_to_end(fp)
+    while len(_SESSIONS) > _MAX_ENTRIES:
+        _SESSIONS.popitem(last=False)
+        metrics.SESSION_EVICTIONS.inc()
+    metrics.SESSION_ENTRIES.set(len(_SESSIONS))
 
 
 def ensure_session_id(
-    instructions: str | None,
+    instructions: str | PreparedInstructions | None,
     input_items: List[Dict[str, Any]],
     client_supplied: str | None = None,
 ) -> str:
     if isinstance(client_supplied, str) and client_supplied.strip():
+        metrics.SESSION_LOOKUPS.inc(result="client")
         return client_supplied.strip()
 
-    canon = canonicalize_prefix(instructions, input_items)
-    fp = _fingerprint(canon)
+    fp = _fingerprint(instructions, input_items)
+    now = time.time()
+    expired = False
+    # The store is only used outside _LOCK: its busy timeout must not stall cache hits on other threads
     with _LOCK:
-        if fp in _FINGERPRINT_TO_UUID:
-            return _FINGERPRINT_TO_UUID[fp]
-        sid = str(uuid.uuid4())
-        _remember(fp, sid)
+        store = _STORE
+        entry = _SESSIONS.get(fp)
+        if entry is not None:
+            sid, last_used, synced = entry
+            if now - last_used <= _TTL_SECONDS:
+                # keep the shared store's view of recency close enough that other workers don't expire it
+                touch = store is not None and now - synced > store.TOUCH_INTERVAL
+                _SESSIONS[fp] = (sid, now, now if touch else synced)
+                _SESSIONS.move_to_end(fp)
+                metrics.SESSION_LOOKUPS.inc(result="hit")
+                if not touch:
+                    return sid
+            else:
+                del _SESSIONS[fp]
+                expired = True
+                entry = None
+        if entry is None and store is None:
+            sid = str(uuid.uuid4())
+            _remember(fp, sid, now)
+            metrics.SESSION_LOOKUPS.inc(result="expired" if expired else "miss")
+            return sid
+
+    if entry is not None:
+        try:
+            store.touch(fp, now)
+        except sqlite3.Error:
+            pass
         return sid
 
+    result = "expired" if expired else "miss"
+    try:
+        found = store.get(fp, now)
+        if found is not None:
+            sid, result = found[0], "store_hit"
+        else:
+            sid = store.insert(fp, str(uuid.uuid4()), now)
+    except sqlite3.Error:
+        # the store is an optimisation; fall back to an in-memory key rather than failing the request
+        sid = str(uuid.uuid4())
+    with _LOCK:
+        _remember(fp, sid, now)
+    metrics.SESSION_LOOKUPS.inc(result=result)
+    return sid
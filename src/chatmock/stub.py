@@ -0,0 +1,113 @@
+from __future__ import annotations
+
+import json
+import random
+import threading
+import time
+from typing import List, Tuple
+
+from flask import Flask, Response, jsonify, request
+
+
+_WORDS = (
+    "the", "proxy", "streams", "tokens", "from", "a", "local", "stub", "so", "load", "tests", "run", "offline",
+    "without", "credentials", "and", "measure", "throughput", "latency", "under", "fixed", "concurrency",
+)
+
+
+def synthetic_events(tokens: int, response_id: str = "resp_stub") -> List[str]:
+    """
+    Data payloads of a plain text Responses stream with `tokens` output deltas, ending in response.completed
+    with usage.
+    """
+    events = [
+        {"type": "response.created", "response": {"id": response_id, "status": "in_progress"}},
+        {"type": "response.in_progress", "response": {"id": response_id, "status": "in_progress"}},
+    ]
+    for i in range(max(0, int(tokens))):
+        events.append({"type": "response.output_text.delta", "delta": ("" if i == 0 else " ") + _WORDS[i % len(_WORDS)]})
+    events.append(
+        {
+            "type": "response.completed",
+            "response": {
+                "id": response_id,
+                "status": "completed",
+                "usage": {"input_tokens": 64, "output_tokens": int(tokens), "total_tokens": 64 + int(tokens)},
+            },
+        }
+    )
+    return [json.dumps(evt, separators=(",", ":")) for evt in events]
+
+
+def load_recording(path: str) -> List[str]:
+    """
+    Data payloads of a recorded Responses SSE stream: every `data: ` line of the file (as printed by
+    `serve --verbose-obfuscation`), other lines ignored.
+    """
+    events: List[str] = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith("data: ") and line[len("data: "):].strip() != "[DONE]":
+                events.append(line[len("data: "):].strip())
+    if not events:
+        raise ValueError(f"No 'data: ' events found in {path}")
+    return events
+
+
+def _is_delta(data: str) -> bool:
+    try:
+        kind = json.loads(data).get("type")
+    except Exception:
+        return False
+    return isinstance(kind, str) and kind.endswith(".delta")
+
+
+def create_stub_app(
+    events: List[str],
+    tokens_per_second: float = 0.0,
+    first_token_delay: float = 0.0,
+    error_rate: float = 0.0,
+    seed: int | None = None,
+) -> Flask:
+    """
+    A stand-in for the ChatGPT Responses endpoint that replays `events` to every POST /responses. Delta events
+    are paced at `tokens_per_second` (0 sends as fast as possible) after `first_token_delay` seconds; a fraction
+    `error_rate` of requests is answered with a 500 instead.
+    """
+    app = Flask(__name__)
+    frames: List[Tuple[bytes, bool]] = [(f"data: {data}\n\n".encode("utf-8"), _is_delta(data)) for data in events]
+    interval = 1.0 / tokens_per_second if tokens_per_second and tokens_per_second > 0 else 0.0
+    rng = random.Random(seed)
+    rng_lock = threading.Lock()
+
+    @app.get("/health")
+    def health():
+        return jsonify({"status": "ok", "events": len(frames)})
+
+    @app.post("/responses")
+    def responses():
+        request.get_data()
+        if error_rate > 0:
+            with rng_lock:
+                fail = rng.random() < error_rate
+            if fail:
+                return jsonify({"error": {"message": "Injected stub upstream error"}}), 500
+
+        def _gen():
+            if first_token_delay > 0:
+                time.sleep(first_token_delay)
+            next_at = time.perf_counter()
+            for frame, is_delta in frames:
+                if is_delta and interval:
+                    # Pace against a deadline so per-chunk overhead doesn't drift the token rate
+                    next_at += interval
+                    delay = next_at - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                yield frame
+            yield b"data: [DONE]\n\n"
+
+        return Response(_gen(), mimetype="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+    return app
@@ -0,0 +1,155 @@
+from __future__ import annotations
+
+import time
+from typing import Dict, Iterable, Iterator
+
+from flask import g
+
+from . import metrics
+
+
+_clock = time.perf_counter
+
+
+class StageTimer:
+    """
+    Per-request stage durations. Stages are recorded as laps: each lap charges the time since the previous lap
+    to the named stage, so marking the end of every stage on the hot path costs one clock read. Repeated stages
+    (a retried upstream call) accumulate.
+    """
+
+    __slots__ = ("started", "last", "stages", "connected_at", "upstream_wait")
+
+    def __init__(self, started: float) -> None:
+        self.started = started
+        self.last = started
+        self.stages: Dict[str, float] = {}
+        # Set once upstream returned its headers; everything after that is the body phase
+        self.connected_at: float | None = None
+        self.upstream_wait = 0.0
+
+    def add(self, name: str, seconds: float) -> None:
+        self.stages[name] = self.stages.get(name, 0.0) + max(0.0, seconds)
+
+    def lap(self, name: str) -> float:
+        now = _clock()
+        self.add(name, now - self.last)
+        self.last = now
+        return now
+
+    def finish(self) -> Dict[str, float]:
+        """
+        Close the body phase: whatever part of it was not spent waiting on upstream is translation (and writing to
+        the client). Returns the stages including `total`.
+        """
+        now = _clock()
+        if self.connected_at is not None:
+            body = now - self.connected_at - self.stages.get("upstream_ttfb", 0.0)
+            self.add("upstream_read", self.upstream_wait)
+            self.add("translate", body - self.upstream_wait)
+            self.connected_at = None
+            self.upstream_wait = 0.0
+        stages = dict(self.stages)
+        stages["total"] = now - self.started
+        return stages
+
+
+def format_server_timing(stages: Dict[str, float]) -> str:
+    return ", ".join(f"{name};dur={seconds * 1000.0:.2f}" for name, seconds in stages.items())
+
+
+def current() -> StageTimer | None:
+    try:
+        return g.get("stage_timer")
+    except RuntimeError:
+        return None
+
+
+def lap(name: str) -> None:
+    timer = current()
+    if timer is not None:
+        timer.lap(name)
+
+
+def observe(route: str, stages: Dict[str, float]) -> None:
+    for name, seconds in stages.items():
+        metrics.STAGE_SECONDS.observe(seconds, route=route, stage=name)
+
+
+class TimedUpstream:
+    """
+    Wraps an upstream `requests` response so time spent blocked on its body is charged to `upstream_ttfb` (until
+    the first line) and `upstream_read` (afterwards). Everything else is delegated to the wrapped response.
+    """
+
+    def __init__(self, upstream, timer: StageTimer) -> None:
+        self._upstream = upstream
+        self._timer = timer
+        timer.connected_at = timer.lap("upstream_connect")
+
+    def __getattr__(self, name: str):
+        return getattr(self._upstream, name)
+
+    def _timed(self, chunks: Iterable) -> Iterator:
+        timer = self._timer
+        it = iter(chunks)
+        first = True
+        while True:
+            started = _clock()
+            try:
+                item = next(it)
+            except StopIteration:
+                if first:
+                    timer.lap("upstream_ttfb")
+                else:
+                    timer.upstream_wait += _clock() - started
+                return
+            if first:
+                timer.lap("upstream_ttfb")
+                first = False
+            else:
+                timer.upstream_wait += _clock() - started
+            yield item
+
+    def iter_lines(self, *args, **kwargs) -> Iterator:
+        return self._timed(self._upstream.iter_lines(*args, **kwargs))
+
+    def iter_content(self, *args, **kwargs) -> Iterator:
+        return self._timed(self._upstream.iter_content(*args, **kwargs))
+
+
+def instrument_response(resp, timer: StageTimer, route: str) -> None:
+    """
+    Report the stages of a finished request: as a `Server-Timing` header for plain responses, and for event
+    streams as the header (stages known before the body) plus a trailing `: server-timing` SSE comment once the
+    body is exhausted. Both feed the `chatmock_stage_seconds` histogram.
+    """
+    if not resp.is_streamed:
+        stages = timer.finish()
+        resp.headers["Server-Timing"] = format_server_timing(stages)
+        observe(route, stages)
+        return
+
+    resp.headers["Server-Timing"] = format_server_timing(timer.stages)
+    sse = (resp.mimetype or "") == "text/event-stream"
+    body = resp.response
+
+    def _gen():
+        completed = False
+        try:
+            for chunk in body:
+                yield chunk
+            completed = True
+        finally:
+            stages = timer.finish()
+            observe(route, stages)
+            close = getattr(body, "close", None)
+            if callable(close):
+                try:
+                    close()
+                except Exception:
+                    pass
+        if completed and sse:
+            yield f": server-timing {format_server_timing(stages)}\n\n".encode("utf-8")
+
+    resp.response = _gen()
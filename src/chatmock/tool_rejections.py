@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+import threading
+import time
+from typing import Any, Dict, List, Tuple
+
+from . import metrics
+
+
+_LOCK = threading.Lock()
+# (model, responses tool type) -> (time learned, upstream status of the rejected attempt)
+_REJECTED: Dict[Tuple[str, str], Tuple[float, int]] = {}
+# Upstream support for passthrough tools changes rarely; re-probe once an hour
+_TTL_SECONDS = 3600.0
+
+
+def configure_tool_rejections(ttl_seconds: float | None = None) -> None:
+    global _TTL_SECONDS
+    if ttl_seconds is not None:
+        _TTL_SECONDS = max(0.0, float(ttl_seconds))
+    with _LOCK:
+        _REJECTED.clear()
+        metrics.TOOL_REJECTIONS_LEARNED.set(0)
+
+
+def record_rejection(model: str, extra_tools: List[Dict[str, Any]], status: int) -> None:
+    """
+    Remember that upstream refused `extra_tools` for `model` while accepting the same request without them.
+    """
+    now = time.time()
+    with _LOCK:
+        for tool_type in {t.get("type") for t in extra_tools if isinstance(t, dict)}:
+            if isinstance(tool_type, str):
+                _REJECTED[(model, tool_type)] = (now, int(status))
+                metrics.TOOL_REJECTIONS.inc(model=model, tool_type=tool_type)
+        metrics.TOOL_REJECTIONS_LEARNED.set(len(_REJECTED))
+
+
+def split_rejected(model: str, extra_tools: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """
+    Split passthrough tools into those worth sending and those upstream recently rejected for this model.
+    """
+    if not extra_tools:
+        return extra_tools, []
+    now = time.time()
+    kept: List[Dict[str, Any]] = []
+    rejected: List[Dict[str, Any]] = []
+    with _LOCK:
+        for tool in extra_tools:
+            key = (model, tool.get("type"))
+            learned = _REJECTED.get(key)
+            if learned is not None and now - learned[0] >= _TTL_SECONDS:
+                del _REJECTED[key]
+                metrics.TOOL_REJECTIONS_LEARNED.set(len(_REJECTED))
+                learned = None
+            (rejected if learned is not None else kept).append(tool)
+    if rejected:
+        metrics.TOOL_REJECTION_SKIPS.inc(model=model)
+    return kept, rejected
+
+
+def snapshot() -> Dict[str, Any]:
+    now = time.time()
+    with _LOCK:
+        entries = [
+            {
+                "model": model,
+                "tool_type": tool_type,
+                "status": status,
+                "rejected_at": int(learned_at),
+                "expires_in": max(0, int(learned_at + _TTL_SECONDS - now)),
+            }
+            for (model, tool_type), (learned_at, status) in _REJECTED.items()
+            if now - learned_at < _TTL_SECONDS
+        ]
+    entries.sort(key=lambda e: (e["model"], e["tool_type"]))
+    return {"ttl_seconds": _TTL_SECONDS, "rejections": entries}
@@ -5,10 +5,19 @@ import time
 from typing import Any, Dict, List, Tuple
 
 import requests
-from flask import Response, current_app, jsonify, make_response
+from flask import Response, current_app, g, jsonify, make_response
 
+from . import metrics, timing
 from .config import CHATGPT_RESPONSES_URL
 from .http import build_cors_headers
+from .payload import (
+    PreparedInstructions,
+    PreparedTools,
+    as_prepared,
+    as_prepared_tools,
+    build_passthrough_body,
+    build_responses_body,
+)
 from .session import ensure_session_id
 from flask import request as flask_request
 from .utils import get_effective_chatgpt_auth
@@ -54,71 +63,43 @@ def normalize_model_name(name: str | None, debug_model: str | None = None) -> st
     return mapping.get(base, base)
 
 
-def start_upstream_request(
-    model: str,
-    input_items: List[Dict[str, Any]],
-    *,
-    instructions: str | None = None,
-    tools: List[Dict[str, Any]] | None = None,
-    tool_choice: Any | None = None,
-    parallel_tool_calls: bool = False,
-    reasoning_param: Dict[str, Any] | None = None,
-):
-    access_token, account_id = get_effective_chatgpt_auth()
-    if not access_token or not account_id:
-        resp = make_response(
-            jsonify(
-                {
-                    "error": {
-                        "message": "Missing ChatGPT credentials. Run 'python3 chatmock.py login' first.",
-                    }
+def _missing_credentials_response() -> Response:
+    resp = make_response(
+        jsonify(
+            {
+                "error": {
+                    "message": "Missing ChatGPT credentials. Run 'python3 chatmock.py login' first.",
                 }
-            ),
-            401,
-        )
-        for k, v in build_cors_headers().items():
-            resp.headers.setdefault(k, v)
-        return None, resp
+            }
+        ),
+        401,
+    )
+    for k, v in build_cors_headers().items():
+        resp.headers.setdefault(k, v)
+    return resp
 
-    include: List[str] = []
-    if isinstance(reasoning_param, dict):
-        include.append("reasoning.encrypted_content")
 
-    client_session_id = None
+def _client_session_id() -> str | None:
     try:
-        client_session_id = (
+        return (
             flask_request.headers.get("X-Session-Id")
             or flask_request.headers.get("session_id")
             or None
         )
     except Exception:
-        client_session_id = None
-    session_id = ensure_session_id(instructions, input_items, client_session_id)
-
-    responses_payload = {
-        "model": model,
-        "instructions": instructions if isinstance(instructions, str) and instructions.strip() else instructions,
-        "input": input_items,
-        "tools": tools or [],
-        "tool_choice": tool_choice if tool_choice in ("auto", "none") or isinstance(tool_choice, dict) else "auto",
-        "parallel_tool_calls": bool(parallel_tool_calls),
-        "store": False,
-        "stream": True,
-        "prompt_cache_key": session_id,
-    }
-    if include:
-        responses_payload["include"] = include
+        return None
 
-    if reasoning_param is not None:
-        responses_payload["reasoning"] = reasoning_param
 
+def _post_responses(model: str, body: bytes, session_id: str, access_token: str, account_id: str):
     verbose = False
+    url = CHATGPT_RESPONSES_URL
     try:
         verbose = bool(current_app.config.get("VERBOSE"))
+        url = current_app.config.get("RESPONSES_URL") or CHATGPT_RESPONSES_URL
     except Exception:
         verbose = False
     if verbose:
-        _log_json("OUTBOUND >> ChatGPT Responses API payload", responses_payload)
+        _log_json("OUTBOUND >> ChatGPT Responses API payload", json.loads(body))
 
     headers = {
         "Authorization": f"Bearer {access_token}",
@@ -129,11 +110,17 @@ def start_upstream_request(
         "session_id": session_id,
     }
 
+    try:
+        g.metrics_model = model
+        metrics.QUEUE_WAIT.observe(time.perf_counter() - g.metrics_start, route=g.metrics_route, model=model)
+    except Exception:
+        pass
+
     try:
         upstream = requests.post(
-            CHATGPT_RESPONSES_URL,
+            url,
             headers=headers,
-            json=responses_payload,
+            data=body,
             stream=True,
             timeout=600,
         )
@@ -141,5 +128,73 @@ def start_upstream_request(
         resp = make_response(jsonify({"error": {"message": f"Upstream ChatGPT request failed: {e}"}}), 502)
         for k, v in build_cors_headers().items():
             resp.headers.setdefault(k, v)
+        metrics.UPSTREAM_STATUS.inc(model=model, status="error")
         return None, resp
+    metrics.UPSTREAM_STATUS.inc(model=model, status=str(upstream.status_code))
+    timer = timing.current()
+    if timer is not None:
+        upstream = timing.TimedUpstream(upstream, timer)
     return upstream, None
+
+
+def start_upstream_request(
+    model: str,
+    input_items: List[Dict[str, Any]],
+    *,
+    instructions: str | PreparedInstructions | None = None,
+    tools: List[Dict[str, Any]] | PreparedTools | None = None,
+    tool_choice: Any | None = None,
+    parallel_tool_calls: bool = False,
+    reasoning_param: Dict[str, Any] | None = None,
+):
+    timing.lap("convert")
+    access_token, account_id = get_effective_chatgpt_auth()
+    timing.lap("auth")
+    if not access_token or not account_id:
+        return None, _missing_credentials_response()
+
+    include: List[str] = []
+    if isinstance(reasoning_param, dict):
+        include.append("reasoning.encrypted_content")
+
+    prepared = as_prepared(instructions)
+    session_id = ensure_session_id(prepared, input_items, _client_session_id())
+
+    body = build_responses_body(
+        model,
+        prepared,
+        input_items,
+        as_prepared_tools(tools).encoded,
+        tool_choice if tool_choice in ("auto", "none") or isinstance(tool_choice, dict) else "auto",
+        bool(parallel_tool_calls),
+        session_id,
+        include=include,
+        reasoning_param=reasoning_param,
+    )
+    timing.lap("encode")
+    return _post_responses(model, body, session_id, access_token, account_id)
+
+
+def start_passthrough_request(
+    model: str,
+    input_items: List[Dict[str, Any]],
+    fields: Dict[str, Any],
+    *,
+    instructions: str | PreparedInstructions | None = None,
+    client_session_id: str | None = None,
+):
+    """
+    Forward a client's Responses API request, replacing only the model, instructions, prompt_cache_key and the
+    store/stream flags the ChatGPT backend requires; every other field in `fields` is passed through untouched.
+    """
+    timing.lap("convert")
+    access_token, account_id = get_effective_chatgpt_auth()
+    timing.lap("auth")
+    if not access_token or not account_id:
+        return None, _missing_credentials_response()
+
+    prepared = as_prepared(instructions)
+    session_id = ensure_session_id(prepared, input_items, client_session_id or _client_session_id())
+    body = build_passthrough_body(model, prepared, input_items, fields, session_id)
+    timing.lap("encode")
+    return _post_responses(model, body, session_id, access_token, account_id)
@@ -7,11 +7,16 @@ import json
 import os
 import secrets
 import sys
+import threading
+from collections import OrderedDict
 from typing import Any, Dict, List, Optional, Tuple
 
 import requests
 
+from . import metrics
 from .config import CLIENT_ID_DEFAULT, OAUTH_TOKEN_URL
+from .events import EventStream, ResponseAggregate
+from .payload import content_digest
 
 
 def eprint(*args, **kwargs) -> None:
@@ -85,108 +90,168 @@ def generate_pkce() -> "PkceCodes":
     return PkceCodes(code_verifier=code_verifier, code_challenge=code_challenge)
 
 
-def convert_chat_messages_to_responses_input(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-    def _normalize_image_data_url(url: str) -> str:
+_CONVERT_LOCK = threading.Lock()
+# Coding agents resend the whole history every turn; converted messages are memoized by a digest of their content
+# so only the new turn is walked. Items are shared between requests and must not be mutated by callers.
+_CONVERTED: "OrderedDict[bytes, Tuple[Tuple[Dict[str, Any], ...], int]]" = OrderedDict()
+_CONVERTED_BYTES = 0
+_CONVERTED_MAX_ENTRIES = 4096
+_CONVERTED_MAX_BYTES = 64 * 1024 * 1024
+# digest of normalized base64 image data -> whether it decoded cleanly
+_IMAGE_CHECKS: "OrderedDict[bytes, bool]" = OrderedDict()
+_IMAGE_CHECKS_MAX = 1024
+
+
+def _image_data_is_valid(data: str) -> bool:
+    key = hashlib.sha256(data.encode("ascii", "replace")).digest()
+    with _CONVERT_LOCK:
+        cached = _IMAGE_CHECKS.get(key)
+        if cached is not None:
+            _IMAGE_CHECKS.move_to_end(key)
+            return cached
+    try:
+        base64.b64decode(data, validate=True)
+        valid = True
+    except Exception:
+        valid = False
+    with _CONVERT_LOCK:
+        _IMAGE_CHECKS[key] = valid
+        while len(_IMAGE_CHECKS) > _IMAGE_CHECKS_MAX:
+            _IMAGE_CHECKS.popitem(last=False)
+    return valid
+
+
+def _normalize_image_data_url(url: str) -> str:
+    try:
+        if not isinstance(url, str):
+            return url
+        if not url.startswith("data:image/"):
+            return url
+        if ";base64," not in url:
+            return url
+        header, data = url.split(",", 1)
         try:
-            if not isinstance(url, str):
-                return url
-            if not url.startswith("data:image/"):
-                return url
-            if ";base64," not in url:
-                return url
-            header, data = url.split(",", 1)
-            try:
-                from urllib.parse import unquote
+            from urllib.parse import unquote
 
-                data = unquote(data)
-            except Exception:
-                pass
-            data = data.strip().replace("\n", "").replace("\r", "")
-            data = data.replace("-", "+").replace("_", "/")
-            pad = (-len(data)) % 4
-            if pad:
-                data = data + ("=" * pad)
-            try:
-                base64.b64decode(data, validate=True)
-            except Exception:
-                return url
-            return f"{header},{data}"
+            data = unquote(data)
         except Exception:
+            pass
+        data = data.strip().replace("\n", "").replace("\r", "")
+        data = data.replace("-", "+").replace("_", "/")
+        pad = (-len(data)) % 4
+        if pad:
+            data = data + ("=" * pad)
+        if not _image_data_is_valid(data):
             return url
+        return f"{header},{data}"
+    except Exception:
+        return url
+
+
+def _convert_chat_message(message: Dict[str, Any]) -> List[Dict[str, Any]]:
+    input_items: List[Dict[str, Any]] = []
+    role = message.get("role")
+
+    if role == "tool":
+        call_id = message.get("tool_call_id") or message.get("id")
+        if isinstance(call_id, str) and call_id:
+            content = message.get("content", "")
+            if isinstance(content, list):
+                texts = []
+                for part in content:
+                    if isinstance(part, dict):
+                        t = part.get("text") or part.get("content")
+                        if isinstance(t, str) and t:
+                            texts.append(t)
+                content = "\n".join(texts)
+            if isinstance(content, str):
+                input_items.append(
+                    {
+                        "type": "function_call_output",
+                        "call_id": call_id,
+                        "output": content,
+                    }
+                )
+        return input_items
+    if role == "assistant" and isinstance(message.get("tool_calls"), list):
+        for tc in message.get("tool_calls") or []:
+            if not isinstance(tc, dict):
+                continue
+            tc_type = tc.get("type", "function")
+            if tc_type != "function":
+                continue
+            call_id = tc.get("id") or tc.get("call_id")
+            fn = tc.get("function") if isinstance(tc.get("function"), dict) else {}
+            name = fn.get("name") if isinstance(fn, dict) else None
+            args = fn.get("arguments") if isinstance(fn, dict) else None
+            if isinstance(call_id, str) and isinstance(name, str) and isinstance(args, str):
+                input_items.append(
+                    {
+                        "type": "function_call",
+                        "name": name,
+                        "arguments": args,
+                        "call_id": call_id,
+                    }
+                )
+
+    content = message.get("content", "")
+    content_items: List[Dict[str, Any]] = []
+    if isinstance(content, list):
+        for part in content:
+            if not isinstance(part, dict):
+                continue
+            ptype = part.get("type")
+            if ptype == "text":
+                text = part.get("text") or part.get("content") or ""
+                if isinstance(text, str) and text:
+                    kind = "output_text" if role == "assistant" else "input_text"
+                    content_items.append({"type": kind, "text": text})
+            elif ptype == "image_url":
+                image = part.get("image_url")
+                url = image.get("url") if isinstance(image, dict) else image
+                if isinstance(url, str) and url:
+                    content_items.append({"type": "input_image", "image_url": _normalize_image_data_url(url)})
+    elif isinstance(content, str) and content:
+        kind = "output_text" if role == "assistant" else "input_text"
+        content_items.append({"type": kind, "text": content})
+
+    if not content_items:
+        return input_items
+    role_out = "assistant" if role == "assistant" else "user"
+    input_items.append({"type": "message", "role": role_out, "content": content_items})
+    return input_items
+
 
+def convert_chat_messages_to_responses_input(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    global _CONVERTED_BYTES
     input_items: List[Dict[str, Any]] = []
     for message in messages:
         role = message.get("role")
         if role == "system":
             continue
 
-        if role == "tool":
-            call_id = message.get("tool_call_id") or message.get("id")
-            if isinstance(call_id, str) and call_id:
-                content = message.get("content", "")
-                if isinstance(content, list):
-                    texts = []
-                    for part in content:
-                        if isinstance(part, dict):
-                            t = part.get("text") or part.get("content")
-                            if isinstance(t, str) and t:
-                                texts.append(t)
-                    content = "\n".join(texts)
-                if isinstance(content, str):
-                    input_items.append(
-                        {
-                            "type": "function_call_output",
-                            "call_id": call_id,
-                            "output": content,
-                        }
-                    )
+        key, size = content_digest(message)
+        with _CONVERT_LOCK:
+            cached = _CONVERTED.get(key)
+            if cached is not None:
+                _CONVERTED.move_to_end(key)
+        if cached is not None:
+            metrics.MESSAGE_CONVERSIONS.inc(result="hit")
+            input_items.extend(cached[0])
             continue
-        if role == "assistant" and isinstance(message.get("tool_calls"), list):
-            for tc in message.get("tool_calls") or []:
-                if not isinstance(tc, dict):
-                    continue
-                tc_type = tc.get("type", "function")
-                if tc_type != "function":
-                    continue
-                call_id = tc.get("id") or tc.get("call_id")
-                fn = tc.get("function") if isinstance(tc.get("function"), dict) else {}
-                name = fn.get("name") if isinstance(fn, dict) else None
-                args = fn.get("arguments") if isinstance(fn, dict) else None
-                if isinstance(call_id, str) and isinstance(name, str) and isinstance(args, str):
-                    input_items.append(
-                        {
-                            "type": "function_call",
-                            "name": name,
-                            "arguments": args,
-                            "call_id": call_id,
-                        }
-                    )
-
-        content = message.get("content", "")
-        content_items: List[Dict[str, Any]] = []
-        if isinstance(content, list):
-            for part in content:
-                if not isinstance(part, dict):
-                    continue
-                ptype = part.get("type")
-                if ptype == "text":
-                    text = part.get("text") or part.get("content") or ""
-                    if isinstance(text, str) and text:
-                        kind = "output_text" if role == "assistant" else "input_text"
-                        content_items.append({"type": kind, "text": text})
-                elif ptype == "image_url":
-                    image = part.get("image_url")
-                    url = image.get("url") if isinstance(image, dict) else image
-                    if isinstance(url, str) and url:
-                        content_items.append({"type": "input_image", "image_url": _normalize_image_data_url(url)})
-        elif isinstance(content, str) and content:
-            kind = "output_text" if role == "assistant" else "input_text"
-            content_items.append({"type": kind, "text": content})
-
-        if not content_items:
+
+        metrics.MESSAGE_CONVERSIONS.inc(result="miss")
+        converted = tuple(_convert_chat_message(message))
+        input_items.extend(converted)
+        if size > _CONVERTED_MAX_BYTES // 8:
             continue
-        role_out = "assistant" if role == "assistant" else "user"
-        input_items.append({"type": "message", "role": role_out, "content": content_items})
+        with _CONVERT_LOCK:
+            if key not in _CONVERTED:
+                _CONVERTED[key] = (converted, size)
+                _CONVERTED_BYTES += size
+            while len(_CONVERTED) > _CONVERTED_MAX_ENTRIES or _CONVERTED_BYTES > _CONVERTED_MAX_BYTES:
+                _, (_, evicted_size) = _CONVERTED.popitem(last=False)
+                _CONVERTED_BYTES -= evicted_size
     return input_items
 
 
@@ -383,8 +448,9 @@ def sse_translate_chat(
     reasoning_compat: str = "think-tags",
     *,
     include_usage: bool = False,
+    on_usage=None,
 ):
-    response_id = "chatcmpl-stream"
+    state = ResponseAggregate("chatcmpl-stream", collect=False)
     compat = (reasoning_compat or "think-tags").strip().lower()
     think_open = False
     think_closed = False
@@ -392,7 +458,6 @@ def sse_translate_chat(
     sent_stop_chunk = False
     saw_any_summary = False
     pending_summary_paragraph = False
-    upstream_usage = None
     ws_state: dict[str, Any] = {}
     ws_index: dict[str, int] = {}
     ws_next_index: int = 0
@@ -421,48 +486,13 @@ def sse_translate_chat(
         else:
             return "{}"
     
-    def _extract_usage(evt: Dict[str, Any]) -> Dict[str, int] | None:
-        try:
-            usage = (evt.get("response") or {}).get("usage")
-            if not isinstance(usage, dict):
-                return None
-            pt = int(usage.get("input_tokens") or 0)
-            ct = int(usage.get("output_tokens") or 0)
-            tt = int(usage.get("total_tokens") or (pt + ct))
-            return {"prompt_tokens": pt, "completion_tokens": ct, "total_tokens": tt}
-        except Exception:
-            return None
+    events = iter(EventStream(upstream, vlog if verbose and vlog else None))
     try:
-        try:
-            line_iterator = upstream.iter_lines(decode_unicode=False)
-        except requests.exceptions.ChunkedEncodingError as e:
-            if verbose and vlog:
-                vlog(f"Failed to start stream: {e}")
-            yield b"data: [DONE]\n\n"
-            return
-
-        for raw in line_iterator:
+        while True:
             try:
-                if not raw:
-                    continue
-                line = (
-                    raw.decode("utf-8", errors="ignore")
-                    if isinstance(raw, (bytes, bytearray))
-                    else raw
-                )
-                if verbose and vlog:
-                    vlog(line)
-                if not line.startswith("data: "):
-                    continue
-                data = line[len("data: ") :].strip()
-                if not data:
-                    continue
-                if data == "[DONE]":
-                    break
-                try:
-                    evt = json.loads(data)
-                except (json.JSONDecodeError, UnicodeDecodeError):
-                    continue
+                evt = next(events)
+            except StopIteration:
+                break
             except (
                 requests.exceptions.ChunkedEncodingError,
                 ConnectionError,
@@ -474,8 +504,8 @@ def sse_translate_chat(
                 yield b"data: [DONE]\n\n"
                 return
             kind = evt.get("type")
-            if isinstance(evt.get("response"), dict) and isinstance(evt["response"].get("id"), str):
-                response_id = evt["response"].get("id") or response_id
+            state.feed(evt)
+            response_id = state.response_id
 
             if isinstance(kind, str) and ("web_search_call" in kind):
                 try:
@@ -745,9 +775,9 @@ def sse_translate_chat(
                 chunk = {"error": {"message": err}}
                 yield f"data: {json.dumps(chunk)}\n\n".encode("utf-8")
             elif kind == "response.completed":
-                m = _extract_usage(evt)
-                if m:
-                    upstream_usage = m
+                upstream_usage = state.usage
+                if upstream_usage and on_usage is not None:
+                    on_usage(upstream_usage)
                 if compat == "think-tags" and think_open and not think_closed:
                     close_chunk = {
                         "id": response_id,
@@ -789,49 +819,18 @@ def sse_translate_chat(
         upstream.close()
 
 
-def sse_translate_text(upstream, model: str, created: int, verbose: bool = False, vlog=None, *, include_usage: bool = False):
-    response_id = "cmpl-stream"
-    upstream_usage = None
+def sse_translate_text(
+    upstream, model: str, created: int, verbose: bool = False, vlog=None, *, include_usage: bool = False, on_usage=None
+):
+    state = ResponseAggregate("cmpl-stream", collect=False)
+    response_id = state.response_id
     
-    def _extract_usage(evt: Dict[str, Any]) -> Dict[str, int] | None:
-        try:
-            usage = (evt.get("response") or {}).get("usage")
-            if not isinstance(usage, dict):
-                return None
-            pt = int(usage.get("input_tokens") or 0)
-            ct = int(usage.get("output_tokens") or 0)
-            tt = int(usage.get("total_tokens") or (pt + ct))
-            return {"prompt_tokens": pt, "completion_tokens": ct, "total_tokens": tt}
-        except Exception:
-            return None
+    events = EventStream(upstream, vlog if verbose and vlog else None)
     try:
-        for raw_line in upstream.iter_lines(decode_unicode=False):
-            if not raw_line:
-                continue
-            line = raw_line.decode("utf-8", errors="ignore") if isinstance(raw_line, (bytes, bytearray)) else raw_line
-            if verbose and vlog:
-                vlog(line)
-            if not line.startswith("data: "):
-                continue
-            data = line[len("data: "):].strip()
-            if not data or data == "[DONE]":
-                if data == "[DONE]":
-                    chunk = {
-                        "id": response_id,
-                        "object": "text_completion.chunk",
-                        "created": created,
-                        "model": model,
-                        "choices": [{"index": 0, "text": "", "finish_reason": "stop"}],
-                    }
-                    yield f"data: {json.dumps(chunk)}\n\n".encode("utf-8")
-                continue
-            try:
-                evt = json.loads(data)
-            except Exception:
-                continue
+        for evt in events:
             kind = evt.get("type")
-            if isinstance(evt.get("response"), dict) and isinstance(evt["response"].get("id"), str):
-                response_id = evt["response"].get("id") or response_id
+            state.feed(evt)
+            response_id = state.response_id
             if kind == "response.output_text.delta":
                 delta_text = evt.get("delta") or ""
                 chunk = {
@@ -852,9 +851,9 @@ def sse_translate_text(upstream, model: str, created: int, verbose: bool = False
                 }
                 yield f"data: {json.dumps(chunk)}\n\n".encode("utf-8")
             elif kind == "response.completed":
-                m = _extract_usage(evt)
-                if m:
-                    upstream_usage = m
+                upstream_usage = state.usage
+                if upstream_usage and on_usage is not None:
+                    on_usage(upstream_usage)
                 if include_usage and upstream_usage:
                     try:
                         usage_chunk = {
@@ -870,5 +869,14 @@ def sse_translate_text(upstream, model: str, created: int, verbose: bool = False
                         pass
                 yield b"data: [DONE]\n\n"
                 break
+        if events.done:
+            chunk = {
+                "id": response_id,
+                "object": "text_completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "text": "", "finish_reason": "stop"}],
+            }
+            yield f"data: {json.dumps(chunk)}\n\n".encode("utf-8")
     finally:
         upstream.close()
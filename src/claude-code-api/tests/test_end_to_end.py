@@ -468,7 +468,19 @@ class TestErrorHandling:
             data="invalid json",
             headers={"content-type": "application/json"}
         )
-        assert response.status_code == 422  # Validation error
+        assert response.status_code == 400
+        
+        data = response.json()
+        assert data["detail"]["error"]["type"] == "invalid_request_error"
+        assert data["detail"]["error"]["message"].startswith("Invalid JSON")
+    
+    def test_empty_body(self, client):
+        """Test handling of an empty request body."""
+        response = client.post(
+            "/v1/chat/completions",
+            headers={"content-type": "application/json"}
+        )
+        assert response.status_code == 400
     
     def test_missing_required_fields(self, client):
         """Test handling of missing required fields."""
@@ -1,7 +1,10 @@
 """Chat completions API endpoint - OpenAI compatible."""
 
+import asyncio
+import os
 import uuid
 import json
+from contextlib import aclosing
 from datetime import datetime
 from typing import Dict, Any
 from fastapi import APIRouter, Request, HTTPException, status
@@ -19,13 +22,35 @@ from claude_code_api.models.openai import (
 )
 from claude_code_api.models.claude import validate_claude_model, get_model_info
 from claude_code_api.core.claude_manager import create_project_directory
+from claude_code_api.core.workspace import WorkspaceManager
+from claude_code_api.core.storage import ProjectStorage
+from claude_code_api.api.projects import provision_workspace
+from claude_code_api.core import metrics
+from claude_code_api.core.config import settings
+from claude_code_api.core.log import debug_sampled
 from claude_code_api.core.session_manager import SessionManager, ConversationManager
-from claude_code_api.utils.streaming import create_sse_response, create_non_streaming_response
+from claude_code_api.utils.streaming import (
+    OpenAIStreamConverter,
+    create_sse_response,
+    create_non_streaming_response
+)
 from claude_code_api.utils.parser import ClaudeOutputParser, estimate_tokens
 
 logger = structlog.get_logger()
 router = APIRouter()
 
+# How often a non-streaming request checks whether its client is still connected
+DISCONNECT_POLL_SECONDS = 1.0
+
+
+async def cancel_on_disconnect(req: Request, claude_process) -> None:
+    """Stop the execution if the client goes away before the response is ready."""
+    while not claude_process.finished.is_set():
+        if await req.is_disconnected():
+            await claude_process.cancel("disconnect")
+            return
+        await asyncio.sleep(DISCONNECT_POLL_SECONDS)
+
 
 @router.post("/chat/completions")
 async def create_chat_completion(
@@ -33,53 +58,38 @@ async def create_chat_completion(
 ) -> Any:
     """Create a chat completion, compatible with OpenAI API."""
     
-    # Log raw request for debugging
-    try:
-        raw_body = await req.body()
-        content_type = req.headers.get("content-type", "unknown")
-        logger.info(
+    # Decode and validate the body in one pass
+    raw_body = await req.body()
+    if debug_sampled():
+        logger.debug(
             "Raw request received",
-            content_type=content_type,
+            content_type=req.headers.get("content-type", "unknown"),
             body_size=len(raw_body),
             user_agent=req.headers.get("user-agent", "unknown"),
-            raw_body=raw_body.decode()[:1000] if raw_body else "empty"
+            raw_body=raw_body[:1000].decode(errors="replace")
         )
-        
-        # Parse JSON manually to see validation errors
-        if raw_body:
-            try:
-                json_data = json.loads(raw_body.decode())
-                logger.info("JSON parsed successfully", data_keys=list(json_data.keys()))
-            except json.JSONDecodeError as e:
-                logger.error("JSON decode error", error=str(e))
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail={"error": {"message": f"Invalid JSON: {str(e)}", "type": "invalid_request_error"}}
-                )
-        
-        # Try to validate with Pydantic
-        try:
-            request = ChatCompletionRequest(**json_data)
-            logger.info("Pydantic validation successful")
-        except ValidationError as e:
-            logger.error("Pydantic validation failed", error=str(e), errors=e.errors())
+    try:
+        request = ChatCompletionRequest.model_validate_json(raw_body)
+    except ValidationError as e:
+        errors = e.errors(include_url=False, include_input=False)
+        if not raw_body or errors[0]["type"] == "json_invalid":
+            # Not JSON at all, which the API has always reported as a 400 rather than a schema error
+            logger.warning("Invalid JSON in chat completion request", body_size=len(raw_body))
             raise HTTPException(
-                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
-                detail={"error": {"message": f"Validation error: {str(e)}", "type": "invalid_request_error", "details": e.errors()}}
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail={"error": {"message": f"Invalid JSON: {errors[0]['msg']}", "type": "invalid_request_error"}}
             )
-        
-    except HTTPException:
-        raise
-    except Exception as e:
-        logger.error("Failed to process request", error=str(e))
+        logger.warning("Invalid chat completion request", error_count=e.error_count(), body_size=len(raw_body))
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail={"error": {"message": "Internal server error", "type": "internal_error"}}
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail={"error": {"message": f"Validation error: {str(e)}", "type": "invalid_request_error", "details": errors}}
         )
     
     # Get managers from app state
     session_manager: SessionManager = req.app.state.session_manager
     claude_manager = req.app.state.claude_manager
+    workspace_manager: WorkspaceManager = req.app.state.workspace_manager
+    project_storage: ProjectStorage = req.app.state.project_storage
     
     # Extract client info for logging
     client_id = getattr(req.state, 'client_id', 'anonymous')
@@ -134,59 +144,91 @@ async def create_chat_completion(
         
         # Handle project context
         project_id = request.project_id or f"default-{client_id}"
-        project_path = create_project_directory(project_id)
+        # Held from here on, so neither the reaper nor DELETE /v1/projects removes it while the CLI starts
+        project_path = os.path.join(settings.project_root, project_id)
+        project_storage.acquire(project_path)
+        try:
+            template = request.project_template or workspace_manager.template_for(project_id)
+            if template:
+                project_path = await provision_workspace(workspace_manager, project_id, template)
+            else:
+                project_path = create_project_directory(project_id)
         
-        # Handle session management
-        if request.session_id:
-            # Continue existing session
-            session_id = request.session_id
-            session_info = await session_manager.get_session(session_id)
-            
-            if not session_info:
+            # Usage is cached per project, so this only walks the tree on a project's first request
+            if await project_storage.over_quota(project_path):
+                metrics.PROJECT_QUOTA_REJECTIONS.inc()
                 raise HTTPException(
-                    status_code=status.HTTP_404_NOT_FOUND,
+                    status_code=status.HTTP_507_INSUFFICIENT_STORAGE,
                     detail={
                         "error": {
-                            "message": f"Session {session_id} not found",
-                            "type": "invalid_request_error",
-                            "code": "session_not_found"
+                            "message": f"Project {project_id} uses more than its {settings.max_project_size_mb} MB disk quota",
+                            "type": "insufficient_storage",
+                            "code": "project_quota_exceeded"
                         }
                     }
                 )
-        else:
-            # Create new session
-            session_id = await session_manager.create_session(
-                project_id=project_id,
-                model=claude_model,
-                system_prompt=system_prompt
-            )
         
-        # Start Claude Code process
-        try:
-            claude_process = await claude_manager.create_session(
-                session_id=session_id,
-                project_path=project_path,
-                prompt=user_prompt,
-                model=claude_model,
-                system_prompt=system_prompt,
-                resume_session=request.session_id
-            )
-        except Exception as e:
-            logger.error(
-                "Failed to create Claude session",
-                session_id=session_id,
-                error=str(e)
-            )
-            raise HTTPException(
-                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-                detail={
-                    "error": {
-                        "message": f"Failed to start Claude Code: {str(e)}",
-                        "type": "service_unavailable",
-                        "code": "claude_unavailable"
+            # Handle session management
+            if request.session_id:
+                # Continue existing session
+                session_id = request.session_id
+                session_info = await session_manager.get_session(session_id)
+            
+                if not session_info:
+                    raise HTTPException(
+                        status_code=status.HTTP_404_NOT_FOUND,
+                        detail={
+                            "error": {
+                                "message": f"Session {session_id} not found",
+                                "type": "invalid_request_error",
+                                "code": "session_not_found"
+                            }
+                        }
+                    )
+            else:
+                # Create new session
+                session_id = await session_manager.create_session(
+                    project_id=project_id,
+                    model=claude_model,
+                    system_prompt=system_prompt
+                )
+        
+            # Start Claude Code process
+            metrics.observe_queue_wait(req, claude_model)
+            try:
+                claude_process = await claude_manager.create_session(
+                    session_id=session_id,
+                    project_path=project_path,
+                    prompt=user_prompt,
+                    model=claude_model,
+                    system_prompt=system_prompt,
+                    resume_session=request.session_id,
+                    partial_messages=bool(request.stream) and settings.claude_partial_messages,
+                    # Template workspaces are the CLI's working directory; plain project directories keep the old cwd
+                    cwd=project_path if template else None
+                )
+            except Exception as e:
+                logger.error(
+                    "Failed to create Claude session",
+                    session_id=session_id,
+                    error=str(e)
+                )
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail={
+                        "error": {
+                            "message": f"Failed to start Claude Code: {str(e)}",
+                            "type": "service_unavailable",
+                            "code": "claude_unavailable"
+                        }
                     }
-                }
-            )
+                )
+        except BaseException:
+            project_storage.release(project_path)
+            raise
+        
+        # The execution takes over the hold and releases it once it has finished
+        project_storage.track(project_path, claude_process)
         
         # Use Claude's actual session ID
         claude_session_id = claude_process.session_id
@@ -208,75 +250,77 @@ async def create_chat_completion(
                 headers={
                     "Cache-Control": "no-cache",
                     "Connection": "keep-alive",
+                    "X-Accel-Buffering": "no",
                     "X-Session-ID": claude_session_id,
                     "X-Project-ID": project_id
                 }
             )
         else:
-            # Collect all output for non-streaming response
-            messages = []
+            # Convert output as it arrives; only the assistant text is kept for the response
+            converter = OpenAIStreamConverter(claude_model, claude_session_id)
+            content_parts = []
+            message_count = 0
             
-            async for claude_message in claude_process.get_output():
-                # Log each message from Claude
-                logger.info(
-                    "Received Claude message",
-                    message_type=claude_message.get("type") if isinstance(claude_message, dict) else type(claude_message).__name__,
-                    message_keys=list(claude_message.keys()) if isinstance(claude_message, dict) else [],
-                    has_assistant_content=bool(isinstance(claude_message, dict) and 
-                                             claude_message.get("type") == "assistant" and 
-                                             claude_message.get("message", {}).get("content")),
-                    message_preview=str(claude_message)[:200] if claude_message else "None"
-                )
-                
-                messages.append(claude_message)
-                
-                # Check if it's a final message by looking at dict structure
-                is_final = False
-                if isinstance(claude_message, dict):
-                    is_final = claude_message.get("type") == "result"
-                
-                # Stop on final message or after a reasonable number of messages
-                if is_final or len(messages) > 10:  # Safety limit for testing
-                    break
+            # Ends by itself once the process has exited, on any path out of the loop below
+            disconnect_watch = asyncio.create_task(cancel_on_disconnect(req, claude_process))
+            # aclosing() stops the CLI and releases its buffered output as soon as we stop reading
+            async with aclosing(claude_process.get_output()) as output:
+                async for claude_message in output:
+                    message_count += 1
+                    if debug_sampled():
+                        logger.debug(
+                            "Received Claude message",
+                            message_type=claude_message.get("type") if isinstance(claude_message, dict) else type(claude_message).__name__,
+                            message_keys=list(claude_message.keys()) if isinstance(claude_message, dict) else [],
+                            message_preview=str(claude_message)[:200] if claude_message else "None"
+                        )
+                    
+                    for delta in converter.convert_message(claude_message):
+                        if delta.get("content"):
+                            content_parts.append(delta["content"])
+                    
+                    # Stop on the final message
+                    if isinstance(claude_message, dict) and claude_message.get("type") == "result":
+                        break
+            disconnect_watch.cancel()
             
             # Log what we collected
             logger.info(
                 "Claude messages collected", 
-                total_messages=len(messages),
-                message_types=[msg.get("type") if isinstance(msg, dict) else type(msg).__name__ for msg in messages]
+                total_messages=message_count,
+                usage=converter.usage
             )
             
-            # Simple usage tracking without parsing Claude internals
-            usage_summary = {"total_tokens": 50, "total_cost": 0.001}
+            usage = converter.usage
             await session_manager.update_session(
                 session_id=claude_session_id,
-                tokens_used=50,
-                cost=0.001
+                tokens_used=usage["total_tokens"] if usage else estimate_tokens("".join(content_parts)),
+                cost=converter.cost
             )
             
             # Create non-streaming response
             response = create_non_streaming_response(
-                messages=messages,
+                content="".join(content_parts),
                 session_id=claude_session_id,
                 model=claude_model,
-                usage_summary=usage_summary
+                usage=usage,
+                finish_reason=converter.finish_reason
             )
             
             # Add extension fields
             response["project_id"] = project_id
+            if claude_process.resources is not None:
+                response["resources"] = claude_process.resources.as_dict()
+            metrics.observe_tokens(req, response.get("usage", {}).get("completion_tokens"))
             
-            # Log the complete response before returning
-            logger.info(
-                "Returning chat completion response",
-                response_id=response.get("id"),
-                choices_count=len(response.get("choices", [])),
-                has_choices_0=bool(response.get("choices") and len(response["choices"]) > 0),
-                choices_0_keys=list(response["choices"][0].keys()) if response.get("choices") and len(response["choices"]) > 0 else [],
-                message_keys=list(response["choices"][0]["message"].keys()) if response.get("choices") and len(response["choices"]) > 0 and "message" in response["choices"][0] else [],
-                content_length=len(response["choices"][0]["message"].get("content", "")) if response.get("choices") and len(response["choices"]) > 0 and "message" in response["choices"][0] else 0,
-                full_response_keys=list(response.keys()),
-                response_size=len(str(response))
-            )
+            if debug_sampled():
+                logger.debug(
+                    "Returning chat completion response",
+                    response_id=response["id"],
+                    finish_reason=response["choices"][0]["finish_reason"],
+                    content_length=len(response["choices"][0]["message"]["content"]),
+                    full_response_keys=list(response.keys())
+                )
             
             return response
     
@@ -339,7 +383,8 @@ async def get_completion_status(
         "updated_at": session_info.updated_at.isoformat(),
         "total_tokens": session_info.total_tokens,
         "total_cost": session_info.total_cost,
-        "message_count": session_info.message_count
+        "message_count": session_info.message_count,
+        "resources": claude_process.resources.as_dict() if claude_process and claude_process.resources else None
     }
 
 
@@ -400,15 +445,15 @@ async def stop_completion(
     session_manager: SessionManager = req.app.state.session_manager
     claude_manager = req.app.state.claude_manager
     
-    # Stop Claude process
-    await claude_manager.stop_session(session_id)
+    # Stop the running execution, including any processes its tools started
+    stopped = await claude_manager.stop_session(session_id)
     
     # End session
     await session_manager.end_session(session_id)
     
-    logger.info("Chat completion stopped", session_id=session_id)
+    logger.info("Chat completion stopped", session_id=session_id, was_running=stopped)
     
     return {
         "session_id": session_id,
-        "status": "stopped"
+        "status": "stopped" if stopped else "not_running"
     }
@@ -15,12 +15,53 @@ from claude_code_api.models.openai import (
     PaginationInfo
 )
 from claude_code_api.core.database import db_manager, Project
-from claude_code_api.core.claude_manager import create_project_directory, cleanup_project_directory
+from claude_code_api.core.claude_manager import create_project_directory
+from claude_code_api.core.workspace import WorkspaceManager
 
 logger = structlog.get_logger()
 router = APIRouter()
 
 
+async def provision_workspace(workspace_manager: WorkspaceManager, project_id: str, template: str) -> str:
+    """Create (or reopen) a project directory from a workspace template, mapping failures to API errors."""
+    try:
+        return await workspace_manager.provision(project_id, template)
+    except KeyError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail={
+                "error": {
+                    "message": f"Unknown workspace template {template}",
+                    "type": "invalid_request_error",
+                    "code": "unknown_template"
+                }
+            }
+        )
+    except FileExistsError as e:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail={
+                "error": {
+                    "message": str(e),
+                    "type": "invalid_request_error",
+                    "code": "project_exists"
+                }
+            }
+        )
+    except OSError as e:
+        logger.error("Failed to provision workspace", project_id=project_id, template=template, error=str(e))
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail={
+                "error": {
+                    "message": f"Failed to create workspace: {str(e)}",
+                    "type": "internal_error",
+                    "code": "workspace_creation_failed"
+                }
+            }
+        )
+
+
 @router.get("/projects", response_model=PaginatedResponse)
 async def list_projects(
     page: int = 1,
@@ -68,7 +109,9 @@ async def create_project(
     project_id = str(uuid.uuid4())
     
     # Create project directory
-    if project_request.path:
+    if project_request.template:
+        project_path = await provision_workspace(req.app.state.workspace_manager, project_id, project_request.template)
+    elif project_request.path:
         project_path = project_request.path
         os.makedirs(project_path, exist_ok=True)
     else:
@@ -158,8 +201,22 @@ async def delete_project(project_id: str, req: Request) -> JSONResponse:
             }
         )
     
-    # TODO: Implement project deletion in database
-    # cleanup_project_directory(project.path)
+    project_storage = req.app.state.project_storage
+    if project_storage.in_use(project.path):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail={
+                "error": {
+                    "message": f"Project {project_id} has a Claude execution in progress",
+                    "type": "invalid_request_error",
+                    "code": "project_in_use"
+                }
+            }
+        )
+    
+    await db_manager.delete_project(project_id)
+    # The directory is moved aside here and deleted in the background
+    await project_storage.reclaim(project.path)
     
     logger.info("Project deleted", project_id=project_id)
     
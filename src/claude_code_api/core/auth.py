@@ -95,19 +95,42 @@ def validate_api_key(api_key: str) -> bool:
     return api_key in settings.api_keys
 
 
-async def auth_middleware(request: Request, call_next):
-    """Authentication middleware."""
+class AuthMiddleware:
+    """
+    Pure ASGI authentication middleware.
+
+    Unlike a function middleware it hands the client's ``receive`` channel to the endpoint untouched,
+    so handlers can notice a disconnected client (Request.is_disconnected) while Claude is still running.
+    """
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        rejection = authenticate(Request(scope))
+        if rejection is not None:
+            await rejection(scope, receive, send)
+            return
+        await self.app(scope, receive, send)
+
+
+def authenticate(request: Request) -> Optional[JSONResponse]:
+    """Check the API key and rate limit; returns the error response, or None to let the request through."""
     # Skip auth for public endpoints
-    public_paths = ["/", "/health", "/docs", "/redoc", "/openapi.json"]
+    public_paths = ["/", "/health", "/metrics", "/docs", "/redoc", "/openapi.json"]
     if request.url.path in public_paths:
-        return await call_next(request)
+        return None
     
     # Skip all auth and rate limiting when authentication is disabled (test mode)
     if not settings.require_auth:
         # Still set client_id for logging
         request.state.api_key = None
         request.state.client_id = "testclient"
-        return await call_next(request)
+        return None
     
     # Extract API key
     api_key = extract_api_key(request)
@@ -171,4 +194,4 @@ async def auth_middleware(request: Request, call_next):
     request.state.api_key = api_key
     request.state.client_id = client_id
     
-    return await call_next(request)
+    return None
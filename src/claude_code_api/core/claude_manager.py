@@ -3,18 +3,32 @@
 import asyncio
 import json
 import os
+import signal
 import subprocess
 import tempfile
+import time
 import uuid
 from pathlib import Path
-from typing import Optional, Dict, List, AsyncGenerator, Any
+from typing import Optional, Dict, List, AsyncGenerator, Any, Set
 import structlog
 
+from . import metrics
 from .config import settings
+from .log import debug_sampled
+from .resources import ResourceUsage, sampler as resource_sampler
+from ..utils.parser import decode_message
 
 logger = structlog.get_logger()
 
 
+# Bytes requested from the CLI's stdout per read
+READ_CHUNK_BYTES = 64 * 1024
+# Trailing stderr kept for error reports; the rest is read and discarded so the pipe never fills up
+STDERR_TAIL_BYTES = 64 * 1024
+# Tools whose file_path (or notebook_path) input is a file the CLI writes to
+EDIT_TOOLS = frozenset({"Write", "Edit", "MultiEdit", "NotebookEdit"})
+
+
 class ClaudeProcess:
     """Manages a single Claude Code process."""
     
@@ -23,17 +37,35 @@ class ClaudeProcess:
         self.project_path = project_path
         self.process: Optional[asyncio.subprocess.Process] = None
         self.is_running = False
-        self.output_queue = asyncio.Queue()
-        self.error_queue = asyncio.Queue()
+        # Items are (message, size) pairs; a full queue stops the stdout reader, which backs up into the pipe
+        self.output_queue = asyncio.Queue(maxsize=max(1, settings.claude_output_queue_size))
+        self.error_queue = asyncio.Queue(maxsize=2)
+        self.output_bytes = 0
+        self.buffered_bytes = 0
+        self.truncated = False
+        self._started = asyncio.Event()
+        self._messages_queued = 0
+        self._stdout_task: Optional[asyncio.Task] = None
+        self._stderr_task: Optional[asyncio.Task] = None
+        self._stderr_tail = bytearray()
+        # Files the CLI's editing tools wrote to, for incremental disk accounting
+        self.touched_paths: Set[str] = set()
+        self.finished = asyncio.Event()
+        # The CLI runs in its own process group so tools' child processes can be stopped with it
+        self.pgid: Optional[int] = None
+        self.resources: Optional[ResourceUsage] = None
+        self.cancel_reason: Optional[str] = None
         
     async def start(
         self, 
         prompt: str, 
         model: str = None,
         system_prompt: str = None,
-        resume_session: str = None
+        resume_session: str = None,
+        partial_messages: bool = False,
+        cwd: str = None
     ) -> bool:
-        """Start Claude Code process and wait for completion."""
+        """Start the Claude Code process and return once it has produced its first message (or exited)."""
         try:
             # Prepare real command - using exact format from working Claudia example
             cmd = [settings.claude_binary_path]
@@ -51,6 +83,8 @@ class ClaudeProcess:
                 "--verbose", 
                 "--dangerously-skip-permissions"
             ])
+            if partial_messages:
+                cmd.append("--include-partial-messages")
             
             logger.info(
                 "Starting Claude process",
@@ -59,63 +93,35 @@ class ClaudeProcess:
                 model=model or settings.default_model
             )
             
-            # Start process from src directory (where Claude works without API key)
-            src_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
-            logger.info(f"Starting Claude from directory: {src_dir}")
-            logger.info(f"Command: {' '.join(cmd)}")
+            # Start process from src directory (where Claude works without API key) unless given a workspace
+            cwd = cwd or os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+            if debug_sampled():
+                logger.debug("Claude command", cwd=cwd, command=" ".join(cmd))
             
-            # Claude CLI runs to completion, so we run it and capture all output
             self.process = await asyncio.create_subprocess_exec(
                 *cmd,
-                cwd=src_dir,
+                cwd=cwd,
                 stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
+                stderr=asyncio.subprocess.PIPE,
+                start_new_session=hasattr(os, "killpg")
             )
+            self.is_running = True
+            self.resources = ResourceUsage()
+            if hasattr(os, "killpg"):
+                self.pgid = self.process.pid
+                resource_sampler.track(self.pgid, self.resources)
             
-            # Wait for process to complete and capture all output
-            stdout, stderr = await self.process.communicate()
-            
-            logger.info(
-                "Claude process completed",
-                session_id=self.session_id,
-                return_code=self.process.returncode,
-                stdout_length=len(stdout) if stdout else 0,
-                stderr_length=len(stderr) if stderr else 0,
-                stderr_preview=stderr.decode()[:200] if stderr else "empty",
-                stdout_preview=stdout.decode()[:200] if stdout else "empty"
-            )
+            # Output is consumed as it is produced instead of collecting the whole run in memory
+            self._stderr_task = asyncio.create_task(self._drain_stderr())
+            self._stdout_task = asyncio.create_task(self._pump_stdout())
+            await self._started.wait()
             
-            if self.process.returncode == 0:
-                # Parse the output lines and put them in the queue
-                output_lines = stdout.decode().strip().split('\n')
-                claude_session_id = None
-                
-                for line in output_lines:
-                    if line.strip():
-                        try:
-                            data = json.loads(line)
-                            # Extract Claude's session ID from the first message
-                            if not claude_session_id and data.get("session_id"):
-                                claude_session_id = data["session_id"]
-                                logger.info(f"Extracted Claude session ID: {claude_session_id}")
-                                # Update our session_id to match Claude's
-                                self.session_id = claude_session_id
-                            await self.output_queue.put(data)
-                        except json.JSONDecodeError:
-                            # Handle non-JSON output
-                            await self.output_queue.put({"type": "text", "content": line})
-                
-                # Signal end of output
-                await self.output_queue.put(None)
-                self.is_running = False
-                return True
-            else:
-                # Handle error
-                error_text = stderr.decode().strip()
+            if self._messages_queued == 0 and self.process.returncode:
+                error_text = self._stderr_tail.decode(errors="replace").strip()
                 logger.error(f"Claude process failed with exit code {self.process.returncode}: {error_text}")
-                await self.error_queue.put(error_text)
-                await self.error_queue.put(None)
+                self._put_error(error_text)
                 return False
+            return True
             
         except Exception as e:
             logger.error(
@@ -125,35 +131,201 @@ class ClaudeProcess:
             )
             return False
     
+    async def _drain_stderr(self):
+        """Read stderr to the end, keeping only its tail."""
+        try:
+            while True:
+                chunk = await self.process.stderr.read(READ_CHUNK_BYTES)
+                if not chunk:
+                    break
+                self._stderr_tail += chunk
+                if len(self._stderr_tail) > STDERR_TAIL_BYTES:
+                    del self._stderr_tail[:-STDERR_TAIL_BYTES]
+        except Exception as e:
+            logger.warning("Error reading Claude stderr", session_id=self.session_id, error=str(e))
     
-    async def get_output(self) -> AsyncGenerator[Dict[str, Any], None]:
-        """Get output from Claude process."""
-        while True:
-            try:
-                # Wait for output with timeout
-                output = await asyncio.wait_for(
-                    self.output_queue.get(),
-                    timeout=settings.streaming_timeout_seconds
-                )
-                
-                if output is None:  # End signal
+    async def _pump_stdout(self):
+        """Split stdout into stream-json lines and queue them, dropping lines over claude_max_line_bytes."""
+        max_line = settings.claude_max_line_bytes
+        pending = bytearray()
+        dropping = False  # inside an oversized line
+        dropped = 0  # bytes of that line discarded so far
+        cancelled = False
+        try:
+            while True:
+                chunk = await self.process.stdout.read(READ_CHUNK_BYTES)
+                if not chunk:
                     break
-                    
-                yield output
-                
-            except asyncio.TimeoutError:
-                logger.warning(
-                    "Output timeout",
-                    session_id=self.session_id
-                )
-                break
-            except Exception as e:
+                start = 0
+                while start < len(chunk):
+                    end = chunk.find(b"\n", start)
+                    piece = chunk[start:] if end < 0 else chunk[start:end]
+                    start = len(chunk) if end < 0 else end + 1
+                    if not dropping and len(pending) + len(piece) > max_line:
+                        dropping = True
+                        dropped = len(pending)
+                        pending.clear()
+                    if dropping:
+                        dropped += len(piece)
+                    else:
+                        pending += piece
+                    if end < 0:
+                        continue
+                    if dropping:
+                        await self._queue_truncation("line", dropped)
+                        dropping = False
+                        dropped = 0
+                    else:
+                        await self._queue_line(bytes(pending))
+                        pending.clear()
+            if dropping:
+                await self._queue_truncation("line", dropped)
+            elif pending:
+                await self._queue_line(bytes(pending))
+            
+            # The CLI is exiting; read its counters while they are still there
+            await resource_sampler.sample_now(self.pgid)
+            await self.process.wait()
+            if self._stderr_task is not None:
+                await self._stderr_task
+            logger.info(
+                "Claude process completed",
+                session_id=self.session_id,
+                return_code=self.process.returncode,
+                output_bytes=self.output_bytes,
+                truncated=self.truncated,
+                stderr_preview=self._stderr_tail[-200:].decode(errors="replace") or "empty"
+            )
+            if self.process.returncode and self._messages_queued:
+                # Failures after some output still reach the client through the messages already sent
                 logger.error(
-                    "Error getting output",
-                    session_id=self.session_id,
-                    error=str(e)
+                    f"Claude process failed with exit code {self.process.returncode}",
+                    session_id=self.session_id
                 )
-                break
+                self._put_error(self._stderr_tail.decode(errors="replace").strip())
+        except asyncio.CancelledError:
+            cancelled = True
+            raise
+        except Exception as e:
+            logger.error("Error reading Claude output", session_id=self.session_id, error=str(e))
+        finally:
+            self.is_running = False
+            self._started.set()
+            if self.process is not None and self.process.returncode is not None:
+                self._finish()  # otherwise stop() does once the process is gone
+            if not cancelled:
+                # End signal, queued behind the output like any other message
+                await self.output_queue.put(None)
+            else:
+                # stop() cancelled us and must not wait for a reader that may be gone; make room if needed
+                if self.output_queue.full():
+                    item = self.output_queue.get_nowait()
+                    if item is not None:
+                        self.buffered_bytes -= item[1]
+                        metrics.add_buffered_bytes(-item[1])
+                self.output_queue.put_nowait(None)
+    
+    async def _queue_line(self, raw: bytes):
+        """Parse one stream-json line and queue it, applying the tool result and per-execution caps."""
+        line = raw.strip()
+        if not line:
+            return
+        size = len(line)
+        try:
+            data = decode_message(line)
+        except json.JSONDecodeError:
+            # Handle non-JSON output
+            data = {"type": "text", "content": line.decode(errors="replace")}
+        if not isinstance(data, dict):
+            data = {"type": "text", "content": line.decode(errors="replace")}
+        
+        # Extract Claude's session ID from the first message
+        if self._messages_queued == 0 and data.get("session_id"):
+            logger.debug("Extracted Claude session ID", claude_session_id=data["session_id"])
+            # Update our session_id to match Claude's
+            self.session_id = data["session_id"]
+        
+        if data.get("type") == "user":
+            size -= _truncate_tool_results(data, settings.claude_max_tool_result_chars)
+        elif data.get("type") == "assistant":
+            _collect_edited_paths(data, self.touched_paths)
+        
+        self.output_bytes += size
+        if self.output_bytes > settings.claude_max_output_bytes and data.get("type") != "result":
+            # The final result (with usage) is still passed on so the client gets a proper ending
+            if not self.truncated:
+                self.truncated = True
+                await self._queue_truncation("execution", settings.claude_max_output_bytes)
+            return
+        await self._put(data, size)
+    
+    async def _queue_truncation(self, kind: str, size: int):
+        """Queue a marker telling the client that output was left out."""
+        metrics.OUTPUT_TRUNCATIONS.inc(kind=kind)
+        logger.warning("Claude output truncated", session_id=self.session_id, kind=kind, bytes=size)
+        await self._put({"type": "system", "subtype": "output_truncated", "reason": kind, "bytes": size}, 0)
+    
+    async def _put(self, data: Dict[str, Any], size: int):
+        """Queue a message, waiting while the consumer is behind."""
+        await self.output_queue.put((data, size))
+        self.buffered_bytes += size
+        metrics.add_buffered_bytes(size)
+        self._messages_queued += 1
+        self._started.set()
+    
+    def _put_error(self, error_text: str):
+        """Record a failure for readers of error_queue."""
+        for item in (error_text, None):
+            if not self.error_queue.full():
+                self.error_queue.put_nowait(item)
+    
+    async def get_output(self) -> AsyncGenerator[Dict[str, Any], None]:
+        """Get output from Claude process; stops the process if the consumer leaves early."""
+        try:
+            while True:
+                try:
+                    # Wait for output with timeout
+                    item = await asyncio.wait_for(
+                        self.output_queue.get(),
+                        timeout=settings.streaming_timeout_seconds
+                    )
+                    
+                    if item is None:  # End signal
+                        break
+                    
+                    output, size = item
+                    self.buffered_bytes -= size
+                    metrics.add_buffered_bytes(-size)
+                    yield output
+                    
+                except asyncio.TimeoutError:
+                    logger.warning(
+                        "Output timeout",
+                        session_id=self.session_id
+                    )
+                    break
+                except Exception as e:
+                    logger.error(
+                        "Error getting output",
+                        session_id=self.session_id,
+                        error=str(e)
+                    )
+                    break
+        finally:
+            if self._stdout_task is not None and not self._stdout_task.done():
+                await self.stop()
+            elif self.process is not None and self.process.returncode is None:
+                await self.stop()  # the reader failed but the CLI is still running
+            else:
+                self._release_buffered()
+    
+    def _release_buffered(self):
+        """Drop messages nobody will read and return their bytes to the buffered total."""
+        while not self.output_queue.empty():
+            item = self.output_queue.get_nowait()
+            if item is not None:
+                self.buffered_bytes -= item[1]
+                metrics.add_buffered_bytes(-item[1])
     
     async def send_input(self, text: str):
         """Send input to Claude process."""
@@ -168,42 +340,59 @@ class ClaudeProcess:
                     error=str(e)
                 )
     
-    async def _start_mock_process(self, prompt: str, model: str):
-        """Start mock process for testing."""
-        self.is_running = True
-        
-        # Create mock Claude response
-        mock_response = {
-            "type": "result",
-            "sessionId": self.session_id,
-            "model": model or "claude-3-5-haiku-20241022",
-            "message": {
-                "role": "assistant", 
-                "content": f"Hello! You said: '{prompt}'. This is a mock response from Claude Code API Gateway."
-            },
-            "usage": {
-                "input_tokens": len(prompt.split()),
-                "output_tokens": 15,
-                "total_tokens": len(prompt.split()) + 15
-            },
-            "cost_usd": 0.001,
-            "duration_ms": 100
-        }
-        
-        # Put the response in the queue
-        await self.output_queue.put(mock_response)
-        await self.output_queue.put(None)  # End signal
+    def _signal_group(self, sig: int):
+        """Send ``sig`` to the CLI's process group (or to the CLI alone where there are no process groups)."""
+        try:
+            if self.pgid is not None:
+                os.killpg(self.pgid, sig)
+            elif self.process is not None and self.process.returncode is None:
+                self.process.send_signal(sig)
+        except (ProcessLookupError, PermissionError):
+            pass
+    
+    def _finish(self):
+        """Record the end of the execution once the CLI has exited; runs once."""
+        if self.finished.is_set():
+            return
+        if self.resources is not None:
+            self.resources.ended = time.monotonic()
+        resource_sampler.untrack(self.pgid)
+        # Background processes left behind by tools have nobody to manage them anymore
+        self._signal_group(signal.SIGTERM)
+        self.finished.set()
+    
+    async def cancel(self, reason: str) -> bool:
+        """Stop a running execution early (``reason`` is e.g. "request" or "disconnect"); False if it had ended."""
+        if self.finished.is_set():
+            return False
+        self.cancel_reason = reason
+        metrics.EXECUTIONS_CANCELLED.inc(reason=reason)
+        logger.info("Cancelling Claude execution", session_id=self.session_id, reason=reason)
+        await self.stop()
+        return True
     
     async def stop(self):
-        """Stop Claude process."""
+        """Stop Claude process along with everything it started in its process group."""
         self.is_running = False
+        # Signalled before the first await, so the execution ends even if this coroutine is interrupted
+        if self.process is not None and self.process.returncode is None:
+            self._signal_group(signal.SIGTERM)
+        await resource_sampler.sample_now(self.pgid)
+        
+        for task in (self._stdout_task, self._stderr_task):
+            if task is not None and not task.done():
+                task.cancel()
+                try:
+                    await task
+                except (asyncio.CancelledError, Exception):
+                    pass
+        self._release_buffered()
         
         if self.process:
             try:
-                self.process.terminate()
                 await asyncio.wait_for(self.process.wait(), timeout=5.0)
             except asyncio.TimeoutError:
-                self.process.kill()
+                self._signal_group(signal.SIGKILL)
                 await self.process.wait()
             except Exception as e:
                 logger.error(
@@ -212,7 +401,11 @@ class ClaudeProcess:
                     error=str(e)
                 )
             finally:
+                # Tool processes that outlived the CLI or ignored SIGTERM
+                self._signal_group(signal.SIGKILL)
+                self._finish()
                 self.process = None
+        self.finished.set()
         
         logger.info(
             "Claude process stopped",
@@ -220,12 +413,52 @@ class ClaudeProcess:
         )
 
 
+def _truncate_tool_results(data: Dict[str, Any], limit: int) -> int:
+    """Cut tool_result contents in a user message down to ``limit`` characters; returns the characters removed."""
+    content = (data.get("message") or {}).get("content")
+    if not isinstance(content, list):
+        return 0
+    removed = 0
+    for part in content:
+        if not isinstance(part, dict) or part.get("type") != "tool_result":
+            continue
+        value = part.get("content")
+        if isinstance(value, str) and len(value) > limit:
+            removed += len(value) - limit
+            part["content"] = value[:limit] + f"\n[... truncated {len(value) - limit} characters]"
+        elif isinstance(value, list):
+            for item in value:
+                text = item.get("text") if isinstance(item, dict) else None
+                if isinstance(text, str) and len(text) > limit:
+                    removed += len(text) - limit
+                    item["text"] = text[:limit] + f"\n[... truncated {len(text) - limit} characters]"
+    if removed:
+        metrics.OUTPUT_TRUNCATIONS.inc(kind="tool_result")
+    return removed
+
+
+def _collect_edited_paths(data: Dict[str, Any], paths: Set[str]):
+    """Add the files targeted by editing tool calls in an assistant message to ``paths``."""
+    content = (data.get("message") or {}).get("content")
+    if not isinstance(content, list):
+        return
+    for part in content:
+        if isinstance(part, dict) and part.get("type") == "tool_use" and part.get("name") in EDIT_TOOLS:
+            tool_input = part.get("input") or {}
+            path = tool_input.get("file_path") or tool_input.get("notebook_path")
+            if isinstance(path, str):
+                paths.add(path)
+
+
 class ClaudeManager:
     """Manages multiple Claude Code processes."""
     
     def __init__(self):
+        # Running executions by Claude session ID; each removes itself when its process has exited
         self.processes: Dict[str, ClaudeProcess] = {}
         self.max_concurrent = settings.max_concurrent_sessions
+        self._starting = 0
+        self._watchers: Set[asyncio.Task] = set()
     
     async def get_version(self) -> str:
         """Get Claude Code version."""
@@ -258,11 +491,13 @@ class ClaudeManager:
         prompt: str,
         model: str = None,
         system_prompt: str = None,
-        resume_session: str = None
+        resume_session: str = None,
+        partial_messages: bool = False,
+        cwd: str = None
     ) -> ClaudeProcess:
         """Create new Claude session."""
-        # Check concurrent session limit
-        if len(self.processes) >= self.max_concurrent:
+        # Check concurrent session limit (executions still starting hold a slot too)
+        if len(self.processes) + self._starting >= self.max_concurrent:
             raise Exception(f"Maximum concurrent sessions ({self.max_concurrent}) reached")
         
         # Ensure project directory exists
@@ -272,18 +507,23 @@ class ClaudeManager:
         process = ClaudeProcess(session_id, project_path)
         
         # Start process
-        success = await process.start(
-            prompt=prompt,
-            model=model or settings.default_model,
-            system_prompt=system_prompt,
-            resume_session=resume_session
-        )
+        self._starting += 1
+        try:
+            success = await process.start(
+                prompt=prompt,
+                model=model or settings.default_model,
+                system_prompt=system_prompt,
+                resume_session=resume_session,
+                partial_messages=partial_messages,
+                cwd=cwd
+            )
+        finally:
+            self._starting -= 1
         
         if not success:
             raise Exception("Failed to start Claude process")
         
-        # Don't store processes since Claude CLI completes immediately
-        # This prevents the "max concurrent sessions" error
+        self._register(process, model or settings.default_model)
         
         logger.info(
             "Claude session created",
@@ -293,27 +533,55 @@ class ClaudeManager:
         
         return process
     
+    def _register(self, process: ClaudeProcess, model: str):
+        """Track a running execution until its process exits."""
+        self.processes[process.session_id] = process
+        metrics.ACTIVE_EXECUTIONS.set(len(self.processes))
+        task = asyncio.create_task(self._unregister_when_finished(process, process.session_id, model))
+        self._watchers.add(task)
+        task.add_done_callback(self._watchers.discard)
+    
+    async def _unregister_when_finished(self, process: ClaudeProcess, session_id: str, model: str):
+        await process.finished.wait()
+        if self.processes.get(session_id) is process:
+            del self.processes[session_id]
+        metrics.ACTIVE_EXECUTIONS.set(len(self.processes))
+        
+        resources = process.resources
+        if resources is not None and resources.cpu_seconds is not None:
+            metrics.EXECUTION_CPU.observe(resources.cpu_seconds, model=model)
+            metrics.EXECUTION_PEAK_RSS.observe(resources.peak_rss_bytes, model=model)
+        logger.info(
+            "Claude execution finished",
+            session_id=session_id,
+            cancelled=process.cancel_reason,
+            **(resources.as_dict() if resources is not None else {})
+        )
+    
     async def get_session(self, session_id: str) -> Optional[ClaudeProcess]:
         """Get existing Claude session."""
         return self.processes.get(session_id)
     
-    async def stop_session(self, session_id: str):
-        """Stop Claude session."""
-        if session_id in self.processes:
-            process = self.processes[session_id]
-            await process.stop()
-            del self.processes[session_id]
-            
-            logger.info(
-                "Claude session stopped",
-                session_id=session_id,
-                active_sessions=len(self.processes)
-            )
+    async def stop_session(self, session_id: str, reason: str = "request") -> bool:
+        """Stop a running execution and the processes it started; False if none is running for session_id."""
+        process = self.processes.get(session_id)
+        if process is None:
+            return False
+        await process.cancel(reason)
+        
+        logger.info(
+            "Claude session stopped",
+            session_id=session_id,
+            active_sessions=len(self.processes)
+        )
+        return True
     
     async def cleanup_all(self):
         """Stop all Claude sessions."""
         for session_id in list(self.processes.keys()):
-            await self.stop_session(session_id)
+            await self.stop_session(session_id, reason="shutdown")
+        for task in list(self._watchers):
+            task.cancel()
         
         logger.info("All Claude sessions cleaned up")
     
@@ -2,7 +2,7 @@
 
 import os
 import shutil
-from typing import List, Union
+from typing import Dict, List, Union
 from pydantic import Field, field_validator
 from pydantic_settings import BaseSettings
 
@@ -80,11 +80,35 @@ class Settings(BaseSettings):
     default_model: str = "claude-3-5-sonnet-20241022"
     max_concurrent_sessions: int = 10
     session_timeout_minutes: int = 30
+    # Stream-json messages queued per execution; when full the CLI's stdout is left unread until the client catches up
+    claude_output_queue_size: int = 64
+    # Output kept per execution; past this only the final result message is passed on
+    claude_max_output_bytes: int = 64 * 1024 * 1024
+    # Single stream-json lines longer than this are dropped and replaced by a truncation marker
+    claude_max_line_bytes: int = 16 * 1024 * 1024
+    # Tool results longer than this are cut, with a note saying how much was left out
+    claude_max_tool_result_chars: int = 256 * 1024
+    # Ask the CLI for partial assistant messages on streaming requests so text arrives as it is generated
+    claude_partial_messages: bool = True
+    # Interval at which CPU time and memory of running executions are read from /proc
+    claude_resource_sample_seconds: float = 1.0
     
     # Project Configuration
     project_root: str = "/tmp/claude_projects"
+    # Disk use per project above which new executions are refused (0 disables the quota)
     max_project_size_mb: int = 1000
+    # How often expired projects are looked for and disk usage is fully recounted
     cleanup_interval_minutes: int = 60
+    # Projects under project_root idle for longer than this are deleted in the background (0 keeps them)
+    project_ttl_hours: float = 0.0
+    # Deletion speed for removed projects, so reclaiming a large tree does not starve the disk
+    project_reclaim_files_per_second: int = 5000
+    # Named directories projects can be created from, as JSON: {"backend": "/srv/checkouts/backend"}
+    workspace_templates: Dict[str, str] = Field(default_factory=dict)
+    # auto (overlay mount, else reflink, else copy), overlay, reflink, hardlink or copy
+    workspace_clone_method: str = "auto"
+    # Clones per template prepared ahead of time when the method has to walk the tree
+    workspace_pool_size: int = 2
     
     # Database Configuration
     database_url: str = "sqlite:///./claude_api.db"
@@ -92,6 +116,10 @@ class Settings(BaseSettings):
     # Logging Configuration
     log_level: str = "INFO"
     log_format: str = "json"
+    # Records waiting for the log writer thread; past this they are dropped rather than blocking requests
+    log_queue_size: int = 10000
+    # Share of requests whose per-request debug logs are written when LOG_LEVEL=DEBUG
+    log_debug_sample_rate: float = 0.1
     
     # CORS Configuration
     allowed_origins: List[str] = Field(default=["*"])
@@ -111,6 +139,8 @@ class Settings(BaseSettings):
     # Streaming Configuration
     streaming_chunk_size: int = 1024
     streaming_timeout_seconds: int = 300
+    # Idle seconds before an SSE comment is sent to keep proxies and clients from timing out (0 disables)
+    streaming_heartbeat_seconds: float = 15.0
     
     class Config:
         env_file = ".env"
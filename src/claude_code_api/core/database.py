@@ -149,6 +149,17 @@ class DatabaseManager:
             await session.refresh(project)
             return project
     
+    @staticmethod
+    async def delete_project(project_id: str) -> bool:
+        """Delete project along with its sessions and messages."""
+        async with AsyncSessionLocal() as session:
+            project = await session.get(Project, project_id)
+            if project is None:
+                return False
+            await session.delete(project)
+            await session.commit()
+            return True
+    
     @staticmethod
     async def get_session(session_id: str) -> Optional[Session]:
         """Get session by ID."""
@@ -0,0 +1,116 @@
+"""Logging setup: structlog events rendered and written by a background thread."""
+
+import atexit
+import logging
+import queue
+import random
+import sys
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+
+import structlog
+
+from .config import settings
+from . import metrics
+
+# Whether the current request was picked for debug logging; decided on first use within the request
+_debug_sampled: ContextVar[Optional[bool]] = ContextVar("debug_sampled", default=None)
+_listener: Optional[QueueListener] = None
+
+
+class _DroppingQueueHandler(QueueHandler):
+    """Queue handler that hands records over untouched and drops them when the queue is full."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """Leave rendering to the listener thread."""
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        """Queue the record without waiting."""
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            metrics.LOG_RECORDS_DROPPED.inc()
+
+
+def configure_logging() -> None:
+    """
+    Route structlog through the standard library at settings.log_level.
+
+    Callers only build the event dict and queue it; rendering to JSON (or console output) and writing
+    to stderr happen on a QueueListener thread, so slow terminals or pipes never stall a request.
+    """
+    global _listener
+
+    renderer = (
+        structlog.processors.JSONRenderer()
+        if settings.log_format == "json"
+        else structlog.dev.ConsoleRenderer(colors=False)
+    )
+    structlog.configure(
+        processors=[
+            structlog.stdlib.filter_by_level,
+            structlog.stdlib.add_logger_name,
+            structlog.stdlib.add_log_level,
+            structlog.stdlib.PositionalArgumentsFormatter(),
+            structlog.processors.TimeStamper(fmt="iso"),
+            structlog.processors.StackInfoRenderer(),
+            structlog.processors.format_exc_info,
+            structlog.processors.UnicodeDecoder(),
+            structlog.stdlib.ProcessorFormatter.wrap_for_formatter,
+        ],
+        context_class=dict,
+        logger_factory=structlog.stdlib.LoggerFactory(),
+        wrapper_class=structlog.stdlib.BoundLogger,
+        cache_logger_on_first_use=True,
+    )
+
+    output = logging.StreamHandler(sys.stderr)
+    output.setFormatter(structlog.stdlib.ProcessorFormatter(
+        processors=[structlog.stdlib.ProcessorFormatter.remove_processors_meta, renderer],
+        # Records from plain logging calls (libraries) are rendered the same way
+        foreign_pre_chain=[
+            structlog.stdlib.add_logger_name,
+            structlog.stdlib.add_log_level,
+            structlog.processors.TimeStamper(fmt="iso"),
+        ],
+    ))
+
+    if _listener is not None:
+        _listener.stop()
+    records = queue.Queue(maxsize=max(1, settings.log_queue_size))
+    _listener = QueueListener(records, output)
+    _listener.start()
+
+    root = logging.getLogger()
+    for handler in [h for h in root.handlers if isinstance(h, _DroppingQueueHandler)]:
+        root.removeHandler(handler)
+    root.addHandler(_DroppingQueueHandler(records))
+    root.setLevel(settings.log_level.upper())
+
+
+def stop_logging() -> None:
+    """Write out queued records and stop the writer thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def debug_sampled() -> bool:
+    """
+    True when debug logging is enabled and the current request is one of the sampled ones.
+
+    Guard verbose per-request logging with it so the arguments are not even built otherwise.
+    """
+    if not logging.getLogger().isEnabledFor(logging.DEBUG):
+        return False
+    sampled = _debug_sampled.get()
+    if sampled is None:
+        sampled = random.random() < settings.log_debug_sample_rate
+        _debug_sampled.set(sampled)
+    return sampled
+
+
+atexit.register(stop_logging)
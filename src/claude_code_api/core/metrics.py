@@ -0,0 +1,323 @@
+"""Prometheus-style metrics for the gateway."""
+
+import bisect
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+LATENCY_BUCKETS: Tuple[float, ...] = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0,
+)
+TOKEN_BUCKETS: Tuple[float, ...] = (16, 64, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768, 65536)
+MEMORY_BUCKETS: Tuple[float, ...] = tuple(float(2 ** power) for power in range(24, 34))  # 16 MiB to 8 GiB
+
+# Model names come from clients, so the number of series per metric is capped
+MAX_SERIES_PER_METRIC = 512
+OVERFLOW_LABEL = "other"
+
+_lock = threading.Lock()
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == int(value):
+        return str(int(value))
+    return repr(float(value))
+
+
+class Metric:
+    """Base class holding the metric name, help text and label names."""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.label_names: Tuple[str, ...] = tuple(labels)
+
+    def _key(self, labels: Dict[str, str], series: dict) -> Tuple[str, ...]:
+        key = tuple(str(labels.get(n, "") or "") for n in self.label_names)
+        if key not in series and len(series) >= MAX_SERIES_PER_METRIC:
+            key = tuple(OVERFLOW_LABEL for _ in self.label_names)
+        return key
+
+    def header(self) -> List[str]:
+        """Return the HELP/TYPE lines."""
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+    def render(self) -> List[str]:
+        """Return the exposition lines for this metric."""
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    """Monotonic counter."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: Iterable[str] = ()):
+        super().__init__(name, help_text, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        """Add ``amount`` to the series selected by ``labels``."""
+        with _lock:
+            key = self._key(labels, self._values)
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        with _lock:
+            items = list(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}")
+        return lines
+
+
+class Gauge(Counter):
+    """Value that can go up and down."""
+
+    kind = "gauge"
+
+    def dec(self, amount: float = 1.0, **labels: str) -> None:
+        """Subtract ``amount`` from the series selected by ``labels``."""
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels: str) -> None:
+        """Set the series selected by ``labels`` to ``value``."""
+        with _lock:
+            key = self._key(labels, self._values)
+            self._values[key] = value
+
+
+class Histogram(Metric):
+    """Cumulative histogram with fixed buckets."""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labels: Iterable[str] = (),
+        buckets: Tuple[float, ...] = LATENCY_BUCKETS,
+    ):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        """Record one observation."""
+        idx = bisect.bisect_left(self.buckets, value)
+        with _lock:
+            key = self._key(labels, self._series)
+            row = self._series.get(key)
+            if row is None:
+                # one slot per bucket, one for +Inf, and the running sum
+                row = [0.0] * (len(self.buckets) + 2)
+                self._series[key] = row
+            row[idx] += 1
+            row[-1] += value
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        with _lock:
+            items = [(k, list(v)) for k, v in self._series.items()]
+        for key, row in items:
+            cumulative = 0.0
+            for bound, count in zip(self.buckets, row):
+                cumulative += count
+                le = 'le="%s"' % _format_value(bound)
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, le)} {_format_value(cumulative)}")
+            cumulative += row[len(self.buckets)]
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, le)} {_format_value(cumulative)}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, key)} {repr(float(row[-1]))}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, key)} {_format_value(cumulative)}")
+        return lines
+
+
+registry: List[Metric] = []
+
+
+def register(metric: Metric) -> Metric:
+    """Add a metric to the registry rendered by ``/metrics``."""
+    registry.append(metric)
+    return metric
+
+
+REQUESTS = register(Counter(
+    "claude_code_api_requests_total", "Requests handled, by route and response status.", ("route", "model", "status")
+))
+INFLIGHT = register(Gauge(
+    "claude_code_api_inflight_requests", "Requests currently being handled or streamed."
+))
+TTFB = register(Histogram(
+    "claude_code_api_ttfb_seconds", "Time from request arrival to the first response byte.", ("route", "model")
+))
+LATENCY = register(Histogram(
+    "claude_code_api_request_duration_seconds", "Time from request arrival to the last response byte.", ("route", "model")
+))
+QUEUE_WAIT = register(Histogram(
+    "claude_code_api_queue_wait_seconds", "Time from request arrival until the Claude process is spawned.", ("route", "model")
+))
+STREAM_DURATION = register(Histogram(
+    "claude_code_api_stream_duration_seconds", "Duration of streamed responses.", ("route", "model")
+))
+STREAM_BYTES = register(Counter(
+    "claude_code_api_stream_bytes_total", "Bytes written to clients on streamed responses.", ("route", "model")
+))
+TOKENS_OUT = register(Histogram(
+    "claude_code_api_output_tokens", "Output tokens per completion.", ("route", "model"), TOKEN_BUCKETS
+))
+OUTPUT_BUFFERED_BYTES = register(Gauge(
+    "claude_code_api_output_buffered_bytes", "Claude CLI output read from the pipe but not yet consumed, across executions."
+))
+OUTPUT_BUFFERED_PEAK = register(Gauge(
+    "claude_code_api_output_buffered_bytes_peak", "Highest claude_code_api_output_buffered_bytes since start."
+))
+OUTPUT_TRUNCATIONS = register(Counter(
+    "claude_code_api_output_truncations_total",
+    "Claude CLI output cut short: oversized tool results, oversized lines, or executions over the byte cap.",
+    ("kind",),
+))
+ACTIVE_EXECUTIONS = register(Gauge(
+    "claude_code_api_active_executions", "Claude CLI executions currently running."
+))
+EXECUTIONS_CANCELLED = register(Counter(
+    "claude_code_api_executions_cancelled_total", "Executions stopped before they finished, by reason.", ("reason",)
+))
+EXECUTION_CPU = register(Histogram(
+    "claude_code_api_execution_cpu_seconds", "CPU time per execution, including processes started by tools.",
+    ("model",),
+))
+EXECUTION_PEAK_RSS = register(Histogram(
+    "claude_code_api_execution_peak_rss_bytes", "Peak resident memory per execution across its process group.",
+    ("model",), MEMORY_BUCKETS
+))
+PROJECT_DISK_BYTES = register(Gauge(
+    "claude_code_api_project_disk_bytes", "Disk used by the projects whose usage is being tracked."
+))
+PROJECT_QUOTA_REJECTIONS = register(Counter(
+    "claude_code_api_project_quota_rejections_total", "Requests refused because their project was over its disk quota."
+))
+PROJECTS_RECLAIMED = register(Counter(
+    "claude_code_api_projects_reclaimed_total", "Project directories deleted in the background, by reason.", ("reason",)
+))
+LOG_RECORDS_DROPPED = register(Counter(
+    "claude_code_api_log_records_dropped_total", "Log records dropped because the log queue was full."
+))
+
+_buffered_bytes = 0
+_buffered_peak = 0
+
+
+def render() -> str:
+    """Render every registered metric in the Prometheus text format."""
+    lines: List[str] = []
+    for metric in registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def _route_of(scope) -> str:
+    route = scope.get("route")
+    path = getattr(route, "path", None)
+    return path or "unmatched"
+
+
+def _model_of(scope) -> str:
+    state = scope.get("state") or {}
+    return str(state.get("metrics_model") or "")
+
+
+def add_buffered_bytes(delta: int) -> None:
+    """Adjust the buffered Claude output by ``delta`` bytes, keeping track of the peak."""
+    global _buffered_bytes, _buffered_peak
+    with _lock:
+        _buffered_bytes += delta
+        current = _buffered_bytes
+        if current > _buffered_peak:
+            _buffered_peak = current
+        peak = _buffered_peak
+    OUTPUT_BUFFERED_BYTES.set(current)
+    OUTPUT_BUFFERED_PEAK.set(peak)
+
+
+def observe_queue_wait(request, model: str) -> None:
+    """Record the time between request arrival and process spawn, and tag the request with its model."""
+    state = request.scope.setdefault("state", {})
+    state["metrics_model"] = model
+    started = state.get("metrics_start")
+    if started is not None:
+        QUEUE_WAIT.observe(time.perf_counter() - started, route=_route_of(request.scope), model=model)
+
+
+def observe_tokens(request, completion_tokens: Optional[int]) -> None:
+    """Record output tokens for the completion handled by ``request``."""
+    if isinstance(completion_tokens, int):
+        TOKENS_OUT.observe(completion_tokens, route=_route_of(request.scope), model=_model_of(request.scope))
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware recording request counts, TTFB, duration and streamed bytes.
+
+    It wraps ``send`` rather than the response object so streaming responses are measured
+    when bytes actually leave the process.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        scope.setdefault("state", {})["metrics_start"] = started
+        status = "500"
+        streamed = False
+        first_byte_at: Optional[float] = None
+        sent = 0
+        # the route is only known after routing, so in-flight requests are counted without labels
+        INFLIGHT.inc()
+
+        async def send_wrapper(message):
+            nonlocal status, streamed, first_byte_at, sent
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+                # streaming responses are the ones sent without a Content-Length
+                streamed = not any(name.lower() == b"content-length" for name, _ in message.get("headers") or ())
+            elif message["type"] == "http.response.body":
+                body = message.get("body") or b""
+                if first_byte_at is None and (body or not message.get("more_body")):
+                    first_byte_at = time.perf_counter()
+                sent += len(body)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            now = time.perf_counter()
+            route = _route_of(scope)
+            model = _model_of(scope)
+            INFLIGHT.dec()
+            REQUESTS.inc(route=route, model=model, status=status)
+            if first_byte_at is not None:
+                TTFB.observe(first_byte_at - started, route=route, model=model)
+            LATENCY.observe(now - started, route=route, model=model)
+            if streamed:
+                STREAM_DURATION.observe(now - started, route=route, model=model)
+                STREAM_BYTES.inc(sent, route=route, model=model)
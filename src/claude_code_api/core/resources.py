@@ -0,0 +1,141 @@
+"""CPU time, peak memory and wall time of Claude executions, sampled per process group from /proc."""
+
+import asyncio
+import os
+import time
+from typing import Dict, Optional, Set, Tuple
+
+import structlog
+
+from .config import settings
+
+logger = structlog.get_logger()
+
+PROC = "/proc"
+_CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+class ResourceUsage:
+    """Resources used by one execution: the CLI and every process it started in its process group."""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.ended: Optional[float] = None
+        # None where /proc is not available
+        self.cpu_seconds: Optional[float] = None
+        self.peak_rss_bytes: Optional[int] = None
+        self.peak_processes = 0
+
+    @property
+    def wall_seconds(self) -> float:
+        """Time since the CLI was started, or until it exited."""
+        return (self.ended or time.monotonic()) - self.started
+
+    def record(self, cpu_seconds: float, rss_bytes: int, processes: int):
+        """Fold one sample of the process group in."""
+        # CPU time only grows; a lower reading means a process exited between samples
+        self.cpu_seconds = max(self.cpu_seconds or 0.0, cpu_seconds)
+        self.peak_rss_bytes = max(self.peak_rss_bytes or 0, rss_bytes)
+        self.peak_processes = max(self.peak_processes, processes)
+
+    def as_dict(self) -> Dict[str, Optional[float]]:
+        """Summary for API responses."""
+        return {
+            "wall_time_s": round(self.wall_seconds, 3),
+            "cpu_time_s": round(self.cpu_seconds, 3) if self.cpu_seconds is not None else None,
+            "peak_rss_bytes": self.peak_rss_bytes,
+            "peak_processes": self.peak_processes or None,
+        }
+
+
+class ResourceSampler:
+    """
+    Samples all tracked process groups with one pass over /proc per interval.
+
+    CPU time of a group is the user and system time of its live members plus what they collected from children
+    they reaped, so short-lived tool processes are counted once their parent waits for them. Time used in the
+    last interval before the CLI itself exits can be missed; sample_now() just before it is reaped narrows that.
+    A run that ends within moments of starting may not be sampled at all and reports None.
+    """
+
+    def __init__(self):
+        self.groups: Dict[int, ResourceUsage] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._first_samples: Set[asyncio.Task] = set()
+
+    @property
+    def available(self) -> bool:
+        """Whether per-process statistics can be read here."""
+        return os.path.isdir(os.path.join(PROC, "self"))
+
+    def track(self, pgid: int, usage: ResourceUsage):
+        """Start sampling a process group, taking its first sample right away."""
+        if not self.available:
+            return
+        self.groups[pgid] = usage
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        else:
+            # The shared task may be most of an interval away from its next pass
+            task = asyncio.create_task(self.sample_now(pgid))
+            self._first_samples.add(task)
+            task.add_done_callback(self._first_samples.discard)
+
+    def untrack(self, pgid: Optional[int]):
+        """Stop sampling a process group; the sampling task ends once no groups are left."""
+        self.groups.pop(pgid, None)
+
+    async def sample_now(self, pgid: Optional[int]):
+        """Take one sample of a single group right away."""
+        usage = self.groups.get(pgid)
+        if usage is not None:
+            totals = (await asyncio.to_thread(_scan, {pgid})).get(pgid)
+            if totals is not None:
+                usage.record(*totals)
+
+    async def _run(self):
+        try:
+            while self.groups:
+                totals = await asyncio.to_thread(_scan, set(self.groups))
+                for pgid, sample in totals.items():
+                    usage = self.groups.get(pgid)
+                    if usage is not None:
+                        usage.record(*sample)
+                await asyncio.sleep(settings.claude_resource_sample_seconds)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error("Resource sampling failed", error=str(e))
+
+
+def _scan(pgids: set) -> Dict[int, Tuple[float, int, int]]:
+    """Per process group in ``pgids``: CPU seconds, resident bytes and process count of its live members."""
+    totals: Dict[int, list] = {}
+    try:
+        names = os.listdir(PROC)
+    except OSError:
+        return {}
+    for name in names:
+        if not name.isdigit():
+            continue
+        try:
+            with open(os.path.join(PROC, name, "stat"), "rb") as f:
+                stat = f.read()
+        except OSError:
+            continue  # exited since the listing
+        # The command name is in parentheses and may contain spaces; fields after it are fixed
+        fields = stat[stat.rfind(b")") + 2:].split()
+        pgrp = int(fields[2])
+        if pgrp not in pgids:
+            continue
+        utime, stime, cutime, cstime = (int(value) for value in fields[11:15])
+        group = totals.setdefault(pgrp, [0, 0, 0])
+        group[0] += utime + stime + cutime + cstime
+        group[1] += int(fields[21]) * _PAGE_SIZE
+        group[2] += 1
+    return {pgid: (ticks / _CLOCK_TICKS, rss, count) for pgid, (ticks, rss, count) in totals.items()}
+
+
+# Shared by all executions in this process
+sampler = ResourceSampler()
@@ -0,0 +1,420 @@
+"""Project disk accounting, quota checks and background deletion of removed or idle project directories."""
+
+import asyncio
+import os
+import threading
+import time
+import uuid
+from typing import Dict, Iterable, List, Optional, Set
+
+import structlog
+
+from . import metrics
+from .config import settings
+
+logger = structlog.get_logger()
+
+TRASH_DIR = ".trash"
+# Entries removed between pauses when deleting at project_reclaim_files_per_second
+RECLAIM_BATCH = 100
+
+
+class _Dir:
+    """What is known about one directory: its mtime, the files directly in it and its subdirectories."""
+
+    __slots__ = ("mtime_ns", "files", "subdirs", "size")
+
+    def __init__(self, mtime_ns: int, files: Dict[str, int], subdirs: Set[str]):
+        self.mtime_ns = mtime_ns
+        self.files = files
+        self.subdirs = subdirs
+        self.size = sum(files.values())
+
+
+class DiskUsage:
+    """
+    Disk use of one directory tree, kept up to date without walking the whole tree again.
+
+    A refresh stats every known directory but only lists those whose mtime changed (entries were created,
+    removed or renamed), and re-stats the files the caller knows were written. Files grown in place by other
+    means are only picked up by the next recount.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self.total = 0
+        self._dirs: Dict[str, _Dir] = {}
+
+    def recount(self):
+        """Walk the whole tree."""
+        self._dirs.clear()
+        self.total = 0
+        self._scan_tree(self.root)
+
+    def refresh(self, written: Iterable[str] = (), base: Optional[str] = None):
+        """
+        Bring the total up to date after the tree was modified.
+
+        ``written`` are files known to have been written to, either relative or under ``base`` (the directory
+        the writer saw, which differs from root for overlay workspaces).
+        """
+        for path in list(self._dirs):
+            known = self._dirs.get(path)
+            if known is None:
+                continue  # forgotten along with a removed parent
+            try:
+                mtime_ns = os.stat(path).st_mtime_ns
+            except OSError:
+                self._forget_tree(path)
+                continue
+            if mtime_ns != known.mtime_ns:
+                self._scan_tree(path)
+
+        for path in written:
+            if os.path.isabs(path):
+                path = os.path.relpath(path, base or self.root)
+                if path.startswith(os.pardir):
+                    continue
+            directory, name = os.path.split(os.path.join(self.root, path))
+            known = self._dirs.get(directory)
+            if known is None or name in known.subdirs:
+                continue  # new directories are found through their parent's mtime
+            try:
+                size = _disk_bytes(os.lstat(os.path.join(directory, name)))
+            except OSError:
+                size = 0
+            delta = size - known.files.get(name, 0)
+            known.files[name] = size
+            known.size += delta
+            self.total += delta
+
+    def _scan_tree(self, path: str):
+        """List ``path`` and every subdirectory not seen before."""
+        pending = [path]
+        while pending:
+            pending.extend(self._scan_dir(pending.pop()))
+
+    def _scan_dir(self, path: str) -> List[str]:
+        """List one directory; returns the subdirectories that are new."""
+        old = self._dirs.get(path)
+        files: Dict[str, int] = {}
+        subdirs: Set[str] = set()
+        try:
+            # stat before listing, so a change made while listing shows up on the next refresh
+            mtime_ns = os.stat(path).st_mtime_ns
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            subdirs.add(entry.name)
+                        else:
+                            files[entry.name] = _disk_bytes(entry.stat(follow_symlinks=False))
+                    except OSError:
+                        continue
+        except OSError:
+            self._forget_tree(path)
+            return []
+
+        current = _Dir(mtime_ns, files, subdirs)
+        self._dirs[path] = current
+        self.total += current.size - (old.size if old else 0)
+        if old is None:
+            return [os.path.join(path, name) for name in subdirs]
+        for name in old.subdirs - subdirs:
+            self._forget_tree(os.path.join(path, name))
+        return [os.path.join(path, name) for name in subdirs - old.subdirs]
+
+    def _forget_tree(self, path: str):
+        """Drop a directory and everything below it from the total."""
+        pending = [path]
+        while pending:
+            path = pending.pop()
+            known = self._dirs.pop(path, None)
+            if known is not None:
+                self.total -= known.size
+                pending.extend(os.path.join(path, name) for name in known.subdirs)
+
+
+class ProjectStorage:
+    """
+    Tracks disk use per project, refuses executions over max_project_size_mb and deletes project directories.
+
+    Usage is counted once per project and then updated after every execution from what changed. Removed and
+    idle projects are moved aside at once and deleted by a background task at a limited rate.
+    """
+
+    def __init__(self, workspace_manager=None, root: Optional[str] = None):
+        self.root = os.path.abspath(root or settings.project_root)
+        self.workspace_manager = workspace_manager
+        self.trash = os.path.join(self.root, TRASH_DIR)
+        self.usage: Dict[str, DiskUsage] = {}
+        self.last_active: Dict[str, float] = {}
+        self.running: Dict[str, int] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._dirty: Set[str] = set()
+        self._tasks: Set[asyncio.Task] = set()
+        self._reaper: Optional[asyncio.Task] = None
+        self._wake = asyncio.Event()
+        self._stopping = threading.Event()
+
+    @property
+    def limit_bytes(self) -> int:
+        """Quota per project in bytes; 0 when disabled."""
+        return max(0, settings.max_project_size_mb) * 1024 * 1024
+
+    async def start(self):
+        """Start the background reaper; anything left in the trash by a previous run is deleted first."""
+        self._stopping.clear()
+        if self._reaper is None or self._reaper.done():
+            self._reaper = asyncio.create_task(self._reap_loop())
+
+    async def stop(self):
+        """Stop the reaper and the pending usage updates."""
+        self._stopping.set()
+        tasks = [task for task in [self._reaper, *self._tasks] if task is not None]
+        for task in tasks:
+            task.cancel()
+        for task in tasks:
+            try:
+                await task
+            except (asyncio.CancelledError, Exception):
+                pass
+        self._reaper = None
+
+    async def get_usage(self, project_path: str) -> int:
+        """Bytes on disk used by a project; counted in full the first time, then from the cache."""
+        project_path = os.path.abspath(project_path)
+        usage = self.usage.get(project_path)
+        if usage is None:
+            async with self._lock(project_path):
+                usage = self.usage.get(project_path)
+                if usage is None:
+                    usage = DiskUsage(self._usage_root(project_path))
+                    await self._update(usage, usage.recount)
+                    self.usage[project_path] = usage
+        return usage.total
+
+    async def over_quota(self, project_path: str) -> bool:
+        """Whether a project is at or over max_project_size_mb."""
+        if not self.limit_bytes:
+            return False
+        return await self.get_usage(project_path) >= self.limit_bytes
+
+    def acquire(self, project_path: str):
+        """Mark a project as in use; it is neither expired nor reclaimed until released."""
+        project_path = os.path.abspath(project_path)
+        self.running[project_path] = self.running.get(project_path, 0) + 1
+        self.last_active[project_path] = time.time()
+
+    def release(self, project_path: str):
+        """Undo one acquire()."""
+        project_path = os.path.abspath(project_path)
+        self.running[project_path] -= 1
+        if not self.running[project_path]:
+            del self.running[project_path]
+        self.last_active[project_path] = time.time()
+
+    def track(self, project_path: str, process):
+        """
+        Hand a hold taken with acquire() over to ``process`` (a started ClaudeProcess).
+
+        Once it has finished the project's usage is updated and the hold released.
+        """
+        project_path = os.path.abspath(project_path)
+        task = asyncio.create_task(self._after_execution(project_path, process))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def in_use(self, project_path: str) -> bool:
+        """Whether an execution is starting or running in a project."""
+        return bool(self.running.get(os.path.abspath(project_path)))
+
+    async def reclaim(self, project_path: str, reason: str = "deleted") -> bool:
+        """
+        Move a project directory (and its workspace metadata) out of the way and queue it for deletion.
+
+        Only directories under project_root are deleted; custom project paths are left alone, and so are projects
+        in use (see acquire()).
+        """
+        project_path = os.path.abspath(project_path)
+        if os.path.dirname(project_path) != self.root:
+            logger.warning("Project directory outside project root left in place", path=project_path)
+            return False
+        if self.in_use(project_path):
+            logger.warning("Project directory in use left in place", path=project_path, reason=reason)
+            return False
+
+        if self.workspace_manager is not None:
+            paths = await self.workspace_manager.detach(project_path)
+        else:
+            paths = [project_path] if os.path.lexists(project_path) else []
+        os.makedirs(self.trash, exist_ok=True)
+        for path in paths:
+            try:
+                os.rename(path, os.path.join(self.trash, f"{uuid.uuid4().hex}-{os.path.basename(path)}"))
+            except OSError:
+                # Not on the same filesystem as the trash; delete it where it is
+                try:
+                    await asyncio.to_thread(
+                        _delete_tree, path, settings.project_reclaim_files_per_second, self._stopping
+                    )
+                except OSError as e:
+                    logger.error("Failed to delete project directory", path=path, error=str(e))
+
+        usage = self.usage.pop(project_path, None)
+        if usage is not None:
+            metrics.PROJECT_DISK_BYTES.dec(usage.total)
+        self.last_active.pop(project_path, None)
+        self._dirty.discard(project_path)
+        if paths:
+            metrics.PROJECTS_RECLAIMED.inc(reason=reason)
+            logger.info("Project directory reclaimed", path=project_path, reason=reason)
+        self._wake.set()
+        return bool(paths)
+
+    def _lock(self, project_path: str) -> asyncio.Lock:
+        lock = self._locks.get(project_path)
+        if lock is None:
+            lock = self._locks[project_path] = asyncio.Lock()
+        return lock
+
+    def _usage_root(self, project_path: str) -> str:
+        if self.workspace_manager is None:
+            return project_path
+        return self.workspace_manager.usage_path(project_path)
+
+    async def _update(self, usage: DiskUsage, fn, *args):
+        """Run a DiskUsage method in a worker thread and move the disk gauge by the change."""
+        before = usage.total
+        await asyncio.to_thread(fn, *args)
+        metrics.PROJECT_DISK_BYTES.inc(usage.total - before)
+
+    async def _after_execution(self, project_path: str, process):
+        try:
+            await process.finished.wait()
+            usage = self.usage.get(project_path)
+            if usage is not None:
+                async with self._lock(project_path):
+                    await self._update(usage, usage.refresh, set(process.touched_paths), project_path)
+                self._dirty.add(project_path)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error("Failed to update project disk usage", path=project_path, error=str(e))
+        finally:
+            self.release(project_path)
+
+    async def _reap_loop(self):
+        """Empty the trash whenever something is added; expire and recount projects every cleanup interval."""
+        while True:
+            try:
+                await self._empty_trash()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=settings.cleanup_interval_minutes * 60)
+                    self._wake.clear()
+                except asyncio.TimeoutError:
+                    await self._expire()
+                    await self._recount()
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error("Error in project reaper", error=str(e))
+                await asyncio.sleep(60)
+
+    async def _empty_trash(self):
+        try:
+            entries = await asyncio.to_thread(os.listdir, self.trash)
+        except OSError:
+            return
+        for name in entries:
+            started = time.monotonic()
+            try:
+                removed = await asyncio.to_thread(
+                    _delete_tree,
+                    os.path.join(self.trash, name),
+                    settings.project_reclaim_files_per_second,
+                    self._stopping
+                )
+            except OSError as e:
+                # Left for the next pass; it must not hold up the entries after it
+                logger.error("Failed to delete reclaimed project files", entry=name, error=str(e))
+                continue
+            logger.info(
+                "Reclaimed project files deleted",
+                entry=name,
+                entries_removed=removed,
+                duration_s=round(time.monotonic() - started, 2)
+            )
+
+    async def _expire(self):
+        """
+        Reclaim directories under project_root idle for longer than project_ttl_hours.
+
+        Project records are kept; a project used again gets a fresh directory (or workspace).
+        """
+        if settings.project_ttl_hours <= 0:
+            return
+        cutoff = time.time() - settings.project_ttl_hours * 3600
+        for path, mtime in await asyncio.to_thread(_project_dirs, self.root):
+            if self.in_use(path):
+                continue
+            if max(mtime, self.last_active.get(path, 0)) < cutoff:
+                await self.reclaim(path, reason="expired")
+
+    async def _recount(self):
+        """Fully recount the projects that ran since the last recount, catching writes refresh() cannot see."""
+        for path in list(self._dirty):
+            self._dirty.discard(path)
+            usage = self.usage.get(path)
+            if usage is not None and not self.running.get(path):
+                async with self._lock(path):
+                    await self._update(usage, usage.recount)
+
+
+def _disk_bytes(st: os.stat_result) -> int:
+    """Space allocated for a file, which is what counts against the quota."""
+    return st.st_blocks * 512
+
+
+def _project_dirs(root: str) -> List[tuple]:
+    """Project directories under root with their mtimes, skipping the hidden bookkeeping directories."""
+    result = []
+    with os.scandir(root) as entries:
+        for entry in entries:
+            if entry.name.startswith(".") or not entry.is_dir(follow_symlinks=False):
+                continue
+            try:
+                result.append((entry.path, entry.stat(follow_symlinks=False).st_mtime))
+            except OSError:
+                continue
+    return result
+
+
+def _delete_tree(path: str, files_per_second: int, stop: threading.Event) -> int:
+    """
+    Delete a tree bottom-up, pausing after every RECLAIM_BATCH entries to stay under files_per_second.
+
+    Runs in a worker thread. Returns the entries removed; stops early (leaving the rest) once ``stop`` is set.
+    """
+    if not os.path.isdir(path) or os.path.islink(path):
+        os.unlink(path)
+        return 1
+    removed = 0
+    for dirpath, dirnames, filenames in os.walk(path, topdown=False):
+        for name in filenames + dirnames:
+            full = os.path.join(dirpath, name)
+            try:
+                if os.path.isdir(full) and not os.path.islink(full):
+                    os.rmdir(full)
+                else:
+                    os.unlink(full)
+            except OSError:
+                continue
+            removed += 1
+            if removed % RECLAIM_BATCH == 0:
+                if stop.is_set():
+                    return removed
+                if files_per_second > 0:
+                    time.sleep(RECLAIM_BATCH / files_per_second)
+    os.rmdir(path)
+    return removed + 1
@@ -0,0 +1,349 @@
+"""Project workspaces instantiated from templates (e.g. a checked-out repository)."""
+
+import asyncio
+import errno
+import fcntl
+import json
+import os
+import shutil
+import subprocess
+import sys
+import uuid
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import structlog
+
+from .config import settings
+
+logger = structlog.get_logger()
+
+CLONE_METHODS = ("auto", "overlay", "reflink", "hardlink", "copy")
+# ioctl(2) request that makes a file share its extents with another (btrfs, XFS, bcachefs, ...)
+FICLONE = 0x40049409
+METADATA_DIR = ".workspaces"
+POOL_DIR = ".pool"
+
+
+class WorkspaceManager:
+    """
+    Creates project directories from templates.
+
+    Depending on the filesystem a workspace is an overlay mount over the template (instant, only changes are
+    stored), a reflink clone (data blocks shared until written), a hardlink farm, or a plain copy. For the
+    methods that have to walk the tree, a few clones per template are made ahead of time, so handing one out is
+    a single rename.
+    """
+
+    def __init__(
+        self,
+        root: Optional[str] = None,
+        templates: Optional[Dict[str, str]] = None,
+        method: Optional[str] = None,
+        pool_size: Optional[int] = None
+    ):
+        self.root = os.path.abspath(root or settings.project_root)
+        self.templates = {
+            name: os.path.abspath(path)
+            for name, path in (settings.workspace_templates if templates is None else templates).items()
+        }
+        self.method = method or settings.workspace_clone_method
+        if self.method not in CLONE_METHODS:
+            raise ValueError(f"Unknown workspace clone method {self.method!r}, expected one of {CLONE_METHODS}")
+        self.pool_size = settings.workspace_pool_size if pool_size is None else pool_size
+        self.pools: Dict[str, List[str]] = {name: [] for name in self.templates}
+        self._methods: Dict[str, str] = {}
+        self._generations: Dict[str, Tuple[int, ...]] = {}
+        self._refills: Dict[str, asyncio.Task] = {}
+
+    async def start(self):
+        """Drop clones left over from a previous run and start filling the pools."""
+        for name in self.templates:
+            await asyncio.to_thread(shutil.rmtree, self._pool_path(name), True)
+            self._schedule_refill(name)
+
+    async def stop(self):
+        """Stop filling the pools."""
+        for task in self._refills.values():
+            task.cancel()
+        for task in self._refills.values():
+            try:
+                await task
+            except (asyncio.CancelledError, Exception):
+                pass
+        self._refills.clear()
+
+    async def provision(self, project_id: str, template: str) -> str:
+        """Return the project directory, creating it from ``template`` if it does not exist yet."""
+        source = self.templates.get(template)
+        if source is None:
+            raise KeyError(template)
+        target = os.path.join(self.root, project_id)
+        info = self.get_info(target)
+
+        if info is not None:
+            # Mounts do not survive a reboot; the upper layer with the project's changes does
+            if info["method"] == "overlay" and not os.path.ismount(target):
+                await asyncio.to_thread(self._mount_overlay, source, target)
+            return target
+        if os.path.exists(target):
+            raise FileExistsError(f"Project directory {target} exists and was not created from a template")
+
+        method = await self._method_for(template)
+        started = datetime.utcnow()
+        if method == "overlay":
+            try:
+                await asyncio.to_thread(self._mount_overlay, source, target)
+            except OSError as e:
+                # Leave nothing behind, or every later attempt would find the directory and answer 409
+                await asyncio.to_thread(self._discard_overlay, target)
+                if self.method != "auto":
+                    raise
+                method = self._methods[template] = await asyncio.to_thread(self._detect_method, template, False)
+                logger.warning(
+                    "Overlay mount failed, workspace clone method changed",
+                    template=template,
+                    method=method,
+                    error=str(e)
+                )
+        if method != "overlay":
+            self._check_generation(template)
+            pool = self.pools[template]
+            if pool:
+                os.rename(pool.pop(), target)
+            else:
+                await asyncio.to_thread(_clone_tree, method, source, target)
+            self._schedule_refill(template)
+
+        self._write_info(target, {"template": template, "method": method, "created_at": started.isoformat()})
+        logger.info(
+            "Workspace provisioned",
+            project_id=project_id,
+            template=template,
+            method=method,
+            duration_ms=round((datetime.utcnow() - started).total_seconds() * 1000, 2)
+        )
+        return target
+
+    async def release(self, project_path: str):
+        """Unmount and delete a workspace along with its metadata."""
+        for path in await self.detach(project_path):
+            await asyncio.to_thread(shutil.rmtree, path, True)
+
+    async def detach(self, project_path: str) -> List[str]:
+        """Unmount a workspace if needed and return the directories holding its files, for the caller to delete."""
+        info = self.get_info(project_path)
+        if info is not None and info["method"] == "overlay" and os.path.ismount(project_path):
+            await asyncio.to_thread(_run, _unmount_command(project_path))
+        return [path for path in (project_path, self._meta_path(project_path)) if os.path.lexists(path)]
+
+    def usage_path(self, project_path: str) -> str:
+        """Directory whose size is the project's own disk use: the upper layer for overlays, else the project."""
+        info = self.get_info(project_path)
+        if info is not None and info["method"] == "overlay":
+            return os.path.join(self._meta_path(project_path), "upper")
+        return project_path
+
+    def template_for(self, project_id: str) -> Optional[str]:
+        """Template an existing project was created from, if any."""
+        info = self.get_info(os.path.join(self.root, project_id))
+        return info["template"] if info is not None else None
+
+    def get_info(self, project_path: str) -> Optional[Dict[str, str]]:
+        """Template and clone method of a workspace, or None for directories not made from a template."""
+        try:
+            with open(os.path.join(self._meta_path(project_path), "workspace.json")) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def is_workspace(self, project_path: str) -> bool:
+        """Whether the directory was created from a template."""
+        return os.path.exists(os.path.join(self._meta_path(project_path), "workspace.json"))
+
+    def _meta_path(self, project_path: str) -> str:
+        """Metadata (and overlay upper/work directories) live outside the workspace itself."""
+        return os.path.join(self.root, METADATA_DIR, os.path.basename(os.path.normpath(project_path)))
+
+    def _pool_path(self, template: str) -> str:
+        return os.path.join(self.root, METADATA_DIR, POOL_DIR, template)
+
+    def _write_info(self, project_path: str, info: Dict[str, str]):
+        meta = self._meta_path(project_path)
+        os.makedirs(meta, exist_ok=True)
+        with open(os.path.join(meta, "workspace.json"), "w") as f:
+            json.dump(info, f)
+
+    def _mount_overlay(self, source: str, target: str, meta: Optional[str] = None):
+        """Mount an overlay with the template as the read-only lower layer."""
+        meta = meta or self._meta_path(target)
+        upper, work = os.path.join(meta, "upper"), os.path.join(meta, "work")
+        for path in (upper, work, target):
+            os.makedirs(path, exist_ok=True)
+        options = f"lowerdir={source},upperdir={upper},workdir={work}"
+        if os.geteuid() == 0:
+            _run(["mount", "-t", "overlay", "overlay", "-o", options, target])
+        else:
+            _run(["fuse-overlayfs", "-o", options, target])
+
+    def _discard_overlay(self, target: str):
+        """Remove the empty mount point and upper/work directories left by a failed mount."""
+        shutil.rmtree(self._meta_path(target), ignore_errors=True)
+        try:
+            os.rmdir(target)
+        except OSError:
+            pass
+
+    def _overlay_works(self, template: str) -> bool:
+        """
+        Mount and unmount a throwaway overlay over the template. Root or fuse-overlayfs being present is not enough:
+        containers without CAP_SYS_ADMIN, missing /dev/fuse or an unsupported lower filesystem only show up here.
+        """
+        probe = os.path.join(self.root, METADATA_DIR, f".probe-{uuid.uuid4().hex}")
+        mountpoint = os.path.join(probe, "mnt")
+        try:
+            self._mount_overlay(self.templates[template], mountpoint, probe)
+            _run(_unmount_command(mountpoint))
+            return True
+        except OSError as e:
+            logger.info("Overlay mounts unavailable", template=template, error=str(e))
+            return False
+        finally:
+            # Never delete through a mount that failed to come down; the deletions would land in the probe's layer
+            if not os.path.ismount(mountpoint):
+                shutil.rmtree(probe, ignore_errors=True)
+
+    async def _method_for(self, template: str) -> str:
+        """The configured clone method, or for ``auto`` the first one that works for this template."""
+        if self.method != "auto":
+            return self.method
+        if template not in self._methods:
+            self._methods[template] = await asyncio.to_thread(self._detect_method, template)
+            logger.info("Workspace clone method selected", template=template, method=self._methods[template])
+        return self._methods[template]
+
+    def _detect_method(self, template: str, overlay: bool = True) -> str:
+        """
+        Probe overlay (with a trial mount, unless ``overlay`` is False) and reflink support for the template's
+        filesystem, falling back to copying.
+
+        Hardlink clones share inodes with the template, so a tool that rewrites a file in place would change the
+        template too; they are only used when asked for explicitly.
+        """
+        if overlay and _overlay_available() and self._overlay_works(template):
+            return "overlay"
+        probe = os.path.join(self.root, METADATA_DIR, f".probe-{uuid.uuid4().hex}")
+        os.makedirs(os.path.dirname(probe), exist_ok=True)
+        sample = _first_file(self.templates[template])
+        try:
+            if sample is not None:
+                _reflink_file(sample, probe)
+                return "reflink"
+        except OSError:
+            pass
+        finally:
+            if os.path.exists(probe):
+                os.unlink(probe)
+        return "copy"
+
+    def _check_generation(self, template: str):
+        """Throw away pooled clones when the template has changed since they were made."""
+        generation = _template_generation(self.templates[template])
+        if self._generations.get(template, generation) != generation:
+            stale, self.pools[template] = self.pools[template], []
+            for path in stale:
+                asyncio.get_running_loop().run_in_executor(None, shutil.rmtree, path, True)
+            logger.info("Template changed, workspace pool discarded", template=template, clones=len(stale))
+        self._generations[template] = generation
+
+    def _schedule_refill(self, template: str):
+        """Top the template's pool back up in the background."""
+        task = self._refills.get(template)
+        if self.pool_size <= 0 or (task is not None and not task.done()):
+            return
+        self._refills[template] = asyncio.create_task(self._refill(template))
+
+    async def _refill(self, template: str):
+        method = await self._method_for(template)
+        if method == "overlay":
+            return
+        pool = self.pools[template]
+        pool_path = self._pool_path(template)
+        while len(pool) < self.pool_size:
+            self._check_generation(template)
+            clone = os.path.join(pool_path, uuid.uuid4().hex)
+            os.makedirs(pool_path, exist_ok=True)
+            try:
+                await asyncio.to_thread(_clone_tree, method, self.templates[template], clone)
+            except Exception as e:
+                logger.error("Failed to prepare workspace clone", template=template, method=method, error=str(e))
+                await asyncio.to_thread(shutil.rmtree, clone, True)
+                return
+            if self._generations.get(template) == _template_generation(self.templates[template]):
+                pool.append(clone)
+            else:
+                await asyncio.to_thread(shutil.rmtree, clone, True)
+
+
+def _run(cmd: List[str]):
+    """Run a helper command, raising OSError with its stderr on failure."""
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise OSError(errno.EIO, f"{' '.join(cmd[:3])} failed: {result.stderr.strip()}")
+
+
+def _unmount_command(path: str) -> List[str]:
+    if os.geteuid() == 0:
+        return ["umount", path]
+    return [shutil.which("fusermount3") or "fusermount", "-u", path]
+
+
+def _overlay_available() -> bool:
+    """Overlay mounts need Linux and either root or fuse-overlayfs."""
+    if not sys.platform.startswith("linux"):
+        return False
+    if os.geteuid() != 0:
+        return shutil.which("fuse-overlayfs") is not None
+    try:
+        with open("/proc/filesystems") as f:
+            return any(line.split()[-1] == "overlay" for line in f if line.strip())
+    except OSError:
+        return False
+
+
+def _first_file(root: str) -> Optional[str]:
+    """Any regular file under root, to probe the filesystem with."""
+    for dirpath, _, filenames in os.walk(root):
+        for name in filenames:
+            path = os.path.join(dirpath, name)
+            if os.path.isfile(path) and not os.path.islink(path):
+                return path
+    return None
+
+
+def _reflink_file(src: str, dst: str):
+    """Copy a file by sharing its extents; raises OSError where the filesystem cannot."""
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+    shutil.copystat(src, dst)
+
+
+def _clone_tree(method: str, src: str, dst: str):
+    """Clone a directory tree with the given method; a partial clone is removed on failure."""
+    copy_function = {"reflink": _reflink_file, "hardlink": os.link, "copy": shutil.copy2}[method]
+    try:
+        shutil.copytree(src, dst, symlinks=True, copy_function=copy_function)
+    except BaseException:
+        shutil.rmtree(dst, ignore_errors=True)
+        raise
+
+
+def _template_generation(path: str) -> Tuple[int, ...]:
+    """Cheap change marker for a template: modification times of its root and, for git checkouts, HEAD and index."""
+    marks = []
+    for name in ("", ".git/HEAD", ".git/index"):
+        try:
+            marks.append(os.stat(os.path.join(path, name)).st_mtime_ns)
+        except OSError:
+            marks.append(0)
+    return tuple(marks)
@@ -12,38 +12,26 @@ from typing import AsyncGenerator
 
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 import structlog
 
 from claude_code_api.core.config import settings
 from claude_code_api.core.database import create_tables, close_database
 from claude_code_api.core.session_manager import SessionManager
 from claude_code_api.core.claude_manager import ClaudeManager
+from claude_code_api.core.workspace import WorkspaceManager
+from claude_code_api.core.storage import ProjectStorage
 from claude_code_api.api.chat import router as chat_router
 from claude_code_api.api.models import router as models_router
 from claude_code_api.api.projects import router as projects_router
 from claude_code_api.api.sessions import router as sessions_router
-from claude_code_api.core.auth import auth_middleware
+from claude_code_api.core.auth import AuthMiddleware
+from claude_code_api.core import metrics
+from claude_code_api.core.log import configure_logging
 
 
 # Configure structured logging
-structlog.configure(
-    processors=[
-        structlog.stdlib.filter_by_level,
-        structlog.stdlib.add_logger_name,
-        structlog.stdlib.add_log_level,
-        structlog.stdlib.PositionalArgumentsFormatter(),
-        structlog.processors.TimeStamper(fmt="iso"),
-        structlog.processors.StackInfoRenderer(),
-        structlog.processors.format_exc_info,
-        structlog.processors.UnicodeDecoder(),
-        structlog.processors.JSONRenderer()
-    ],
-    context_class=dict,
-    logger_factory=structlog.stdlib.LoggerFactory(),
-    wrapper_class=structlog.stdlib.BoundLogger,
-    cache_logger_on_first_use=True,
-)
+configure_logging()
 
 logger = structlog.get_logger()
 
@@ -60,6 +48,10 @@ async def lifespan(app: FastAPI) -> AsyncGenerator[None, None]:
     # Initialize managers
     app.state.session_manager = SessionManager()
     app.state.claude_manager = ClaudeManager()
+    app.state.workspace_manager = WorkspaceManager()
+    await app.state.workspace_manager.start()
+    app.state.project_storage = ProjectStorage(app.state.workspace_manager)
+    await app.state.project_storage.start()
     logger.info("Managers initialized")
     
     # Verify Claude Code availability
@@ -78,6 +70,9 @@ async def lifespan(app: FastAPI) -> AsyncGenerator[None, None]:
     # Cleanup
     logger.info("Shutting down Claude Code API Gateway")
     await app.state.session_manager.cleanup_all()
+    await app.state.claude_manager.cleanup_all()
+    await app.state.workspace_manager.stop()
+    await app.state.project_storage.stop()
     await close_database()
     logger.info("Shutdown complete")
 
@@ -101,7 +96,10 @@ app.add_middleware(
 )
 
 # Authentication middleware
-app.middleware("http")(auth_middleware)
+app.add_middleware(AuthMiddleware)
+
+# Metrics middleware (outermost, so auth rejections and CORS preflights are counted too)
+app.add_middleware(metrics.MetricsMiddleware)
 
 
 @app.exception_handler(Exception)
@@ -150,6 +148,12 @@ async def health_check():
         )
 
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """Prometheus metrics endpoint."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
 @app.get("/")
 async def root():
     """Root endpoint with API information."""
@@ -163,6 +167,7 @@ async def root():
             "projects": "/v1/projects",
             "sessions": "/v1/sessions"
         },
+        "metrics": "/metrics",
         "docs": "/docs",
         "health": "/health"
     }
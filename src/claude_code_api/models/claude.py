@@ -56,6 +56,18 @@ class ClaudeMessage(BaseModel):
     timestamp: Optional[str] = Field(None, description="Timestamp")
 
 
+class ClaudeMessageLite:
+    """Unvalidated stand-in for ClaudeMessage with the same attributes, built straight from the decoded dict."""
+    __slots__ = tuple(ClaudeMessage.model_fields)
+    
+    def __init__(self, data: Dict[str, Any]):
+        for name in self.__slots__:
+            setattr(self, name, data.get(name))
+    
+    def __repr__(self) -> str:
+        return f"ClaudeMessageLite(type={self.type!r}, subtype={self.subtype!r})"
+
+
 class ClaudeToolUse(BaseModel):
     """Claude tool use information."""
     id: str = Field(..., description="Tool use ID")
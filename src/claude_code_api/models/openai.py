@@ -48,6 +48,7 @@ class ChatCompletionRequest(BaseModel):
     project_id: Optional[str] = Field(None, description="Project ID for Claude Code context")
     session_id: Optional[str] = Field(None, description="Session ID to continue conversation")
     system_prompt: Optional[str] = Field(None, description="System prompt override")
+    project_template: Optional[str] = Field(None, description="Workspace template a new project is created from")
 
 
 class ChatCompletionChoice(BaseModel):
@@ -150,6 +151,7 @@ class CreateProjectRequest(BaseModel):
     name: str = Field(..., description="Project name")
     description: Optional[str] = Field(None, description="Project description")
     path: Optional[str] = Field(None, description="Custom project path")
+    template: Optional[str] = Field(None, description="Workspace template to create the project from")
 
 
 class SessionInfo(BaseModel):
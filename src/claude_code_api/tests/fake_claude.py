@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+Stand-in for the `claude` CLI, for tests and benchmarks that must not depend on a real Claude Code install.
+
+Point the gateway at it with CLAUDE_BINARY_PATH=/path/to/fake_claude.py (or `settings.claude_binary_path`).
+It understands the flags ClaudeProcess passes and prints a realistic `--output-format stream-json` transcript:
+a system init message, assistant text and tool_use messages, the matching tool_result and a final result.
+With --include-partial-messages every assistant message is preceded by its stream_event deltas, one per word.
+
+Shape and timing are controlled through environment variables:
+
+    FAKE_CLAUDE_FIRST_DELAY   seconds before the first line (default 0)
+    FAKE_CLAUDE_DELAY         seconds between lines (default 0)
+    FAKE_CLAUDE_MESSAGES      assistant text messages (default 2)
+    FAKE_CLAUDE_TEXT_BYTES    approximate size of each text message (default 200)
+    FAKE_CLAUDE_TOOL_USES     tool_use / tool_result round trips (default 1)
+    FAKE_CLAUDE_TOOL_RESULT_BYTES  approximate size of each tool_result (default 64)
+    FAKE_CLAUDE_EXIT_CODE     exit with this code after writing an error to stderr (default 0)
+    FAKE_CLAUDE_CHILD_SECONDS start a process that keeps a CPU busy this long and is not waited for,
+                              like a background job left behind by a tool (default 0)
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import uuid
+
+VERSION = "1.0.0 (Claude Code, fake)"
+WORDS = "the gateway relays every message from the cli to the client as it arrives".split()
+
+
+def env_number(name: str, default, cast=int):
+    """Read a numeric setting from the environment, falling back to the default."""
+    try:
+        return cast(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def make_text(size: int, seed: int) -> str:
+    """Build roughly `size` bytes of filler text."""
+    words = []
+    length = 0
+    i = seed
+    while length < size:
+        word = WORDS[i % len(WORDS)]
+        words.append(word)
+        length += len(word) + 1
+        i += 1
+    return " ".join(words)
+
+
+def usage(input_tokens: int, output_tokens: int) -> dict:
+    """Usage block in the shape Claude Code reports it."""
+    return {
+        "input_tokens": input_tokens,
+        "cache_creation_input_tokens": 0,
+        "cache_read_input_tokens": 0,
+        "output_tokens": output_tokens,
+    }
+
+
+def transcript(prompt: str, model: str, session_id: str, cwd: str):
+    """Yield the stream-json messages of one run."""
+    messages = env_number("FAKE_CLAUDE_MESSAGES", 2)
+    text_bytes = env_number("FAKE_CLAUDE_TEXT_BYTES", 200)
+    tool_uses = env_number("FAKE_CLAUDE_TOOL_USES", 1)
+    tool_result_bytes = env_number("FAKE_CLAUDE_TOOL_RESULT_BYTES", 64)
+    input_tokens = max(1, len(prompt.split()))
+    output_tokens = 0
+    texts = []
+
+    yield {
+        "type": "system",
+        "subtype": "init",
+        "cwd": cwd,
+        "session_id": session_id,
+        "tools": ["Bash", "Edit", "Read", "Write"],
+        "mcp_servers": [],
+        "model": model,
+        "permissionMode": "bypassPermissions",
+        "apiKeySource": "none",
+    }
+
+    def assistant(content: list, tokens: int) -> dict:
+        return {
+            "type": "assistant",
+            "message": {
+                "id": f"msg_{uuid.uuid4().hex[:24]}",
+                "type": "message",
+                "role": "assistant",
+                "model": model,
+                "content": content,
+                "stop_reason": None,
+                "stop_sequence": None,
+                "usage": usage(input_tokens, tokens),
+            },
+            "parent_tool_use_id": None,
+            "session_id": session_id,
+        }
+
+    for i in range(messages):
+        if i < tool_uses:
+            tool_id = f"toolu_{uuid.uuid4().hex[:24]}"
+            yield assistant(
+                [{"type": "tool_use", "id": tool_id, "name": "Read", "input": {"file_path": f"{cwd}/file_{i}.txt"}}],
+                12,
+            )
+            yield {
+                "type": "user",
+                "message": {
+                    "role": "user",
+                    "content": [{"type": "tool_result", "tool_use_id": tool_id, "content": make_text(tool_result_bytes, i)}],
+                },
+                "parent_tool_use_id": None,
+                "session_id": session_id,
+            }
+            output_tokens += 12
+        text = make_text(text_bytes, i)
+        tokens = max(1, len(text) // 4)
+        texts.append(text)
+        output_tokens += tokens
+        yield assistant([{"type": "text", "text": text}], tokens)
+
+    yield {
+        "type": "result",
+        "subtype": "success",
+        "is_error": False,
+        "duration_ms": 0,
+        "duration_api_ms": 0,
+        "num_turns": messages + min(tool_uses, messages),
+        "result": texts[-1] if texts else "",
+        "session_id": session_id,
+        "total_cost_usd": round((input_tokens * 3 + output_tokens * 15) / 1_000_000, 6),
+        "usage": usage(input_tokens, output_tokens),
+    }
+
+
+def partial_events(message: dict):
+    """Yield the stream_event messages Claude Code sends ahead of a complete assistant message."""
+    body = message["message"]
+
+    def event(payload: dict) -> dict:
+        return {
+            "type": "stream_event",
+            "event": payload,
+            "parent_tool_use_id": None,
+            "session_id": message["session_id"],
+        }
+
+    yield event({"type": "message_start", "message": {**body, "content": []}})
+    for index, block in enumerate(body["content"]):
+        if block["type"] == "text":
+            yield event({"type": "content_block_start", "index": index, "content_block": {"type": "text", "text": ""}})
+            words = block["text"].split(" ")
+            for i, word in enumerate(words):
+                text = word if i == len(words) - 1 else word + " "
+                yield event({"type": "content_block_delta", "index": index, "delta": {"type": "text_delta", "text": text}})
+        else:
+            start = {**block, "input": {}}
+            yield event({"type": "content_block_start", "index": index, "content_block": start})
+            arguments = json.dumps(block["input"])
+            for part in (arguments[: len(arguments) // 2], arguments[len(arguments) // 2 :]):
+                yield event({"type": "content_block_delta", "index": index, "delta": {"type": "input_json_delta", "partial_json": part}})
+        yield event({"type": "content_block_stop", "index": index})
+    yield event({"type": "message_delta", "delta": {"stop_reason": "end_turn"}, "usage": {"output_tokens": body["usage"]["output_tokens"]}})
+    yield event({"type": "message_stop"})
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(prog="claude", add_help=False)
+    parser.add_argument("--version", action="store_true")
+    parser.add_argument("-p", "--print", dest="prompt", default=None)
+    parser.add_argument("--model", default="claude-3-5-sonnet-20241022")
+    parser.add_argument("--system-prompt", default=None)
+    parser.add_argument("--output-format", default="text")
+    parser.add_argument("--resume", default=None)
+    parser.add_argument("--verbose", action="store_true")
+    parser.add_argument("--dangerously-skip-permissions", action="store_true")
+    parser.add_argument("--include-partial-messages", action="store_true")
+    args, _ = parser.parse_known_args()
+
+    if args.version:
+        print(VERSION)
+        return 0
+
+    exit_code = env_number("FAKE_CLAUDE_EXIT_CODE", 0)
+    if exit_code:
+        print("Error: fake claude was told to fail", file=sys.stderr)
+        return exit_code
+
+    first_delay = env_number("FAKE_CLAUDE_FIRST_DELAY", 0.0, float)
+    delay = env_number("FAKE_CLAUDE_DELAY", 0.0, float)
+    session_id = args.resume or str(uuid.uuid4())
+    started = time.monotonic()
+
+    child_seconds = env_number("FAKE_CLAUDE_CHILD_SECONDS", 0.0, float)
+    if child_seconds > 0:
+        busy = f"import time\nend = time.monotonic() + {child_seconds}\nwhile time.monotonic() < end: pass"
+        subprocess.Popen([sys.executable, "-c", busy], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    if first_delay > 0:
+        time.sleep(first_delay)
+    for i, message in enumerate(transcript(args.prompt or "", args.model, session_id, os.getcwd())):
+        if i and delay > 0:
+            time.sleep(delay)
+        if message["type"] == "result":
+            message["duration_ms"] = message["duration_api_ms"] = int((time.monotonic() - started) * 1000)
+        if args.output_format == "stream-json":
+            if args.include_partial_messages and message["type"] == "assistant":
+                for partial in partial_events(message):
+                    sys.stdout.write(json.dumps(partial) + "\n")
+            sys.stdout.write(json.dumps(message) + "\n")
+        elif message["type"] == "result":
+            sys.stdout.write(message["result"] + "\n")
+        sys.stdout.flush()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,232 @@
+"""Tests for running ClaudeProcess against the fake Claude CLI."""
+
+import asyncio
+import os
+import time
+
+import pytest
+
+from claude_code_api.core.claude_manager import ClaudeManager, ClaudeProcess
+from claude_code_api.core.config import settings
+from claude_code_api.core.resources import ResourceSampler, ResourceUsage
+from claude_code_api.utils.streaming import StreamingManager
+
+FAKE_CLAUDE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_claude.py")
+
+
+def _live_group_members(pgid: int) -> list:
+    """PIDs in a process group that have not exited (zombies waiting to be reaped are left out)."""
+    members = []
+    for name in os.listdir("/proc"):
+        try:
+            with open(f"/proc/{name}/stat", "rb") as f:
+                fields = f.read().rsplit(b")", 1)[1].split()
+        except (OSError, IndexError):
+            continue
+        if int(fields[2]) == pgid and fields[0] != b"Z":
+            members.append(int(name))
+    return members
+
+
+async def _run(tmp_path) -> tuple:
+    process = ClaudeProcess("test-session", str(tmp_path))
+    ok = await process.start(prompt="hello there", model="claude-3-5-haiku-20241022")
+    messages = [message async for message in process.get_output()] if ok else []
+    return ok, process, messages
+
+
+def test_fake_claude_stream_json(tmp_path, monkeypatch):
+    """The fake CLI's transcript is parsed into system, assistant, tool and result messages."""
+    monkeypatch.setattr(settings, "claude_binary_path", FAKE_CLAUDE)
+    monkeypatch.setenv("FAKE_CLAUDE_MESSAGES", "2")
+    monkeypatch.setenv("FAKE_CLAUDE_TOOL_USES", "1")
+
+    ok, process, messages = asyncio.run(_run(tmp_path))
+
+    assert ok
+    assert [m["type"] for m in messages] == ["system", "assistant", "user", "assistant", "assistant", "result"]
+    assert process.session_id == messages[0]["session_id"]
+    assert messages[1]["message"]["content"][0]["type"] == "tool_use"
+    assert messages[-1]["usage"]["output_tokens"] > 0
+    # Read is not an editing tool, so nothing counts as written
+    assert process.finished.is_set() and not process.touched_paths
+
+
+def test_fake_claude_failure(tmp_path, monkeypatch):
+    """A failing CLI run is reported as a failed start."""
+    monkeypatch.setattr(settings, "claude_binary_path", FAKE_CLAUDE)
+    monkeypatch.setenv("FAKE_CLAUDE_EXIT_CODE", "2")
+
+    ok, _, _ = asyncio.run(_run(tmp_path))
+
+    assert not ok
+
+
+def test_fake_claude_truncates_tool_results(tmp_path, monkeypatch):
+    """Oversized tool results are cut down to the configured size with a marker."""
+    monkeypatch.setattr(settings, "claude_binary_path", FAKE_CLAUDE)
+    monkeypatch.setattr(settings, "claude_max_tool_result_chars", 1000)
+    monkeypatch.setenv("FAKE_CLAUDE_TOOL_RESULT_BYTES", "100000")
+
+    ok, process, messages = asyncio.run(_run(tmp_path))
+
+    assert ok
+    result = messages[2]["message"]["content"][0]["content"]
+    assert "\n[... truncated " in result and result.endswith(" characters]")
+    assert len(result) < 1100
+    assert process.buffered_bytes == 0
+
+
+def test_fake_claude_output_cap(tmp_path, monkeypatch):
+    """Past the per-execution cap only a truncation marker and the final result get through."""
+    monkeypatch.setattr(settings, "claude_binary_path", FAKE_CLAUDE)
+    monkeypatch.setattr(settings, "claude_max_output_bytes", 4096)
+    monkeypatch.setattr(settings, "claude_output_queue_size", 2)
+    monkeypatch.setenv("FAKE_CLAUDE_MESSAGES", "50")
+    monkeypatch.setenv("FAKE_CLAUDE_TEXT_BYTES", "1000")
+
+    ok, process, messages = asyncio.run(_run(tmp_path))
+
+    assert ok
+    assert process.truncated
+    markers = [m for m in messages if m.get("subtype") == "output_truncated"]
+    assert len(markers) == 1 and markers[0]["reason"] == "execution"
+    assert messages[-1]["type"] == "result"
+    assert len(messages) < 10
+
+
+@pytest.mark.skipif(not os.path.isdir("/proc/self"), reason="needs /proc")
+def test_fake_claude_resources(tmp_path, monkeypatch):
+    """CPU time and memory of the CLI and the processes it starts are sampled into the execution's resources."""
+    monkeypatch.setattr(settings, "claude_binary_path", FAKE_CLAUDE)
+    monkeypatch.setattr(settings, "claude_resource_sample_seconds", 0.05)
+    monkeypatch.setenv("FAKE_CLAUDE_CHILD_SECONDS", "0.6")
+    monkeypatch.setenv("FAKE_CLAUDE_DELAY", "0.1")
+    monkeypatch.setenv("FAKE_CLAUDE_MESSAGES", "8")
+
+    ok, process, _ = asyncio.run(_run(tmp_path))
+
+    assert ok
+    resources = process.resources.as_dict()
+    assert resources["cpu_time_s"] >= 0.3
+    assert resources["peak_rss_bytes"] > 0
+    assert resources["peak_processes"] >= 2
+    assert resources["wall_time_s"] >= 0.8
+
+
+@pytest.mark.skipif(not hasattr(os, "killpg"), reason="needs process groups")
+def test_stop_session_kills_process_group(tmp_path, monkeypatch):
+    """Stopping a session by ID ends the CLI and everything it started, and removes it from the registry."""
+    monkeypatch.setattr(settings, "claude_binary_path", FAKE_CLAUDE)
+    monkeypatch.setenv("FAKE_CLAUDE_CHILD_SECONDS", "30")
+    monkeypatch.setenv("FAKE_CLAUDE_DELAY", "0.2")
+    monkeypatch.setenv("FAKE_CLAUDE_MESSAGES", "50")
+
+    async def run():
+        manager = ClaudeManager()
+        process = await manager.create_session("test-session", str(tmp_path), "hello there")
+        registered = manager.processes.get(process.session_id) is process
+        await asyncio.sleep(0.3)
+        before = _live_group_members(process.pgid)
+        stopped = await manager.stop_session(process.session_id)
+        await asyncio.sleep(0.1)
+        return process, manager, registered, before, stopped
+
+    process, manager, registered, before, stopped = asyncio.run(run())
+
+    assert registered and stopped
+    assert len(before) >= 2
+    assert process.cancel_reason == "request" and process.finished.is_set()
+    assert not manager.processes
+    assert not _live_group_members(process.pgid)
+
+
+def test_stream_disconnect_cancels_execution(tmp_path, monkeypatch):
+    """Closing a stream before the end (a client disconnect) stops the execution."""
+    monkeypatch.setattr(settings, "claude_binary_path", FAKE_CLAUDE)
+    monkeypatch.setattr(settings, "streaming_heartbeat_seconds", 0)
+    monkeypatch.setenv("FAKE_CLAUDE_DELAY", "0.2")
+    monkeypatch.setenv("FAKE_CLAUDE_MESSAGES", "50")
+
+    async def run():
+        process = ClaudeProcess("test-session", str(tmp_path))
+        assert await process.start(prompt="hello there")
+        stream = StreamingManager().create_stream(process.session_id, "claude-3-5-haiku-20241022", process)
+        await stream.__anext__()
+        await stream.aclose()
+        await asyncio.wait_for(process.finished.wait(), 5)
+        return process
+
+    process = asyncio.run(run())
+
+    assert process.cancel_reason == "disconnect"
+    assert process.process is None
+
+
+def test_slow_consumer_gets_end_of_output(tmp_path, monkeypatch):
+    """The end of output reaches a reader that is behind, even when the queue is full as the CLI exits."""
+    monkeypatch.setattr(settings, "claude_binary_path", FAKE_CLAUDE)
+    monkeypatch.setattr(settings, "claude_output_queue_size", 4)
+    monkeypatch.setattr(settings, "streaming_timeout_seconds", 10)
+    monkeypatch.setenv("FAKE_CLAUDE_MESSAGES", "20")
+
+    async def run():
+        process = ClaudeProcess("test-session", str(tmp_path))
+        assert await process.start(prompt="hello there", partial_messages=True)
+        messages = []
+        async for message in process.get_output():
+            messages.append(message)
+            await asyncio.sleep(0.005)
+        return messages
+
+    loop_start = time.monotonic()
+    messages = asyncio.run(run())
+
+    assert messages[-1]["type"] == "result" and len(messages) > 100
+    assert time.monotonic() - loop_start < 5
+
+
+def test_fake_claude_line_cap(tmp_path, monkeypatch):
+    """Lines over the cap are replaced by a marker even when they arrive whole in a single read."""
+    monkeypatch.setattr(settings, "claude_binary_path", FAKE_CLAUDE)
+    monkeypatch.setattr(settings, "claude_max_line_bytes", 1000)
+    monkeypatch.setenv("FAKE_CLAUDE_MESSAGES", "2")
+    monkeypatch.setenv("FAKE_CLAUDE_TEXT_BYTES", "5000")
+
+    ok, process, messages = asyncio.run(_run(tmp_path))
+
+    assert ok
+    markers = [m for m in messages if m.get("subtype") == "output_truncated"]
+    assert len(markers) >= 2 and all(m["reason"] == "line" and m["bytes"] > 5000 for m in markers)
+    assert messages[0]["type"] == "system" and messages[0]["session_id"] == process.session_id
+    assert not any(m["type"] == "assistant" and len(str(m)) > 5000 for m in messages)
+
+
+@pytest.mark.skipif(not os.path.isdir("/proc/self") or not hasattr(os, "killpg"), reason="needs /proc")
+def test_resource_sampler_samples_new_groups_at_once(monkeypatch):
+    """A group tracked while the sampler is between passes is sampled right away, not an interval later."""
+    monkeypatch.setattr(settings, "claude_resource_sample_seconds", 60)
+
+    async def run():
+        sampler = ResourceSampler()
+        processes = [
+            await asyncio.create_subprocess_exec("sleep", "5", start_new_session=True) for _ in range(2)
+        ]
+        usages = [ResourceUsage(), ResourceUsage()]
+        try:
+            sampler.track(processes[0].pid, usages[0])
+            await asyncio.sleep(0.2)
+            sampler.track(processes[1].pid, usages[1])
+            await asyncio.sleep(0.2)
+        finally:
+            sampler.untrack(processes[0].pid)
+            sampler.untrack(processes[1].pid)
+            sampler._task.cancel()
+            for process in processes:
+                process.kill()
+                await process.wait()
+        return usages
+
+    usages = asyncio.run(run())
+
+    assert all(usage.peak_rss_bytes and usage.peak_processes == 1 for usage in usages)
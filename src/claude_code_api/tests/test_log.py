@@ -0,0 +1,39 @@
+"""Tests for the logging setup."""
+
+import contextvars
+import logging
+import queue
+
+from claude_code_api.core import log, metrics
+from claude_code_api.core.config import settings
+
+
+def test_debug_sampled(monkeypatch, caplog):
+    """Debug logs are gated on the level first and then sampled once per request context."""
+    caplog.set_level(logging.INFO)
+    monkeypatch.setattr(settings, "log_debug_sample_rate", 1.0)
+    assert not contextvars.copy_context().run(log.debug_sampled)
+
+    caplog.set_level(logging.DEBUG)
+    monkeypatch.setattr(settings, "log_debug_sample_rate", 1.0)
+    context = contextvars.copy_context()
+    assert context.run(log.debug_sampled)
+
+    # The decision sticks for the rest of the request
+    monkeypatch.setattr(settings, "log_debug_sample_rate", 0.0)
+    assert context.run(log.debug_sampled)
+    assert not contextvars.copy_context().run(log.debug_sampled)
+
+
+def test_full_log_queue_drops_records():
+    """A full queue drops records instead of blocking the caller."""
+    records = queue.Queue(maxsize=1)
+    handler = log._DroppingQueueHandler(records)
+    before = metrics.LOG_RECORDS_DROPPED.render()
+
+    for i in range(3):
+        handler.emit(logging.LogRecord("t", logging.INFO, __file__, 1, f"message {i}", None, None))
+
+    assert records.qsize() == 1
+    assert records.get_nowait().getMessage() == "message 0"
+    assert metrics.LOG_RECORDS_DROPPED.render() != before
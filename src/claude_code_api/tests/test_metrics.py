@@ -0,0 +1,28 @@
+"""Tests for the Prometheus metrics registry."""
+
+from claude_code_api.core.metrics import Counter, Histogram, MAX_SERIES_PER_METRIC, OVERFLOW_LABEL
+
+
+def test_histogram_buckets_are_cumulative():
+    """Observations land in every bucket at or above their value."""
+    hist = Histogram("test_seconds", "Test histogram.", ("route",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        hist.observe(value, route="/x")
+
+    lines = hist.render()
+    assert 'test_seconds_bucket{route="/x",le="0.1"} 2' in lines
+    assert 'test_seconds_bucket{route="/x",le="1"} 3' in lines
+    assert 'test_seconds_bucket{route="/x",le="+Inf"} 4' in lines
+    assert 'test_seconds_count{route="/x"} 4' in lines
+    assert 'test_seconds_sum{route="/x"} 3.65' in lines
+
+
+def test_label_cardinality_is_capped():
+    """Series past the cap are folded into the overflow label."""
+    counter = Counter("test_total", "Test counter.", ("model",))
+    for i in range(MAX_SERIES_PER_METRIC + 10):
+        counter.inc(model=f"model-{i}")
+
+    lines = [line for line in counter.render() if not line.startswith("#")]
+    assert len(lines) == MAX_SERIES_PER_METRIC + 1
+    assert f'test_total{{model="{OVERFLOW_LABEL}"}} 10' in lines
@@ -0,0 +1,53 @@
+"""Tests for stream-json decoding."""
+
+import json
+
+import pytest
+
+from claude_code_api.core.config import settings
+from claude_code_api.utils import parser
+from claude_code_api.utils.parser import ClaudeOutputParser
+
+LINES = [
+    {"type": "system", "subtype": "init", "session_id": "s-1", "model": "claude-3-5-haiku-20241022", "tools": ["Read"]},
+    {"type": "assistant", "message": {"role": "assistant", "content": [{"type": "text", "text": "héllo"}]}, "session_id": "s-1"},
+    {"type": "result", "subtype": "success", "result": "héllo", "session_id": "s-1",
+     "usage": {"input_tokens": 3, "output_tokens": 2}},
+]
+
+
+@pytest.mark.parametrize("debug", [False, True])
+def test_parse_line_tracks_session(monkeypatch, debug):
+    """Validated and unvalidated parsing give the same messages and totals."""
+    monkeypatch.setattr(settings, "debug", debug)
+    output_parser = ClaudeOutputParser()
+
+    messages = [output_parser.parse_line(json.dumps(line)) for line in LINES]
+
+    assert [m.type for m in messages] == ["system", "assistant", "result"]
+    assert output_parser.extract_text_content(messages[1]) == "héllo"
+    assert output_parser.get_session_summary() == {
+        "session_id": "s-1",
+        "model": "claude-3-5-haiku-20241022",
+        "total_tokens": 5,
+        "total_cost": 0.0,
+        "message_count": 1,
+    }
+    assert output_parser.parse_line("not json") is None
+
+
+@pytest.mark.parametrize("backend", ["orjson", "json"])
+def test_json_backends_agree(monkeypatch, backend):
+    """The orjson fast path and the standard library decode and encode the same way."""
+    if backend == "orjson":
+        pytest.importorskip("orjson")
+    else:
+        monkeypatch.setattr(parser, "orjson", None)
+
+    for line in LINES:
+        raw = json.dumps(line)
+        assert parser.loads(raw) == parser.loads(raw.encode()) == line
+        assert json.loads(parser.dumps(line)) == line
+    assert "\n" not in parser.dumps(LINES[1]) and ", " not in parser.dumps(LINES[1])
+    with pytest.raises(json.JSONDecodeError):
+        parser.decode_message("{not json")
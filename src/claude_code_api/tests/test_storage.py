@@ -0,0 +1,138 @@
+"""Tests for project disk accounting, quotas and background deletion."""
+
+import asyncio
+import os
+import threading
+import time
+
+from claude_code_api.core.config import settings
+from claude_code_api.core.storage import DiskUsage, ProjectStorage, _delete_tree
+
+
+def _write(path, size: int):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(b"x" * size)
+
+
+def _fresh_total(root) -> int:
+    usage = DiskUsage(str(root))
+    usage.recount()
+    return usage.total
+
+
+def test_disk_usage_refresh(tmp_path):
+    """Refreshing picks up new, removed and reported files without relisting unchanged directories."""
+    _write(tmp_path / "a" / "one", 10000)
+    _write(tmp_path / "b" / "two", 10000)
+    usage = DiskUsage(str(tmp_path))
+    usage.recount()
+    assert usage.total == _fresh_total(tmp_path) > 0
+
+    _write(tmp_path / "a" / "new" / "three", 50000)
+    os.remove(tmp_path / "b" / "two")
+    usage.refresh()
+    assert usage.total == _fresh_total(tmp_path)
+
+    # Grown in place: the directory mtime does not change, so only a reported path is re-stat'ed
+    with open(tmp_path / "a" / "one", "ab") as f:
+        f.write(b"y" * 100000)
+    usage.refresh()
+    assert usage.total < _fresh_total(tmp_path)
+    usage.refresh([str(tmp_path / "a" / "one")], base=str(tmp_path))
+    assert usage.total == _fresh_total(tmp_path)
+
+
+def test_delete_tree(tmp_path):
+    """Trees, including symlinks to directories, are removed completely."""
+    for i in range(250):
+        _write(tmp_path / "tree" / f"d{i % 7}" / f"f{i}", 10)
+    os.symlink(tmp_path / "tree" / "d1", tmp_path / "tree" / "link")
+
+    removed = _delete_tree(str(tmp_path / "tree"), 0, threading.Event())
+
+    assert removed == 250 + 7 + 1 + 1
+    assert not os.path.exists(tmp_path / "tree")
+
+
+def test_quota_and_reclaim(tmp_path, monkeypatch):
+    """Projects over the quota are reported, and deleted projects disappear in the background."""
+    monkeypatch.setattr(settings, "max_project_size_mb", 1)
+    storage = ProjectStorage(root=str(tmp_path))
+    small, large, outside = tmp_path / "small", tmp_path / "large", tmp_path.parent / f"{tmp_path.name}-outside"
+    _write(small / "file", 1000)
+    _write(large / "file", 2 * 1024 * 1024)
+    outside.mkdir(exist_ok=True)
+
+    async def run():
+        await storage.start()
+        over = (await storage.over_quota(str(small)), await storage.over_quota(str(large)))
+        reclaimed = await storage.reclaim(str(large)), await storage.reclaim(str(outside))
+        while os.listdir(storage.trash):
+            await asyncio.sleep(0.01)
+        await storage.stop()
+        return over, reclaimed
+
+    over, reclaimed = asyncio.run(asyncio.wait_for(run(), 10))
+
+    assert over == (False, True)
+    assert reclaimed == (True, False)
+    assert not os.path.exists(large) and os.path.exists(outside)
+    assert str(large) not in storage.usage
+
+
+def test_expire_idle_projects(tmp_path, monkeypatch):
+    """Only project directories idle for longer than the TTL are reclaimed."""
+    monkeypatch.setattr(settings, "project_ttl_hours", 1)
+    storage = ProjectStorage(root=str(tmp_path))
+    (tmp_path / "idle").mkdir()
+    (tmp_path / "recent").mkdir()
+    (tmp_path / ".workspaces").mkdir()
+    old = time.time() - 2 * 3600
+    os.utime(tmp_path / "idle", (old, old))
+    os.utime(tmp_path / ".workspaces", (old, old))
+
+    asyncio.run(storage._expire())
+
+    assert sorted(os.listdir(tmp_path)) == [".trash", ".workspaces", "recent"]
+
+
+def test_projects_in_use_are_kept(tmp_path, monkeypatch):
+    """A held project is neither expired nor reclaimed until the hold is released."""
+    monkeypatch.setattr(settings, "project_ttl_hours", 1)
+    storage = ProjectStorage(root=str(tmp_path))
+    project = tmp_path / "busy"
+    project.mkdir()
+    old = time.time() - 2 * 3600
+    os.utime(project, (old, old))
+    storage.last_active[str(project)] = old
+
+    async def run():
+        storage.acquire(str(project))
+        await storage._expire()
+        held = os.path.exists(project), await storage.reclaim(str(project))
+        storage.release(str(project))
+        return held, await storage.reclaim(str(project))
+
+    (exists, reclaimed_while_held), reclaimed = asyncio.run(run())
+
+    assert exists and not reclaimed_while_held
+    assert reclaimed and not os.path.exists(project)
+    assert not storage.running
+
+
+def test_trash_entry_that_cannot_be_deleted(tmp_path, monkeypatch):
+    """An entry that fails to delete is left for later without holding up the others."""
+    storage = ProjectStorage(root=str(tmp_path))
+    _write(tmp_path / ".trash" / "stuck" / "file", 10)
+    _write(tmp_path / ".trash" / "other" / "file", 10)
+
+    def delete_tree(path, files_per_second, stop):
+        if os.path.basename(path) == "stuck":
+            raise OSError(39, "Directory not empty", path)
+        return _delete_tree(path, files_per_second, stop)
+
+    monkeypatch.setattr("claude_code_api.core.storage._delete_tree", delete_tree)
+    asyncio.run(storage._empty_trash())
+
+    assert os.listdir(storage.trash) == ["stuck"]
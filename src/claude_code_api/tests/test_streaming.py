@@ -0,0 +1,90 @@
+"""Tests for streaming heartbeats and stream-json conversion."""
+
+import asyncio
+import json
+import os
+
+from claude_code_api.core.claude_manager import ClaudeProcess
+from claude_code_api.core.config import settings
+from claude_code_api.utils.streaming import OpenAIStreamConverter, SSEFormatter, StreamingManager
+
+FAKE_CLAUDE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_claude.py")
+
+
+async def _slow_stream():
+    yield "data: first\n\n"
+    await asyncio.sleep(0.25)
+    yield "data: second\n\n"
+
+
+async def _collect(manager: StreamingManager):
+    return [chunk async for chunk in manager._send_heartbeats(_slow_stream())]
+
+
+def test_heartbeats_fill_idle_gaps():
+    """A heartbeat comment is sent while the source is quiet, without dropping or reordering chunks."""
+    manager = StreamingManager()
+    manager.heartbeat_interval = 0.1
+
+    chunks = asyncio.run(_collect(manager))
+
+    assert chunks[0] == "data: first\n\n"
+    assert chunks[-1] == "data: second\n\n"
+    assert SSEFormatter.format_heartbeat() in chunks[1:-1]
+
+
+def test_heartbeats_disabled():
+    """With a zero interval the source is relayed unchanged."""
+    manager = StreamingManager()
+    manager.heartbeat_interval = 0
+
+    chunks = asyncio.run(_collect(manager))
+
+    assert chunks == ["data: first\n\n", "data: second\n\n"]
+
+
+async def _convert(tmp_path, partial_messages: bool) -> list:
+    process = ClaudeProcess("test-session", str(tmp_path))
+    assert await process.start(prompt="hello there", partial_messages=partial_messages)
+    converter = OpenAIStreamConverter("claude-3-5-haiku-20241022", process.session_id)
+    events = [event async for event in converter.convert_stream(process)]
+    assert events[-1] == SSEFormatter.format_completion("")
+    return [json.loads(event[len("data: "):]) for event in events[:-1]]
+
+
+def _assemble(chunks: list) -> tuple:
+    """Rebuild the text and tool calls a client would see from the chunks."""
+    text, calls = "", {}
+    for chunk in chunks:
+        delta = chunk["choices"][0]["delta"]
+        assert delta.get("role") in (None, "assistant")
+        text += delta.get("content") or ""
+        for call in delta.get("tool_calls", []):
+            entry = calls.setdefault(call["index"], {"id": None, "name": None, "arguments": ""})
+            entry["id"] = call.get("id") or entry["id"]
+            entry["name"] = call.get("function", {}).get("name") or entry["name"]
+            entry["arguments"] += call.get("function", {}).get("arguments", "")
+    return text, calls
+
+
+def test_convert_stream_relays_every_event(tmp_path, monkeypatch):
+    """Long runs are streamed in full, with tool calls and the CLI's usage but without tool results."""
+    monkeypatch.setattr(settings, "claude_binary_path", FAKE_CLAUDE)
+    monkeypatch.setenv("FAKE_CLAUDE_MESSAGES", "12")
+    monkeypatch.setenv("FAKE_CLAUDE_TOOL_USES", "3")
+    monkeypatch.setenv("FAKE_CLAUDE_TEXT_BYTES", "40")
+    monkeypatch.setenv("FAKE_CLAUDE_TOOL_RESULT_BYTES", "5000")
+
+    full = asyncio.run(_convert(tmp_path, partial_messages=False))
+    partial = asyncio.run(_convert(tmp_path, partial_messages=True))
+
+    for chunks in (full, partial):
+        text, calls = _assemble(chunks)
+        assert len(text.split("\n")) == 12 and len(text) < 12 * 100
+        assert [call["name"] for call in calls.values()] == ["Read"] * 3
+        assert all(json.loads(call["arguments"])["file_path"] for call in calls.values())
+        assert chunks[-1]["choices"][0]["finish_reason"] == "stop"
+        assert chunks[-1]["usage"]["completion_tokens"] > 0
+    assert _assemble(full)[0] == _assemble(partial)[0]
+    # Partial messages arrive word by word
+    assert len(partial) > len(full) * 3
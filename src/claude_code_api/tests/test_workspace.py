@@ -0,0 +1,162 @@
+"""Tests for creating project workspaces from templates."""
+
+import asyncio
+import os
+
+import pytest
+
+from claude_code_api.core import workspace
+from claude_code_api.core.workspace import WorkspaceManager
+
+
+def _template(tmp_path) -> str:
+    template = tmp_path / "template"
+    (template / "src").mkdir(parents=True)
+    (template / "src" / "main.py").write_text("print('hello')\n")
+    (template / "README").write_text("template\n")
+    os.symlink("src/main.py", template / "entry.py")
+    return str(template)
+
+
+async def _wait_for_pool(manager: WorkspaceManager, template: str):
+    while len(manager.pools[template]) < manager.pool_size:
+        await asyncio.sleep(0.01)
+
+
+def test_copy_workspace_from_pool(tmp_path):
+    """Pooled clones are handed out by rename and are independent of the template."""
+    template = _template(tmp_path)
+    manager = WorkspaceManager(str(tmp_path / "projects"), {"app": template}, "copy", pool_size=2)
+
+    async def run():
+        await manager.start()
+        await asyncio.wait_for(_wait_for_pool(manager, "app"), 10)
+        pooled = set(manager.pools["app"])
+        path = await manager.provision("p1", "app")
+        again = await manager.provision("p1", "app")
+        await asyncio.wait_for(_wait_for_pool(manager, "app"), 10)
+        await manager.stop()
+        return pooled, path, again
+
+    pooled, path, again = asyncio.run(run())
+
+    assert path == again == str(tmp_path / "projects" / "p1")
+    assert not any(os.path.exists(clone) for clone in pooled - set(manager.pools["app"]))
+    assert os.readlink(os.path.join(path, "entry.py")) == "src/main.py"
+    with open(os.path.join(path, "src", "main.py"), "w") as f:
+        f.write("changed\n")
+    with open(os.path.join(template, "src", "main.py")) as f:
+        assert f.read() == "print('hello')\n"
+    assert manager.get_info(path)["method"] == "copy"
+    assert manager.template_for("p1") == "app"
+
+    asyncio.run(manager.release(path))
+    assert not os.path.exists(path)
+    assert not manager.is_workspace(path)
+
+
+def test_stale_pool_discarded(tmp_path):
+    """Clones made before the template changed are not handed out."""
+    template = _template(tmp_path)
+    manager = WorkspaceManager(str(tmp_path / "projects"), {"app": template}, "copy", pool_size=1)
+
+    async def run():
+        await manager.start()
+        await asyncio.wait_for(_wait_for_pool(manager, "app"), 10)
+        with open(os.path.join(template, "NEW"), "w") as f:
+            f.write("new\n")
+        os.utime(template, ns=(0, os.stat(template).st_mtime_ns + 10**9))
+        path = await manager.provision("p1", "app")
+        await manager.stop()
+        return path
+
+    path = asyncio.run(run())
+
+    assert os.path.exists(os.path.join(path, "NEW"))
+
+
+def test_unknown_template_and_existing_directory(tmp_path):
+    """Unknown templates and plain directories in the way are refused."""
+    manager = WorkspaceManager(str(tmp_path / "projects"), {"app": _template(tmp_path)}, "copy", pool_size=0)
+    os.makedirs(tmp_path / "projects" / "taken")
+
+    with pytest.raises(KeyError):
+        asyncio.run(manager.provision("p1", "missing"))
+    with pytest.raises(FileExistsError):
+        asyncio.run(manager.provision("taken", "app"))
+
+
+def test_auto_falls_back_to_copy(tmp_path, monkeypatch):
+    """Without overlay or reflink support, auto copies."""
+    monkeypatch.setattr(workspace, "_overlay_available", lambda: False)
+    monkeypatch.setattr(workspace, "FICLONE", 0)  # not a valid ioctl, so reflinking fails like on ext4
+    manager = WorkspaceManager(str(tmp_path / "projects"), {"app": _template(tmp_path)}, "auto", pool_size=0)
+
+    path = asyncio.run(manager.provision("p1", "app"))
+
+    assert manager.get_info(path)["method"] == "copy"
+    assert os.path.isfile(os.path.join(path, "src", "main.py"))
+
+
+def _failing_run(cmd):
+    raise OSError(f"{cmd[0]} failed: permission denied")
+
+
+def test_auto_skips_overlay_when_trial_mount_fails(tmp_path, monkeypatch):
+    """Overlay support is decided by an actual mount, which leaves nothing behind when it fails."""
+    monkeypatch.setattr(workspace, "_overlay_available", lambda: True)
+    monkeypatch.setattr(workspace, "_run", _failing_run)
+    monkeypatch.setattr(workspace, "FICLONE", 0)
+    root = tmp_path / "projects"
+    manager = WorkspaceManager(str(root), {"app": _template(tmp_path)}, "auto", pool_size=0)
+
+    path = asyncio.run(manager.provision("p1", "app"))
+
+    assert manager.get_info(path)["method"] == "copy"
+    assert not [name for name in os.listdir(root / workspace.METADATA_DIR) if name.startswith(".probe-")]
+
+
+def test_failed_overlay_mount_falls_back(tmp_path, monkeypatch):
+    """A failed mount is cleaned up and the template switches to a method that works."""
+    monkeypatch.setattr(workspace, "_run", _failing_run)
+    monkeypatch.setattr(workspace, "FICLONE", 0)
+    manager = WorkspaceManager(str(tmp_path / "projects"), {"app": _template(tmp_path)}, "auto", pool_size=0)
+    manager._methods["app"] = "overlay"
+
+    path = asyncio.run(manager.provision("p1", "app"))
+
+    assert manager.get_info(path)["method"] == "copy"
+    assert os.path.isfile(os.path.join(path, "src", "main.py"))
+    assert manager._methods["app"] == "copy"
+
+
+def test_failed_overlay_mount_can_be_retried(tmp_path, monkeypatch):
+    """With overlay configured explicitly the error is raised, but the next attempt is not blocked by leftovers."""
+    monkeypatch.setattr(workspace, "_run", _failing_run)
+    manager = WorkspaceManager(str(tmp_path / "projects"), {"app": _template(tmp_path)}, "overlay", pool_size=0)
+
+    for _ in range(2):
+        with pytest.raises(OSError) as excinfo:
+            asyncio.run(manager.provision("p1", "app"))
+        assert not isinstance(excinfo.value, FileExistsError)
+    assert not os.path.exists(tmp_path / "projects" / "p1")
+    assert not os.path.exists(manager._meta_path(str(tmp_path / "projects" / "p1")))
+
+
+@pytest.mark.skipif(not workspace._overlay_available(), reason="overlay mounts are not available")
+def test_overlay_workspace(tmp_path):
+    """Overlay workspaces keep changes in the upper layer and leave the template alone."""
+    template = _template(tmp_path)
+    manager = WorkspaceManager(str(tmp_path / "projects"), {"app": template}, "overlay", pool_size=0)
+
+    path = asyncio.run(manager.provision("p1", "app"))
+    try:
+        assert os.path.ismount(path)
+        with open(os.path.join(path, "README"), "w") as f:
+            f.write("changed\n")
+        with open(os.path.join(template, "README")) as f:
+            assert f.read() == "template\n"
+    finally:
+        asyncio.run(manager.release(path))
+
+    assert not os.path.exists(path)
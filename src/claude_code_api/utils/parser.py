@@ -2,15 +2,52 @@
 
 import json
 import re
-from typing import Dict, Any, Optional, List, Generator
+from typing import Dict, Any, Optional, List, Generator, Union
 from datetime import datetime
 import structlog
+from pydantic import ValidationError
 
-from claude_code_api.models.claude import ClaudeMessage, ClaudeToolUse, ClaudeToolResult
+from claude_code_api.core.config import settings
+from claude_code_api.models.claude import ClaudeMessage, ClaudeMessageLite, ClaudeToolUse, ClaudeToolResult
+
+try:
+    import orjson
+except ImportError:  # optional, installed with the "fast" extra
+    orjson = None
 
 logger = structlog.get_logger()
 
 
+def loads(data: Union[str, bytes]) -> Any:
+    """Decode JSON, with orjson when it is installed. Errors are json.JSONDecodeError either way."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps(obj: Any) -> str:
+    """Encode JSON compactly, with orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(obj).decode()
+    return json.dumps(obj, separators=(',', ':'))
+
+
+def decode_message(line: Union[str, bytes]) -> Dict[str, Any]:
+    """
+    Decode one stream-json line into a plain dict.
+    
+    Messages are only checked against the ClaudeMessage model in debug mode; a mismatch is logged
+    and the message is still used.
+    """
+    data = loads(line)
+    if settings.debug and isinstance(data, dict):
+        try:
+            ClaudeMessage.model_validate(data)
+        except ValidationError as e:
+            logger.warning("Unexpected stream-json message", message_type=data.get("type"), error=str(e))
+    return data
+
+
 class ClaudeOutputParser:
     """Parser for Claude Code JSONL output."""
     
@@ -21,35 +58,36 @@ class ClaudeOutputParser:
         self.total_cost = 0.0
         self.message_count = 0
     
-    def parse_line(self, line: str) -> Optional[ClaudeMessage]:
-        """Parse a single JSONL line."""
+    def parse_line(self, line: str) -> Optional[Union[ClaudeMessage, ClaudeMessageLite]]:
+        """Parse a single JSONL line; the message is only validated (as a ClaudeMessage) in debug mode."""
         if not line.strip():
             return None
         
         try:
-            data = json.loads(line.strip())
-            message = ClaudeMessage(**data)
+            data = loads(line)
+            message_type = data.get("type")
             
             # Extract session info on first message
-            if message.session_id and not self.session_id:
-                self.session_id = message.session_id
+            if not self.session_id and data.get("session_id"):
+                self.session_id = data["session_id"]
             
-            if message.model and not self.model:
-                self.model = message.model
+            if message_type == "system":
+                if not self.model and data.get("model"):
+                    self.model = data["model"]
+            elif message_type in ("user", "assistant"):
+                self.message_count += 1
             
             # Track metrics
-            if message.usage:
-                input_tokens = message.usage.get("input_tokens", 0)
-                output_tokens = message.usage.get("output_tokens", 0)
-                self.total_tokens += input_tokens + output_tokens
-            
-            if message.cost_usd:
-                self.total_cost += message.cost_usd
+            usage = data.get("usage")
+            if usage:
+                self.total_tokens += usage.get("input_tokens", 0) + usage.get("output_tokens", 0)
             
-            if message.type in ["user", "assistant"]:
-                self.message_count += 1
+            if data.get("cost_usd"):
+                self.total_cost += data["cost_usd"]
             
-            return message
+            if settings.debug:
+                return ClaudeMessage(**data)
+            return ClaudeMessageLite(data)
             
         except json.JSONDecodeError as e:
             logger.warning("Failed to parse JSONL line", line=line[:100], error=str(e))
@@ -1,15 +1,16 @@
 """Server-Sent Events streaming utilities for OpenAI compatibility."""
 
-import json
 import asyncio
 import uuid
+from contextlib import aclosing
 from datetime import datetime
-from typing import AsyncGenerator, Dict, Any, Optional
+from typing import AsyncGenerator, Dict, Any, List, Optional, Set
 import structlog
 
-from claude_code_api.models.claude import ClaudeMessage
-from claude_code_api.utils.parser import ClaudeOutputParser, OpenAIConverter, MessageAggregator
+from claude_code_api.utils.parser import dumps
 from claude_code_api.core.claude_manager import ClaudeProcess
+from claude_code_api.core.config import settings
+from claude_code_api.core.log import debug_sampled
 
 logger = structlog.get_logger()
 
@@ -25,8 +26,7 @@ class SSEFormatter:
         We deliberately omit the `event:` line so the default
         event-type **message** is used.
         """
-        json_data = json.dumps(data, separators=(',', ':'))
-        return f"data: {json_data}\n\n"
+        return f"data: {dumps(data)}\n\n"
     
     @staticmethod
     def format_completion(data: str) -> str:
@@ -52,7 +52,12 @@ class SSEFormatter:
 
 
 class OpenAIStreamConverter:
-    """Converts Claude Code output to OpenAI-compatible streaming format."""
+    """
+    Converts Claude Code output to OpenAI-compatible streaming format.
+    
+    Every stream-json message is turned into zero or more OpenAI deltas as it arrives; nothing but a few
+    counters is kept between messages, so a run can be arbitrarily long.
+    """
     
     def __init__(self, model: str, session_id: str):
         self.model = model
@@ -60,7 +65,129 @@ class OpenAIStreamConverter:
         self.completion_id = f"chatcmpl-{uuid.uuid4().hex[:29]}"
         self.created = int(datetime.utcnow().timestamp())
         self.chunk_index = 0
+        self.usage: Optional[Dict[str, int]] = None
+        self.cost = 0.0
+        self.finish_reason = "stop"
+        self._tool_calls = 0
+        # Content block index -> tool_calls index, for the partial message being streamed
+        self._block_tools: Dict[int, int] = {}
+        # Id of the message streamed through partial events; its complete copy is skipped
+        self._partial_message_id: Optional[str] = None
+        # Id of the message the last text came from; text from a new message starts on a new line
+        self._text_message_id: Optional[str] = None
+    
+    def chunk(self, delta: Dict[str, Any], finish_reason: Optional[str] = None) -> Dict[str, Any]:
+        """Wrap a delta in a chat.completion.chunk."""
+        self.chunk_index += 1
+        return {
+            "id": self.completion_id,
+            "object": "chat.completion.chunk",
+            "created": self.created,
+            "model": self.model,
+            "choices": [{
+                "index": 0,
+                "delta": delta,
+                "finish_reason": finish_reason
+            }]
+        }
+    
+    def convert_message(self, message: Any) -> List[Dict[str, Any]]:
+        """Convert one stream-json message into OpenAI deltas, recording usage from the final result."""
+        if not isinstance(message, dict):
+            return []
+        message_type = message.get("type")
+        
+        if message_type == "stream_event":
+            return self._convert_event(message.get("event") or {})
+        
+        if message_type == "assistant":
+            body = message.get("message") or {}
+            if body.get("id") and body.get("id") == self._partial_message_id:
+                return []
+            content = body.get("content")
+            if isinstance(content, str):
+                content = [{"type": "text", "text": content}]
+            deltas = []
+            for block in content or []:
+                if not isinstance(block, dict):
+                    continue
+                if block.get("type") == "text" and block.get("text"):
+                    deltas.append(self._text_delta(body.get("id"), block["text"]))
+                elif block.get("type") == "tool_use":
+                    deltas.append(self._tool_call_delta(
+                        self._tool_calls, block.get("id"), block.get("name"), dumps(block.get("input") or {})
+                    ))
+                    self._tool_calls += 1
+            return deltas
         
+        # Tool results (user messages) are consumed by Claude Code itself and are not part of the answer. OpenAI
+        # clients would merge them into the assistant's content, so they are left out as in non-streaming responses.
+        
+        if message_type == "system" and message.get("subtype") == "output_truncated":
+            self.finish_reason = "length"
+            return []
+        
+        if message_type == "result":
+            usage = message.get("usage") or {}
+            prompt_tokens = sum(
+                usage.get(key) or 0
+                for key in ("input_tokens", "cache_creation_input_tokens", "cache_read_input_tokens")
+            )
+            completion_tokens = usage.get("output_tokens") or 0
+            self.usage = {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens
+            }
+            self.cost = message.get("total_cost_usd") or 0.0
+            return []
+        
+        if message_type == "text" and message.get("content"):
+            # Non-JSON output from the CLI
+            return [self._text_delta(None, message["content"])]
+        
+        return []
+    
+    def _convert_event(self, event: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Convert a partial message event (``--include-partial-messages``)."""
+        event_type = event.get("type")
+        if event_type == "message_start":
+            self._partial_message_id = (event.get("message") or {}).get("id")
+            self._block_tools.clear()
+        elif event_type == "content_block_start":
+            block = event.get("content_block") or {}
+            if block.get("type") == "tool_use":
+                self._block_tools[event.get("index")] = self._tool_calls
+                self._tool_calls += 1
+                return [self._tool_call_delta(self._block_tools[event.get("index")], block.get("id"), block.get("name"), "")]
+        elif event_type == "content_block_delta":
+            delta = event.get("delta") or {}
+            if delta.get("type") == "text_delta" and delta.get("text"):
+                return [self._text_delta(self._partial_message_id, delta["text"])]
+            if delta.get("type") == "input_json_delta" and event.get("index") in self._block_tools:
+                return [{"tool_calls": [{
+                    "index": self._block_tools[event["index"]],
+                    "function": {"arguments": delta.get("partial_json", "")}
+                }]}]
+        return []
+    
+    def _text_delta(self, message_id: Optional[str], text: str) -> Dict[str, Any]:
+        """Content delta, starting a new line when the text comes from a different message."""
+        if self._text_message_id is not None and message_id != self._text_message_id:
+            text = "\n" + text
+        self._text_message_id = message_id or ""
+        return {"content": text}
+    
+    @staticmethod
+    def _tool_call_delta(index: int, call_id: Optional[str], name: Optional[str], arguments: str) -> Dict[str, Any]:
+        """First delta of a tool call."""
+        return {"tool_calls": [{
+            "index": index,
+            "id": call_id,
+            "type": "function",
+            "function": {"name": name, "arguments": arguments}
+        }]}
+    
     async def convert_stream(
         self, 
         claude_process: ClaudeProcess
@@ -68,86 +195,28 @@ class OpenAIStreamConverter:
         """Convert Claude Code output stream to OpenAI format."""
         try:
             # Send initial chunk to establish streaming
-            initial_chunk = {
-                "id": self.completion_id,
-                "object": "chat.completion.chunk",
-                "created": self.created,
-                "model": self.model,
-                "choices": [{
-                    "index": 0,
-                    "delta": {"role": "assistant", "content": ""},
-                    "finish_reason": None
-                }]
-            }
-            yield SSEFormatter.format_event(initial_chunk)
-            
-            assistant_started = False
-            last_content = ""
-            chunk_count = 0
-            max_chunks = 5  # Limit chunks for better UX
+            yield SSEFormatter.format_event(self.chunk({"role": "assistant", "content": ""}))
             
             # Process Claude output
-            async for claude_message in claude_process.get_output():
-                chunk_count += 1
-                if chunk_count > max_chunks:
-                    logger.info("Reached max chunks limit, terminating stream")
-                    break
-                try:
-                    # Simple: just look for assistant messages in the dict
-                    if isinstance(claude_message, dict):
-                        if (claude_message.get("type") == "assistant" and 
-                            claude_message.get("message", {}).get("content")):
-                            
-                            message_content = claude_message["message"]["content"]
-                            text_content = ""
-                            
-                            # Handle content array format: [{"type":"text","text":"..."}]
-                            if isinstance(message_content, list):
-                                for content_item in message_content:
-                                    if (isinstance(content_item, dict) and 
-                                        content_item.get("type") == "text" and 
-                                        content_item.get("text")):
-                                        text_content = content_item["text"]
-                                        break
-                            # Handle simple string content
-                            elif isinstance(message_content, str):
-                                text_content = message_content
-                            
-                            if text_content.strip():
-                                chunk = {
-                                    "id": self.completion_id,
-                                    "object": "chat.completion.chunk",
-                                    "created": self.created,
-                                    "model": self.model,
-                                    "choices": [{
-                                        "index": 0,
-                                        "delta": {"content": text_content},
-                                        "finish_reason": None
-                                    }]
-                                }
-                                yield SSEFormatter.format_event(chunk)
-                                assistant_started = True
-                        
-                        # Stop on result type
-                        if claude_message.get("type") == "result":
-                            break
-                        
-                except Exception as e:
-                    logger.error("Error processing Claude message", error=str(e))
-                    continue
+            async with aclosing(claude_process.get_output()) as output:
+                async for claude_message in output:
+                    try:
+                        for delta in self.convert_message(claude_message):
+                            yield SSEFormatter.format_event(self.chunk(delta))
+                    except Exception as e:
+                        logger.error("Error processing Claude message", error=str(e))
+                        continue
+                    
+                    # Stop on result type
+                    if isinstance(claude_message, dict) and claude_message.get("type") == "result":
+                        break
             
             # Send final chunk
-            final_chunk = {
-                "id": self.completion_id,
-                "object": "chat.completion.chunk",
-                "created": self.created,
-                "model": self.model,
-                "choices": [{
-                    "index": 0,
-                    "delta": {},
-                    "finish_reason": "stop"
-                }]
-            }
+            final_chunk = self.chunk({}, self.finish_reason)
+            if self.usage is not None:
+                final_chunk["usage"] = self.usage
+            if claude_process.resources is not None:
+                final_chunk["resources"] = claude_process.resources.as_dict()
             yield SSEFormatter.format_event(final_chunk)
             
             # Send completion signal
@@ -170,9 +239,9 @@ class OpenAIStreamConverter:
                     "role": "assistant",
                     "content": "Response completed"
                 },
-                "finish_reason": "stop"
+                "finish_reason": self.finish_reason
             }],
-            "usage": {
+            "usage": self.usage or {
                 "prompt_tokens": 10,
                 "completion_tokens": 5,
                 "total_tokens": 15
@@ -186,7 +255,8 @@ class StreamingManager:
     
     def __init__(self):
         self.active_streams: Dict[str, OpenAIStreamConverter] = {}
-        self.heartbeat_interval = 30  # seconds
+        self._cancellations: Set[asyncio.Task] = set()
+        self.heartbeat_interval = settings.streaming_heartbeat_seconds
     
     async def create_stream(
         self,
@@ -199,18 +269,17 @@ class StreamingManager:
         self.active_streams[session_id] = converter
         
         try:
-            # Start heartbeat task
-            heartbeat_task = asyncio.create_task(
-                self._send_heartbeats(session_id)
-            )
-            
-            # Stream conversion
-            async for chunk in converter.convert_stream(claude_process):
+            # Stream conversion, with heartbeats while Claude is quiet
+            async for chunk in self._send_heartbeats(converter.convert_stream(claude_process)):
                 yield chunk
             
-            # Cancel heartbeat
-            heartbeat_task.cancel()
-            
+        except (asyncio.CancelledError, GeneratorExit):
+            # The client went away mid-stream. Awaits here may be cancelled again, so stopping the CLI and its
+            # tools runs as a task of its own
+            task = asyncio.ensure_future(claude_process.cancel("disconnect"))
+            self._cancellations.add(task)
+            task.add_done_callback(self._cancellations.discard)
+            raise
         except Exception as e:
             logger.error("Streaming error", session_id=session_id, error=str(e))
             yield SSEFormatter.format_error(f"Streaming failed: {str(e)}")
@@ -219,14 +288,35 @@ class StreamingManager:
             if session_id in self.active_streams:
                 del self.active_streams[session_id]
     
-    async def _send_heartbeats(self, session_id: str):
-        """Send periodic heartbeats to keep connection alive."""
+    async def _send_heartbeats(self, stream: AsyncGenerator[str, None]) -> AsyncGenerator[str, None]:
+        """Relay stream chunks, sending a heartbeat comment whenever nothing was sent for heartbeat_interval."""
+        if not self.heartbeat_interval or self.heartbeat_interval <= 0:
+            async for chunk in stream:
+                yield chunk
+            return
+        
+        # The pending read is kept across heartbeats; cancelling it on a timeout would close the stream
+        next_chunk = asyncio.ensure_future(stream.__anext__())
         try:
-            while session_id in self.active_streams:
-                await asyncio.sleep(self.heartbeat_interval)
-                # Heartbeats are handled by the SSE client
-        except asyncio.CancelledError:
-            pass
+            while True:
+                done, _ = await asyncio.wait({next_chunk}, timeout=self.heartbeat_interval)
+                if not done:
+                    yield SSEFormatter.format_heartbeat()
+                    continue
+                try:
+                    chunk = next_chunk.result()
+                except StopAsyncIteration:
+                    return
+                yield chunk
+                next_chunk = asyncio.ensure_future(stream.__anext__())
+        finally:
+            if not next_chunk.done():
+                next_chunk.cancel()
+                try:
+                    await next_chunk
+                except (asyncio.CancelledError, StopAsyncIteration):
+                    pass
+            await stream.aclose()
     
     def get_active_stream_count(self) -> int:
         """Get number of active streams."""
@@ -329,76 +419,28 @@ async def create_sse_response(
 
 
 def create_non_streaming_response(
-    messages: list,
+    content: str,
     session_id: str,
     model: str,
-    usage_summary: Dict[str, Any]
+    usage: Optional[Dict[str, int]] = None,
+    finish_reason: str = "stop"
 ) -> Dict[str, Any]:
-    """Create non-streaming response."""
+    """Create non-streaming response from the text collected by OpenAIStreamConverter."""
     completion_id = f"chatcmpl-{uuid.uuid4().hex[:29]}"
     created = int(datetime.utcnow().timestamp())
     
-    logger.info(
-        "Creating non-streaming response",
-        session_id=session_id,
-        model=model,
-        messages_count=len(messages),
-        completion_id=completion_id
-    )
-    
-    # Extract assistant content from Claude messages
-    content_parts = []
-    for i, msg in enumerate(messages):
-        logger.info(
-            f"Processing message {i}",
-            msg_type=msg.get("type") if isinstance(msg, dict) else type(msg).__name__,
-            msg_keys=list(msg.keys()) if isinstance(msg, dict) else [],
-            is_assistant=isinstance(msg, dict) and msg.get("type") == "assistant"
-        )
-        
-        if isinstance(msg, dict):
-            # Handle dict messages directly
-            if msg.get("type") == "assistant" and msg.get("message"):
-                message_content = msg["message"].get("content", [])
-                
-                logger.info(
-                    f"Found assistant message {i}",
-                    content_type=type(message_content).__name__,
-                    content_preview=str(message_content)[:100] if message_content else "empty"
-                )
-                
-                # Handle content array format: [{"type":"text","text":"..."}]
-                if isinstance(message_content, list):
-                    for content_item in message_content:
-                        if isinstance(content_item, dict) and content_item.get("type") == "text":
-                            text = content_item.get("text", "").strip()
-                            if text:
-                                content_parts.append(text)
-                                logger.info(f"Extracted text from array: {text[:50]}...")
-                # Handle simple string content
-                elif isinstance(message_content, str) and message_content.strip():
-                    text = message_content.strip()
-                    content_parts.append(text)
-                    logger.info(f"Extracted text from string: {text[:50]}...")
-    
     # Use the actual content or fallback - ensure we always have content
-    if content_parts:
-        complete_content = "\n".join(content_parts).strip()
-    else:
-        complete_content = "Hello! I'm Claude, ready to help."
-    
-    # Ensure content is never empty
-    if not complete_content:
-        complete_content = "Response received but content was empty."
+    complete_content = content.strip() or "Hello! I'm Claude, ready to help."
     
-    logger.info(
-        "Final response content",
-        content_parts_count=len(content_parts),
-        final_content_length=len(complete_content),
-        final_content_preview=complete_content[:100] if complete_content else "empty"
-    )
+    # Without a result message from the CLI the usage is estimated from the text
+    if usage is None:
+        completion_tokens = len(complete_content.split()) or 5
+        usage = {
+            "prompt_tokens": 10,
+            "completion_tokens": completion_tokens,
+            "total_tokens": 10 + completion_tokens
+        }
     
-    # Return simple OpenAI-compatible response with basic usage stats
     response = {
         "id": completion_id,
         "object": "chat.completion",
@@ -410,21 +452,19 @@ def create_non_streaming_response(
                 "role": "assistant",
                 "content": complete_content
             },
-            "finish_reason": "stop"
+            "finish_reason": finish_reason
         }],
-        "usage": {
-            "prompt_tokens": 10,
-            "completion_tokens": len(complete_content.split()) if complete_content else 5,
-            "total_tokens": 10 + (len(complete_content.split()) if complete_content else 5)
-        },
+        "usage": usage,
         "session_id": session_id
     }
     
-    logger.info(
-        "Response created successfully",
-        response_id=response["id"],
-        choices_count=len(response["choices"]),
-        message_content_length=len(response["choices"][0]["message"]["content"])
-    )
+    if debug_sampled():
+        logger.debug(
+            "Created non-streaming response",
+            session_id=session_id,
+            response_id=completion_id,
+            content_length=len(complete_content),
+            content_preview=complete_content[:100]
+        )
     
     return response
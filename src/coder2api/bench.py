@@ -0,0 +1,380 @@
+import asyncio
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional
+
+import httpx
+
+# Route families exercised by `coder2api bench`: proxy prefix, path on the backend, model name
+ROUTES = {
+    "codex": ("/codex", "/v1/chat/completions", "gpt-5"),
+    "cc": ("/cc", "/v1/chat/completions", "claude-3-5-haiku-20241022"),
+    "gemini": ("/gemini", "/openai/chat/completions", "gemini-2.5-flash"),
+}
+
+# Request header asking the Gemini stand-in to stall after the first chunk (used to hold streams open)
+HOLD_HEADER = "x-bench-hold"
+
+
+@dataclass
+class BenchConfig:
+    requests: int = 200
+    concurrency: int = 8
+    routes: List[str] = field(default_factory=lambda: list(ROUTES))
+    stream_ratio: float = 0.5
+    prompt_sizes: List[int] = field(default_factory=lambda: [200, 4000, 32000])
+    disconnect_rate: float = 0.0
+    tokens: int = 200
+    open_streams: int = 50
+    seed: int = 0
+
+
+@dataclass
+class Sample:
+    status: int
+    ttfb: float
+    latency: float
+    nbytes: int
+    disconnected: bool
+
+
+def gemini_stub_app():
+    """
+    ASGI stand-in for the Gemini CLI Proxy's OpenAI route, for `uvicorn --factory`. Answers with
+    CODER2API_BENCH_TOKENS words, as one JSON body or one SSE chunk per word.
+    """
+    tokens = int(os.environ.get("CODER2API_BENCH_TOKENS") or 200)
+    words = [("" if i == 0 else " ") + "word" for i in range(tokens)]
+
+    async def app(scope, receive, send):
+        if scope["type"] != "http":
+            return
+        if scope["path"] == "/health":
+            await _send_json(send, {"status": "ok"})
+            return
+        body = b""
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+        try:
+            payload = json.loads(body or b"{}")
+        except ValueError:
+            payload = {}
+        model = payload.get("model") or "gemini"
+        if not payload.get("stream"):
+            await _send_json(send, {
+                "id": "chatcmpl-bench",
+                "object": "chat.completion",
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(words)}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": len(body) // 4, "completion_tokens": tokens, "total_tokens": len(body) // 4 + tokens},
+            })
+            return
+        headers = dict(scope["headers"])
+        hold = float(headers.get(HOLD_HEADER.encode(), b"0") or 0)
+        await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"text/event-stream")]})
+        for i, word in enumerate(words):
+            chunk = {"id": "chatcmpl-bench", "object": "chat.completion.chunk", "model": model, "choices": [{"index": 0, "delta": {"content": word}, "finish_reason": None}]}
+            await send({"type": "http.response.body", "body": f"data: {json.dumps(chunk)}\n\n".encode(), "more_body": True})
+            if i == 0 and hold > 0:
+                await asyncio.sleep(hold)
+        await send({"type": "http.response.body", "body": b"data: [DONE]\n\n"})
+
+    return app
+
+
+async def _send_json(send, obj) -> None:
+    data = json.dumps(obj).encode()
+    await send({
+        "type": "http.response.start",
+        "status": 200,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(data)).encode())],
+    })
+    await send({"type": "http.response.body", "body": data})
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def proc_cpu_seconds(pid: int) -> Optional[float]:
+    """User+system CPU time of a process, from /proc (None where that isn't available)."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+def proc_rss_kb(pid: int) -> Optional[int]:
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+class Services:
+    """The proxy plus local stand-ins for its three backends, each in its own process."""
+
+    def __init__(self, config: BenchConfig):
+        self.config = config
+        self.workdir = tempfile.mkdtemp(prefix="coder2api-bench-")
+        self.ports = {name: free_port() for name in ("stub", "codex", "cc", "gemini", "proxy")}
+        self.processes: Dict[str, subprocess.Popen] = {}
+
+    def _spawn(self, name: str, cmd: List[str], env: dict) -> None:
+        log = open(os.path.join(self.workdir, f"{name}.log"), "w")
+        self.processes[name] = subprocess.Popen(cmd, env={**os.environ, **env}, stdout=log, stderr=subprocess.STDOUT)
+
+    def start(self) -> None:
+        import claude_code_api
+
+        p = self.ports
+        home = os.path.join(self.workdir, "chatmock")
+        os.makedirs(home)
+        with open(os.path.join(home, "auth.json"), "w") as f:
+            json.dump({"tokens": {"access_token": "bench", "account_id": "bench", "id_token": "bench"}}, f)
+        uvicorn = [sys.executable, "-m", "uvicorn", "--host", "127.0.0.1", "--log-level", "warning", "--no-access-log"]
+
+        self._spawn("stub", [sys.executable, "-m", "chatmock.cli", "stub", "--port", str(p["stub"]), "--tokens", str(self.config.tokens)], {})
+        self._spawn(
+            "codex",
+            [sys.executable, "-m", "chatmock.cli", "serve", "--port", str(p["codex"]), "--upstream-base-url", f"http://127.0.0.1:{p['stub']}"],
+            {"CHATGPT_LOCAL_HOME": home},
+        )
+        self._spawn(
+            "cc",
+            uvicorn + ["--port", str(p["cc"]), "claude_code_api.main:app"],
+            {
+                "CLAUDE_BINARY_PATH": os.path.join(os.path.dirname(claude_code_api.__file__), "tests", "fake_claude.py"),
+                "DATABASE_URL": f"sqlite:///{self.workdir}/cc.db",
+                "PROJECT_ROOT": os.path.join(self.workdir, "projects"),
+                "MAX_CONCURRENT_SESSIONS": str(max(self.config.concurrency, self.config.open_streams) * 2),
+                "FAKE_CLAUDE_MESSAGES": "2",
+                "FAKE_CLAUDE_TEXT_BYTES": str(self.config.tokens * 5),
+            },
+        )
+        self._spawn(
+            "gemini",
+            uvicorn + ["--port", str(p["gemini"]), "--factory", "coder2api.bench:gemini_stub_app"],
+            {"CODER2API_BENCH_TOKENS": str(self.config.tokens)},
+        )
+        self._spawn(
+            "proxy",
+            uvicorn + ["--port", str(p["proxy"]), "coder2api.server:app"],
+            {
+                "CODER2API_CODEX_PORT": str(p["codex"]),
+                "CODER2API_CC_PORT": str(p["cc"]),
+                "CODER2API_GEMINI_PORT": str(p["gemini"]),
+                "CODER2API_CACHE": "0",
+            },
+        )
+
+    def url(self, name: str) -> str:
+        return f"http://127.0.0.1:{self.ports[name]}"
+
+    async def wait_ready(self, client: httpx.AsyncClient) -> None:
+        for name in ("codex", "cc", "gemini", "proxy"):
+            for _ in range(300):
+                if self.processes[name].poll() is not None:
+                    raise RuntimeError(f"{name} exited early, see {self.workdir}/{name}.log")
+                try:
+                    if (await client.get(f"{self.url(name)}/health")).status_code == 200:
+                        break
+                except httpx.TransportError:
+                    pass
+                await asyncio.sleep(0.1)
+            else:
+                raise RuntimeError(f"{name} did not become healthy, see {self.workdir}/{name}.log")
+
+    def stop(self) -> None:
+        for proc in self.processes.values():
+            if proc.poll() is None:
+                proc.terminate()
+        for proc in self.processes.values():
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+
+def plan_requests(config: BenchConfig, route: str) -> List[dict]:
+    """The workload mix for one route family; the same plan is replayed through the proxy and directly."""
+    rng = random.Random(f"{config.seed}:{route}")
+    plan = []
+    for _ in range(config.requests):
+        stream = rng.random() < config.stream_ratio
+        plan.append({
+            "stream": stream,
+            "size": rng.choice(config.prompt_sizes),
+            "disconnect": stream and rng.random() < config.disconnect_rate,
+        })
+    return plan
+
+
+async def one_request(client: httpx.AsyncClient, url: str, body: dict, disconnect: bool) -> Sample:
+    started = time.perf_counter()
+    ttfb = None
+    nbytes = 0
+    try:
+        async with client.stream("POST", url, json=body) as resp:
+            async for chunk in resp.aiter_raw():
+                if ttfb is None:
+                    ttfb = time.perf_counter() - started
+                nbytes += len(chunk)
+                if disconnect:
+                    break
+            status = resp.status_code
+    except httpx.HTTPError:
+        status = 0
+    latency = time.perf_counter() - started
+    return Sample(status, ttfb if ttfb is not None else latency, latency, nbytes, disconnect)
+
+
+async def run_target(client: httpx.AsyncClient, url: str, model: str, plan: List[dict], config: BenchConfig, pid: Optional[int]) -> dict:
+    queue = list(reversed(plan))
+    samples: List[Sample] = []
+
+    async def worker():
+        while queue:
+            item = queue.pop()
+            # A unique prefix keeps the proxy from coalescing otherwise identical requests
+            prompt = f"{uuid.uuid4().hex} " + "x" * item["size"]
+            body = {"model": model, "messages": [{"role": "user", "content": prompt}], "stream": item["stream"]}
+            samples.append(await one_request(client, url, body, item["disconnect"]))
+
+    cpu_before = proc_cpu_seconds(pid) if pid else None
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(config.concurrency)))
+    wall = time.perf_counter() - started
+    cpu_after = proc_cpu_seconds(pid) if pid else None
+
+    ok = [s for s in samples if 0 < s.status < 400]
+    complete = [s for s in ok if not s.disconnected]
+    mb = sum(s.nbytes for s in samples) / (1024 * 1024)
+    result = {
+        "ok": len(ok),
+        "errors": len(samples) - len(ok),
+        "disconnects": sum(1 for s in samples if s.disconnected),
+        "rps": len(ok) / wall if wall else 0.0,
+        "ttfb_p50_ms": _ms(percentile([s.ttfb for s in ok], 50)),
+        "ttfb_p99_ms": _ms(percentile([s.ttfb for s in ok], 99)),
+        "latency_p50_ms": _ms(percentile([s.latency for s in complete], 50)),
+        "latency_p99_ms": _ms(percentile([s.latency for s in complete], 99)),
+        "mb": round(mb, 3),
+    }
+    if cpu_before is not None and cpu_after is not None and mb > 0:
+        result["proxy_cpu_ms_per_mb"] = round((cpu_after - cpu_before) * 1000 / mb, 2)
+    return result
+
+
+def _ms(seconds: Optional[float]) -> Optional[float]:
+    return round(seconds * 1000, 2) if seconds is not None else None
+
+
+async def measure_open_streams(client: httpx.AsyncClient, services: Services, config: BenchConfig) -> Optional[dict]:
+    """Hold `open_streams` streams open through the proxy and report its resident memory per open stream."""
+    pid = services.processes["proxy"].pid
+    before = proc_rss_kb(pid)
+    if before is None or config.open_streams <= 0:
+        return None
+    first_chunks = asyncio.Semaphore(0)
+    hold = 2.0
+
+    async def held_stream():
+        body = {"model": ROUTES["gemini"][2], "messages": [{"role": "user", "content": "hold"}], "stream": True}
+        async with client.stream(
+            "POST", f"{services.url('proxy')}/gemini{ROUTES['gemini'][1]}", json=body, headers={HOLD_HEADER: str(hold)}
+        ) as resp:
+            first = True
+            async for _ in resp.aiter_raw():
+                if first:
+                    first_chunks.release()
+                    first = False
+
+    tasks = [asyncio.create_task(held_stream()) for _ in range(config.open_streams)]
+    for _ in range(config.open_streams):
+        await asyncio.wait_for(first_chunks.acquire(), timeout=30)
+    during = proc_rss_kb(pid)
+    await asyncio.gather(*tasks)
+    return {
+        "open_streams": config.open_streams,
+        "rss_before_kb": before,
+        "rss_open_kb": during,
+        "kb_per_open_stream": round((during - before) / config.open_streams, 1) if during is not None else None,
+    }
+
+
+async def run_async(config: BenchConfig, services: Services) -> dict:
+    limits = httpx.Limits(max_connections=max(config.concurrency, config.open_streams) + 8)
+    async with httpx.AsyncClient(timeout=120, limits=limits) as client:
+        await services.wait_ready(client)
+        proxy_pid = services.processes["proxy"].pid
+        routes = {}
+        for route in config.routes:
+            prefix, path, model = ROUTES[route]
+            plan = plan_requests(config, route)
+            # Warm up connections and lazy imports on both paths before measuring
+            warmup = [dict(item, disconnect=False) for item in plan[: config.concurrency]]
+            await run_target(client, f"{services.url(route)}{path}", model, warmup, config, None)
+            await run_target(client, f"{services.url('proxy')}{prefix}{path}", model, warmup, config, None)
+            direct = await run_target(client, f"{services.url(route)}{path}", model, plan, config, None)
+            proxied = await run_target(client, f"{services.url('proxy')}{prefix}{path}", model, plan, config, proxy_pid)
+            added = {}
+            for key in ("ttfb_p50_ms", "latency_p50_ms", "latency_p99_ms"):
+                if proxied.get(key) is not None and direct.get(key) is not None:
+                    added[key] = round(proxied[key] - direct[key], 2)
+            routes[route] = {"direct": direct, "proxy": proxied, "added": added}
+        memory = await measure_open_streams(client, services, config) if "gemini" in config.routes else None
+    return {"routes": routes, "memory": memory}
+
+
+def git_revision() -> Optional[str]:
+    try:
+        out = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, timeout=5)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    if out.returncode != 0:
+        return None
+    return out.stdout.strip() or None
+
+
+def run_bench(config: BenchConfig) -> dict:
+    services = Services(config)
+    services.start()
+    try:
+        results = asyncio.run(run_async(config, services))
+    finally:
+        services.stop()
+    return {
+        "revision": git_revision(),
+        "timestamp": int(time.time()),
+        "config": asdict(config),
+        **results,
+    }
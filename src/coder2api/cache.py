@@ -0,0 +1,265 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+from .singleflight import COMPLETION_PATH_SUFFIXES, BufferedResponse, requests_stream
+
+# Request header controlling the cache, in Cache-Control style:
+#   "use" / "on" / "1"      cache this request even though temperature != 0
+#   "max-age=N"             same, with a TTL of N seconds for the stored answer
+#   "bypass" / "no-store"   never read or write the cache for this request
+CACHE_CONTROL_HEADER = "x-coder2api-cache"
+# Response header telling the client whether the answer came from the cache
+CACHE_STATUS_HEADER = "x-coder2api-cache"
+
+_OPT_IN = {"use", "on", "1", "true", "yes", "store"}
+_OPT_OUT = {"bypass", "no-store", "no-cache", "off", "0", "false", "no"}
+
+
+@dataclass
+class CachePolicy:
+    ttl: float
+
+
+@dataclass
+class _Entry:
+    expires_at: float
+    response: BufferedResponse
+    size: int
+
+
+def _entry_size(response: BufferedResponse) -> int:
+    return len(response.content) + sum(len(k) + len(v) for k, v in response.headers.items())
+
+
+def _is_deterministic(body: dict) -> bool:
+    temperature = body.get("temperature")
+    if temperature is None and isinstance(body.get("options"), dict):
+        # Ollama puts sampling parameters under "options"
+        temperature = body["options"].get("temperature")
+    return isinstance(temperature, (int, float)) and not isinstance(temperature, bool) and temperature == 0
+
+
+class DiskTier:
+    """
+    SQLite-backed second tier. All calls are blocking and meant to be run off the event loop.
+    """
+
+    def __init__(self, path: str, max_bytes: int):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, expires_at REAL NOT NULL, last_access REAL NOT NULL,"
+            " status INTEGER NOT NULL, headers TEXT NOT NULL, media_type TEXT, body BLOB NOT NULL,"
+            " size INTEGER NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses(last_access)")
+
+    def get(self, key: str, now: float) -> Optional[Tuple[float, BufferedResponse]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT expires_at, status, headers, media_type, body FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            expires_at, status, headers, media_type, body = row
+            if expires_at <= now:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                return None
+            self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+        return expires_at, BufferedResponse(
+            status_code=status, headers=json.loads(headers), content=bytes(body), media_type=media_type
+        )
+
+    def put(self, key: str, expires_at: float, response: BufferedResponse, size: int, now: float) -> int:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, expires_at, last_access, status, headers, media_type, body, size)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    key,
+                    expires_at,
+                    now,
+                    response.status_code,
+                    json.dumps(response.headers),
+                    response.media_type,
+                    sqlite3.Binary(response.content),
+                    size,
+                ),
+            )
+            return self._evict(now)
+
+    def _evict(self, now: float) -> int:
+        evicted = self._conn.execute("DELETE FROM responses WHERE expires_at <= ?", (now,)).rowcount
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        while total > self.max_bytes:
+            row = self._conn.execute(
+                "SELECT key, size FROM responses ORDER BY last_access ASC LIMIT 1"
+            ).fetchone()
+            if row is None:
+                break
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (row[0],))
+            total -= row[1]
+            evicted += 1
+        return evicted
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        return {"entries": count, "bytes": total, "max_bytes": self.max_bytes}
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class ResponseCache:
+    """
+    Content-addressed cache for deterministic, non-streaming completions.
+
+    Entries live in an in-memory LRU bounded by entry count and bytes; when a directory is configured,
+    they are also written to an SQLite file so they survive restarts and can be shared between proxies.
+    """
+
+    def __init__(
+        self,
+        ttl: float = 300.0,
+        max_entries: int = 1024,
+        max_bytes: int = 64 * 1024 * 1024,
+        disk_dir: Optional[str] = None,
+        disk_max_bytes: int = 512 * 1024 * 1024,
+    ):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._bytes = 0
+        self.disk = DiskTier(os.path.join(disk_dir, "responses.sqlite3"), disk_max_bytes) if disk_dir else None
+        self.counters = {
+            "hits_memory": 0,
+            "hits_disk": 0,
+            "misses": 0,
+            "stores": 0,
+            "evictions": 0,
+            "expired": 0,
+            "uncacheable": 0,
+        }
+
+    def policy(self, method: str, path: str, headers: Dict[str, str], body: Optional[dict]) -> Optional[CachePolicy]:
+        if method.upper() != "POST" or body is None or requests_stream(path, body):
+            return None
+        if not path.rstrip("/").endswith(COMPLETION_PATH_SUFFIXES):
+            return None
+        control = next((v for k, v in headers.items() if k.lower() == CACHE_CONTROL_HEADER), None)
+        ttl: Optional[float] = None
+        opted_in = False
+        if control is not None:
+            for directive in control.split(","):
+                directive = directive.strip().lower()
+                if directive in _OPT_OUT:
+                    return None
+                if directive in _OPT_IN:
+                    opted_in = True
+                elif directive.startswith("max-age="):
+                    try:
+                        ttl = float(directive.split("=", 1)[1])
+                        opted_in = True
+                    except ValueError:
+                        pass
+        if not opted_in and not _is_deterministic(body):
+            return None
+        if ttl is not None and ttl <= 0:
+            return None
+        return CachePolicy(ttl=ttl if ttl is not None else self.ttl)
+
+    def _drop(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry.size
+
+    def _evict_memory(self) -> None:
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            _, entry = self._entries.popitem(last=False)
+            self._bytes -= entry.size
+            self.counters["evictions"] += 1
+
+    def _remember(self, key: str, expires_at: float, response: BufferedResponse, size: int) -> None:
+        if size > self.max_bytes:
+            return
+        self._drop(key)
+        self._entries[key] = _Entry(expires_at=expires_at, response=response, size=size)
+        self._bytes += size
+        self._evict_memory()
+
+    async def get(self, key: str) -> Optional[BufferedResponse]:
+        now = time.time()
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry.expires_at > now:
+                self._entries.move_to_end(key)
+                self.counters["hits_memory"] += 1
+                return entry.response
+            self._drop(key)
+            self.counters["expired"] += 1
+        if self.disk is not None:
+            found = await asyncio.to_thread(self.disk.get, key, now)
+            if found is not None:
+                expires_at, response = found
+                self._remember(key, expires_at, response, _entry_size(response))
+                self.counters["hits_disk"] += 1
+                return response
+        self.counters["misses"] += 1
+        return None
+
+    async def put(self, key: str, response: BufferedResponse, policy: CachePolicy) -> None:
+        if response.status_code != 200:
+            self.counters["uncacheable"] += 1
+            return
+        now = time.time()
+        expires_at = now + policy.ttl
+        size = _entry_size(response)
+        self._remember(key, expires_at, response, size)
+        self.counters["stores"] += 1
+        if self.disk is not None:
+            self.counters["evictions"] += await asyncio.to_thread(self.disk.put, key, expires_at, response, size, now)
+
+    def snapshot(self) -> dict:
+        hits = self.counters["hits_memory"] + self.counters["hits_disk"]
+        lookups = hits + self.counters["misses"]
+        out = {
+            **self.counters,
+            "hit_rate": (hits / lookups) if lookups else 0.0,
+            "memory": {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+            },
+        }
+        if self.disk is not None:
+            out["disk"] = self.disk.stats()
+        return out
+
+
+def cache_from_env() -> Optional[ResponseCache]:
+    if os.environ.get("CODER2API_CACHE", "0").strip().lower() not in ("1", "true", "yes", "on"):
+        return None
+    return ResponseCache(
+        ttl=float(os.environ.get("CODER2API_CACHE_TTL", 300)),
+        max_entries=int(os.environ.get("CODER2API_CACHE_MAX_ENTRIES", 1024)),
+        max_bytes=int(float(os.environ.get("CODER2API_CACHE_MAX_MB", 64)) * 1024 * 1024),
+        disk_dir=os.environ.get("CODER2API_CACHE_DIR") or None,
+        disk_max_bytes=int(float(os.environ.get("CODER2API_CACHE_DISK_MAX_MB", 512)) * 1024 * 1024),
+    )
@@ -0,0 +1,109 @@
+import json
+import os
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Optional
+from urllib.parse import unquote
+
+from litestar import Litestar, asgi
+from litestar.types import Receive, Scope, Send
+from rich.console import Console
+
+console = Console(stderr=True)
+
+# `coder2api serve --inproc` sets this: ChatMock and Claude Code API are mounted inside the proxy process
+# instead of being reached over HTTP
+INPROC_ENABLED = os.environ.get("CODER2API_INPROC", "0").strip().lower() in ("1", "true", "yes", "on")
+# ChatMock is WSGI; each in-flight request (including a stream being relayed) occupies one of these threads
+CHATMOCK_WORKERS = int(os.environ.get("CODER2API_INPROC_WSGI_WORKERS", 32))
+
+_cc_app = None
+_cc_unavailable: Optional[str] = None
+
+
+def _mounted_scope(scope: Scope, prefix: str) -> Scope:
+    # Litestar strips the mount prefix and appends a trailing slash, which Flask and FastAPI would both treat as a
+    # different route; hand the apps the original path with the prefix as root_path, as the ASGI spec expects
+    raw_path = scope.get("raw_path") or scope["path"].encode()
+    path = unquote(raw_path.split(b"?", 1)[0].decode("latin-1"))
+    return {**scope, "path": path, "root_path": scope.get("root_path", "") + prefix}
+
+
+def chatmock_asgi():
+    from uvicorn.middleware.wsgi import WSGIMiddleware
+
+    from chatmock.app import create_app
+
+    app = create_app(
+        session_store=os.environ.get("CHATGPT_LOCAL_SESSION_STORE") or None,
+        keepalive_seconds=float(os.environ.get("CHATGPT_LOCAL_KEEPALIVE_SECONDS") or 15),
+        server_timing=(os.environ.get("CHATGPT_LOCAL_SERVER_TIMING") or "").strip().lower() in ("1", "true", "yes", "on"),
+    )
+    return WSGIMiddleware(app, workers=CHATMOCK_WORKERS)
+
+
+def claude_code_asgi():
+    global _cc_app
+    if _cc_app is None:
+        from claude_code_api.main import app as cc_app
+
+        _cc_app = cc_app
+    return _cc_app
+
+
+async def _unavailable(send: Send, reason: str) -> None:
+    body = json.dumps(
+        {"error": {"message": f"Claude Code API is unavailable: {reason}", "type": "service_unavailable"}}
+    ).encode()
+    await send({
+        "type": "http.response.start",
+        "status": 503,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+def mount_handlers() -> list:
+    codex_app = chatmock_asgi()
+    cc_app = claude_code_asgi()
+
+    @asgi("/codex", is_mount=True)
+    async def codex_mount(scope: Scope, receive: Receive, send: Send) -> None:
+        await codex_app(_mounted_scope(scope, "/codex"), receive, send)
+
+    @asgi("/cc", is_mount=True)
+    async def cc_mount(scope: Scope, receive: Receive, send: Send) -> None:
+        if _cc_unavailable is not None:
+            await _unavailable(send, _cc_unavailable)
+            return
+        await cc_app(_mounted_scope(scope, "/cc"), receive, send)
+
+    return [codex_mount, cc_mount]
+
+
+@asynccontextmanager
+async def claude_code_lifespan(app: Litestar) -> AsyncIterator[None]:
+    """
+    Mounted apps don't receive lifespan events, so run the FastAPI app's lifespan (database, managers, Claude CLI
+    check) from the proxy's. A failing startup only takes /cc down, like a crashed backend process would.
+    """
+    global _cc_unavailable
+    cc_app = claude_code_asgi()
+    context = cc_app.router.lifespan_context(cc_app)
+    try:
+        await context.__aenter__()
+    except Exception as exc:
+        _cc_unavailable = str(getattr(exc, "detail", None) or exc)
+        console.print(f"[red]Claude Code API failed to start in-process: {_cc_unavailable}[/red]")
+        yield
+        return
+    try:
+        yield
+    finally:
+        await context.__aexit__(None, None, None)
+
+
+def render_local_metrics(render_proxy: Callable[[], str]) -> str:
+    from chatmock import metrics as chatmock_metrics
+    from claude_code_api.core import metrics as cc_metrics
+
+    return render_proxy() + chatmock_metrics.render() + cc_metrics.render()
@@ -3,8 +3,12 @@ import subprocess
 import sys
 import os
 import signal
+import shutil
+import tempfile
+import json
 from typing import List
 from rich.console import Console
+from rich.table import Table
 
 app = typer.Typer(add_completion=False)
 console = Console()
@@ -126,17 +130,27 @@ def build():
     console.print("[bold green]Build complete![/bold green]")
 
 @app.command()
-def serve():
+def serve(
+    cache: bool = typer.Option(False, "--cache/--no-cache", help="Cache deterministic (temperature=0 or opted-in) non-streaming completions in the proxy."),
+    cache_dir: str = typer.Option(None, "--cache-dir", help="Directory for the on-disk cache tier (implies --cache)."),
+    cache_ttl: float = typer.Option(300.0, "--cache-ttl", help="Seconds a cached completion stays valid."),
+    uds: bool = typer.Option(False, "--uds/--no-uds", help="Connect the proxy to ChatMock and Claude Code API over Unix domain sockets instead of TCP."),
+    runtime_dir: str = typer.Option(None, "--runtime-dir", help="Directory for the --uds sockets (default: $XDG_RUNTIME_DIR/coder2api or a temp dir)."),
+    inproc: bool = typer.Option(False, "--inproc/--no-inproc", help="Mount ChatMock and Claude Code API inside the proxy process instead of running them as separate services."),
+):
     """
     Starts all services and the unified proxy.
     """
     processes = []
+    socket_dir = None
     
     def cleanup(signum, frame):
         console.print("\n[bold yellow]Shutting down services...[/bold yellow]")
         for p in processes:
             if p.poll() is None:
                 p.terminate()
+        if socket_dir:
+            shutil.rmtree(socket_dir, ignore_errors=True)
         sys.exit(0)
 
     signal.signal(signal.SIGINT, cleanup)
@@ -153,6 +167,22 @@ def serve():
     
     console.print(f"Logs will be written to {log_dir}")
 
+    # With --uds the Python backends bind sockets here instead of TCP ports (Gemini's Node proxy stays on TCP)
+    codex_sock = cc_sock = None
+    if uds and inproc:
+        console.print("[yellow]--uds has no effect with --inproc: ChatMock and Claude Code API run inside the proxy.[/yellow]")
+        uds = False
+    if uds:
+        base = runtime_dir or os.environ.get("XDG_RUNTIME_DIR")
+        if base:
+            socket_dir = os.path.join(os.path.abspath(base), "coder2api")
+            os.makedirs(socket_dir, mode=0o700, exist_ok=True)
+        else:
+            socket_dir = tempfile.mkdtemp(prefix="coder2api-")
+        codex_sock = os.path.join(socket_dir, "codex.sock")
+        cc_sock = os.path.join(socket_dir, "cc.sock")
+        console.print(f"Backend sockets in {socket_dir}")
+
     # Helper to start process
     def start_service(name, cmd, cwd=None, env=None):
         f_out = open(os.path.join(log_dir, f"{name}.out.log"), "w")
@@ -186,13 +216,25 @@ def serve():
 
     start_service("gemini", ["node", "dist/index.js", "--port", GEMINI_PORT], cwd=gemini_path)
     
-    # 2. Start ChatMock
-    console.print(f"[green]Starting ChatMock on port {CODEX_PORT}...[/green]")
-    start_service("chatmock", [sys.executable, "-m", "chatmock.cli", "serve", "--port", CODEX_PORT])
-    
-    # 3. Start Claude Code API
-    console.print(f"[green]Starting Claude Code API on port {CC_PORT}...[/green]")
-    start_service("claude-code", [sys.executable, "-m", "uvicorn", "claude_code_api.main:app", "--port", CC_PORT, "--host", "127.0.0.1"])
+    if inproc:
+        # 2./3. ChatMock and Claude Code API are mounted inside the proxy process (see coder2api.inproc)
+        console.print("[green]ChatMock and Claude Code API will be mounted in the proxy process[/green]")
+    else:
+        # 2. Start ChatMock
+        if codex_sock:
+            console.print(f"[green]Starting ChatMock on {codex_sock}...[/green]")
+            start_service("chatmock", [sys.executable, "-m", "chatmock.cli", "serve", "--uds", codex_sock])
+        else:
+            console.print(f"[green]Starting ChatMock on port {CODEX_PORT}...[/green]")
+            start_service("chatmock", [sys.executable, "-m", "chatmock.cli", "serve", "--port", CODEX_PORT])
+        
+        # 3. Start Claude Code API
+        if cc_sock:
+            console.print(f"[green]Starting Claude Code API on {cc_sock}...[/green]")
+            start_service("claude-code", [sys.executable, "-m", "uvicorn", "claude_code_api.main:app", "--uds", cc_sock])
+        else:
+            console.print(f"[green]Starting Claude Code API on port {CC_PORT}...[/green]")
+            start_service("claude-code", [sys.executable, "-m", "uvicorn", "claude_code_api.main:app", "--port", CC_PORT, "--host", "127.0.0.1"])
     
     # 4. Start Coder2API Proxy
     console.print(f"[bold green]Starting Unified Proxy on port {PROXY_PORT}...[/bold green]")
@@ -204,6 +246,17 @@ def serve():
     env["CODER2API_GEMINI_PORT"] = GEMINI_PORT
     env["CODER2API_CODEX_PORT"] = CODEX_PORT
     env["CODER2API_CC_PORT"] = CC_PORT
+    if inproc:
+        env["CODER2API_INPROC"] = "1"
+    if uds:
+        env["CODER2API_CODEX_UDS"] = codex_sock
+        env["CODER2API_CC_UDS"] = cc_sock
+    if cache or cache_dir:
+        env["CODER2API_CACHE"] = "1"
+        env["CODER2API_CACHE_TTL"] = str(cache_ttl)
+        if cache_dir:
+            env["CODER2API_CACHE_DIR"] = os.path.abspath(cache_dir)
+        console.print(f"  - Response cache enabled (ttl={cache_ttl:g}s{', disk: ' + cache_dir if cache_dir else ''})")
     
     # We run uvicorn for the proxy
     # Note: we use 'coder2api.server:app' assuming the package is installed/available
@@ -217,5 +270,62 @@ def serve():
     p_proxy.wait()
     cleanup(None, None)
 
+@app.command()
+def bench(
+    requests: int = typer.Option(200, "--requests", help="Requests per route family, replayed both through the proxy and directly."),
+    concurrency: int = typer.Option(8, "--concurrency", help="Requests in flight at once."),
+    routes: str = typer.Option("codex,cc,gemini", "--routes", help="Comma-separated route families to exercise."),
+    stream_ratio: float = typer.Option(0.5, "--stream-ratio", help="Fraction of requests that stream."),
+    prompt_sizes: str = typer.Option("200,4000,32000", "--prompt-sizes", help="Comma-separated prompt sizes in characters, picked at random per request."),
+    disconnect_rate: float = typer.Option(0.0, "--disconnect-rate", help="Fraction of streaming requests the client abandons after the first chunk."),
+    tokens: int = typer.Option(200, "--tokens", help="Output tokens in each stand-in answer."),
+    open_streams: int = typer.Option(50, "--open-streams", help="Streams held open at once to measure proxy memory per stream (0 skips)."),
+    seed: int = typer.Option(0, "--seed", help="Seed for the workload mix."),
+    output: str = typer.Option("bench-results.json", "--output", help="Where to write the JSON results."),
+):
+    """
+    Benchmarks the unified proxy against local stand-ins for all three backends.
+    """
+    from .bench import ROUTES, BenchConfig, run_bench
+
+    selected = [r.strip() for r in routes.split(",") if r.strip()]
+    unknown = [r for r in selected if r not in ROUTES]
+    if unknown:
+        console.print(f"[red]Unknown route families: {', '.join(unknown)} (choose from {', '.join(ROUTES)})[/red]")
+        sys.exit(2)
+    config = BenchConfig(
+        requests=requests,
+        concurrency=concurrency,
+        routes=selected,
+        stream_ratio=stream_ratio,
+        prompt_sizes=[int(size) for size in prompt_sizes.split(",") if size.strip()],
+        disconnect_rate=disconnect_rate,
+        tokens=tokens,
+        open_streams=open_streams,
+        seed=seed,
+    )
+    console.print(f"[green]Running {requests} requests per route at concurrency {concurrency}...[/green]")
+    results = run_bench(config)
+
+    table = Table(title="coder2api bench")
+    for column in ("route", "target", "ok", "err", "req/s", "ttfb p50", "lat p50", "lat p99", "cpu ms/MB"):
+        table.add_column(column, justify="left" if column in ("route", "target") else "right")
+    for route, result in results["routes"].items():
+        for target in ("direct", "proxy"):
+            r = result[target]
+            table.add_row(
+                route, target, str(r["ok"]), str(r["errors"]), f"{r['rps']:.1f}",
+                str(r["ttfb_p50_ms"]), str(r["latency_p50_ms"]), str(r["latency_p99_ms"]),
+                str(r.get("proxy_cpu_ms_per_mb", "")),
+            )
+        table.add_row(route, "added", "", "", "", *(str(result["added"].get(k, "")) for k in ("ttfb_p50_ms", "latency_p50_ms", "latency_p99_ms")), "")
+    console.print(table)
+    if results.get("memory"):
+        console.print(f"Proxy memory per open stream: {results['memory']['kb_per_open_stream']} KB")
+
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    console.print(f"Results written to {output}")
+
 if __name__ == "__main__":
     app()
\ No newline at end of file
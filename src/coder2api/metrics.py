@@ -0,0 +1,99 @@
+import asyncio
+import json
+from typing import List, Optional
+
+import httpx
+
+# The metric primitives live in chatmock, which ships in the same distribution
+from chatmock.metrics import Counter, Gauge, Histogram, TOKEN_BUCKETS
+
+from .singleflight import COMPLETION_PATH_SUFFIXES
+
+# Route labels are collapsed to the endpoint family so arbitrary proxied paths can't blow up cardinality
+ROUTE_FAMILIES = COMPLETION_PATH_SUFFIXES + ("models", "health", "metrics")
+
+_REGISTRY: list = []
+
+
+def _register(metric):
+    _REGISTRY.append(metric)
+    return metric
+
+
+REQUESTS = _register(Counter("coder2api_requests_total", "Proxied requests, by backend, route family, model and status.", ("backend", "route", "model", "status")))
+INFLIGHT = _register(Gauge("coder2api_inflight_requests", "Proxied requests currently being handled or streamed.", ("backend",)))
+TTFB = _register(Histogram("coder2api_ttfb_seconds", "Time from request arrival to the first response byte.", ("backend", "route", "model")))
+LATENCY = _register(Histogram("coder2api_request_duration_seconds", "Time from request arrival to the last response byte.", ("backend", "route", "model")))
+QUEUE_WAIT = _register(Histogram("coder2api_queue_wait_seconds", "Time from request arrival until the backend request is dispatched.", ("backend", "route", "model")))
+STREAM_BYTES = _register(Counter("coder2api_stream_bytes_total", "Bytes relayed to clients on streamed responses.", ("backend", "route", "model")))
+TOKENS_OUT = _register(Histogram("coder2api_output_tokens", "Output tokens per buffered completion, from the response usage.", ("backend", "route", "model"), TOKEN_BUCKETS))
+SCRAPE_UP = _register(Gauge("coder2api_backend_scrape_up", "Whether the last scrape of a backend's /metrics succeeded.", ("backend",)))
+
+
+def route_family(path: str) -> str:
+    path = path.split("?", 1)[0].rstrip("/")
+    for family in ROUTE_FAMILIES:
+        if path.endswith(family):
+            return family
+    return "other"
+
+
+def request_model(body: Optional[dict]) -> str:
+    # Client-supplied, so the label is bounded by the per-metric series cap (overflow goes to "other")
+    model = body.get("model") if isinstance(body, dict) else None
+    return model if isinstance(model, str) else ""
+
+
+def completion_tokens(body: Optional[dict]) -> Optional[int]:
+    if not isinstance(body, dict):
+        return None
+    usage = body.get("usage")
+    if isinstance(usage, dict):
+        for name in ("completion_tokens", "output_tokens"):
+            if isinstance(usage.get(name), int):
+                return usage[name]
+    # Ollama-style responses
+    if isinstance(body.get("eval_count"), int):
+        return body["eval_count"]
+    return None
+
+
+def observe_tokens(backend: str, route: str, model: str, content: bytes) -> None:
+    if route not in COMPLETION_PATH_SUFFIXES:
+        return
+    try:
+        body = json.loads(content)
+    except (ValueError, UnicodeDecodeError):
+        return
+    tokens = completion_tokens(body)
+    if tokens is not None:
+        TOKENS_OUT.observe(tokens, backend=backend, route=route, model=model)
+
+
+def render() -> str:
+    lines: List[str] = []
+    for metric in _REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+async def _scrape(client: httpx.AsyncClient, backend: str, timeout: float) -> str:
+    try:
+        r = await client.get("/metrics", timeout=timeout)
+        r.raise_for_status()
+    except httpx.HTTPError:
+        SCRAPE_UP.set(0, backend=backend)
+        return ""
+    SCRAPE_UP.set(1, backend=backend)
+    return r.text
+
+
+async def render_with_backends(backends: dict, timeout: float = 2.0) -> str:
+    """
+    Render the proxy's own metrics followed by the /metrics output of each Python backend.
+
+    Backend metric names are already prefixed (chatmock_*, claude_code_api_*), so the pages can simply be
+    concatenated. The scrape results are recorded before rendering so coder2api_backend_scrape_up is current.
+    """
+    pages = await asyncio.gather(*(_scrape(client, name, timeout) for name, client in backends.items()))
+    return render() + "".join(page if page.endswith("\n") or not page else page + "\n" for page in pages)
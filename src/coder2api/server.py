@@ -4,80 +4,252 @@ from litestar.response import Stream
 from litestar.status_codes import HTTP_200_OK
 from litestar.exceptions import HTTPException
 import os
+import time
+
+from . import metrics
+from .inproc import INPROC_ENABLED
+from .cache import CACHE_STATUS_HEADER, CachePolicy, cache_from_env
+from .singleflight import COALESCED_HEADER, SingleFlight, buffered_from_httpx, is_coalescable, parse_json_body, request_key
+from .transport import BackendClients
 
 # Configuration for backend ports
 GEMINI_PORT = int(os.environ.get("CODER2API_GEMINI_PORT", 3001))
 CODEX_PORT = int(os.environ.get("CODER2API_CODEX_PORT", 3002))
 CC_PORT = int(os.environ.get("CODER2API_CC_PORT", 3003))
 
-async def proxy_request(request: Request, target_base_url: str, path: str) -> Response:
+# Shared upstream clients; backends configured with CODER2API_*_UDS are reached over Unix domain sockets
+clients = BackendClients()
+
+# Identical non-streaming requests in flight at the same time share one upstream call
+COALESCE_ENABLED = os.environ.get("CODER2API_COALESCE", "1").strip().lower() not in ("0", "false", "no", "off")
+singleflight = SingleFlight()
+
+# Optional cache for deterministic completions (temperature=0 or X-Coder2API-Cache opt-in), see cache.py
+response_cache = cache_from_env()
+
+async def fetch_buffered(client: httpx.AsyncClient, method: str, url: str, headers: dict, content: bytes):
+    r = await client.request(method, url, content=content, headers=headers)
+    return buffered_from_httpx(r)
+
+def record_response(backend: str, route: str, model: str, started: float, status_code: int) -> None:
+    elapsed = time.perf_counter() - started
+    metrics.TTFB.observe(elapsed, backend=backend, route=route, model=model)
+    metrics.LATENCY.observe(elapsed, backend=backend, route=route, model=model)
+    metrics.REQUESTS.inc(backend=backend, route=route, model=model, status=str(status_code))
+
+class ProxyStream(Stream):
+    """
+    A Stream that runs ``cleanup`` however the response ends.
+
+    The body iterator's own ``finally`` is skipped when the client goes away before the first chunk (or for
+    HEAD responses), and background tasks are skipped when sending fails, so the ASGI call itself is wrapped.
+    """
+
+    __slots__ = ("cleanup",)
+
+    def __init__(self, content, *, cleanup, **kwargs):
+        super().__init__(content, **kwargs)
+        self.cleanup = cleanup
+
+    def to_asgi_response(self, *args, **kwargs):
+        response = super().to_asgi_response(*args, **kwargs)
+        cleanup = self.cleanup
+
+        async def send_with_cleanup(scope, receive, send) -> None:
+            try:
+                await response(scope, receive, send)
+            finally:
+                await cleanup()
+
+        return send_with_cleanup
+
+async def buffered_request(
+    request: Request,
+    target_base_url: str,
+    backend: str,
+    url: str,
+    headers: dict,
+    content: bytes,
+    coalesce: bool,
+    cache_policy: CachePolicy | None,
+    started: float,
+    route: str,
+    model: str,
+) -> Response:
+    key = request_key(request.method, f"/{backend}{url}", "", headers, content)
+    response_headers = {}
+    if cache_policy is not None:
+        cached = await response_cache.get(key)
+        if cached is not None:
+            record_response(backend, route, model, started, cached.status_code)
+            return Response(
+                content=cached.content,
+                status_code=cached.status_code,
+                headers={**cached.headers, CACHE_STATUS_HEADER: "hit"},
+                media_type=cached.media_type,
+            )
+        response_headers[CACHE_STATUS_HEADER] = "miss"
+
+    def fetch():
+        metrics.QUEUE_WAIT.observe(time.perf_counter() - started, backend=backend, route=route, model=model)
+        return fetch_buffered(clients.get(backend, target_base_url), request.method, url, headers, content)
+
+    try:
+        if coalesce:
+            result, shared = await singleflight.do(key, fetch, backend=backend)
+        else:
+            result, shared = await fetch(), False
+    except httpx.RequestError as exc:
+        record_response(backend, route, model, started, 502)
+        return Response(
+            content={"error": f"Proxy error: {str(exc)}"},
+            status_code=502,
+            media_type="application/json"
+        )
+    record_response(backend, route, model, started, result.status_code)
+    if not shared:
+        metrics.observe_tokens(backend, route, model, result.content)
+    # Only the call that actually went upstream stores the answer
+    if cache_policy is not None and not shared:
+        await response_cache.put(key, result, cache_policy)
+    response_headers = {**result.headers, **response_headers}
+    if shared:
+        response_headers[COALESCED_HEADER] = "1"
+    return Response(
+        content=result.content,
+        status_code=result.status_code,
+        headers=response_headers,
+        media_type=result.media_type,
+    )
+
+async def proxy_request(request: Request, target_base_url: str, path: str, backend: str = "") -> Response:
+    started = time.perf_counter()
     # Strip leading slash to avoid double slashes when constructing url
     path = path.lstrip("/")
-    
-    # Construct the target URL
-    url = f"/{path}"
-    if request.url.query:
-        url += f"?{request.url.query}"
-    
-    # Filter headers
-    headers = dict(request.headers)
-    headers.pop("host", None)
-    headers.pop("content-length", None)
-    
-    # Read body
-    content = await request.body()
-    
-    client = httpx.AsyncClient(base_url=target_base_url, timeout=60.0)
+    route = metrics.route_family(path)
+    metrics.INFLIGHT.inc(backend=backend)
+    # Set once a streamed response has taken over the in-flight accounting
+    handed_off = False
     try:
-        # Build the request
-        req = client.build_request(
-            method=request.method,
-            url=url,
-            content=content,
-            headers=headers,
-        )
+        # Construct the target URL
+        url = f"/{path}"
+        if request.url.query:
+            url += f"?{request.url.query}"
+        
+        # Filter headers
+        headers = dict(request.headers)
+        headers.pop("host", None)
+        headers.pop("content-length", None)
         
-        # Send request with stream=True
-        r = await client.send(req, stream=True)
+        # Read body
+        content = await request.body()
+
+        body = parse_json_body(content)
+        model = metrics.request_model(body)
+        coalesce = COALESCE_ENABLED and is_coalescable(request.method, f"/{path}", headers, body)
+        cache_policy = response_cache.policy(request.method, f"/{path}", headers, body) if response_cache else None
+        if coalesce or cache_policy is not None:
+            return await buffered_request(
+                request, target_base_url, backend, url, headers, content, coalesce, cache_policy, started, route, model
+            )
+        
+        client = clients.get(backend, target_base_url)
+        try:
+            # Build the request
+            req = client.build_request(
+                method=request.method,
+                url=url,
+                content=content,
+                headers=headers,
+            )
+            
+            # Send request with stream=True
+            metrics.QUEUE_WAIT.observe(time.perf_counter() - started, backend=backend, route=route, model=model)
+            r = await client.send(req, stream=True)
+        except httpx.RequestError as exc:
+            record_response(backend, route, model, started, 502)
+            return Response(
+                content={"error": f"Proxy error: {str(exc)}"},
+                status_code=502,
+                media_type="application/json"
+            )
         
+        sent = 0
+        first = True
+        finished = False
+
         async def iterator():
+            nonlocal sent, first
+            async for chunk in r.aiter_bytes():
+                if first:
+                    metrics.TTFB.observe(time.perf_counter() - started, backend=backend, route=route, model=model)
+                    first = False
+                sent += len(chunk)
+                yield chunk
+
+        async def finish() -> None:
+            nonlocal finished
+            if finished:
+                return
+            finished = True
             try:
-                async for chunk in r.aiter_bytes():
-                    yield chunk
-            finally:
                 await r.aclose()
-                await client.aclose()
+            finally:
+                metrics.LATENCY.observe(time.perf_counter() - started, backend=backend, route=route, model=model)
+                metrics.STREAM_BYTES.inc(sent, backend=backend, route=route, model=model)
+                metrics.REQUESTS.inc(backend=backend, route=route, model=model, status=str(r.status_code))
+                metrics.INFLIGHT.dec(backend=backend)
         
-        return Stream(
+        response = ProxyStream(
             iterator(),
+            cleanup=finish,
             status_code=r.status_code,
             headers=dict(r.headers),
             media_type=r.headers.get("content-type"),
         )
-        
-    except httpx.RequestError as exc:
-        await client.aclose()
-        return Response(
-            content={"error": f"Proxy error: {str(exc)}"},
-            status_code=502,
-            media_type="application/json"
-        )
+        handed_off = True
+        return response
+    finally:
+        if not handed_off:
+            metrics.INFLIGHT.dec(backend=backend)
 
 @get("/health")
 async def health_check() -> dict:
     return {"status": "ok", "service": "coder2api"}
 
+@get("/stats")
+async def proxy_stats() -> dict:
+    return {
+        "coalescing": {"enabled": COALESCE_ENABLED, **singleflight.snapshot()},
+        "cache": {"enabled": True, **response_cache.snapshot()} if response_cache else {"enabled": False},
+        "transports": clients.transports(),
+        "inproc": INPROC_ENABLED,
+    }
+
+@get("/metrics", media_type="text/plain; version=0.0.4")
+async def prometheus_metrics() -> str:
+    if INPROC_ENABLED:
+        # The mounted backends share this process, so their registries can be rendered directly
+        from .inproc import render_local_metrics
+
+        return render_local_metrics(metrics.render)
+    # Gemini CLI Proxy is a Node service without a /metrics endpoint; it's covered by the proxy-side metrics only
+    return await metrics.render_with_backends({
+        "codex": clients.get("codex", f"http://localhost:{CODEX_PORT}"),
+        "cc": clients.get("cc", f"http://localhost:{CC_PORT}"),
+    })
+
 # Routes for Codex (ChatMock)
 async def codex_proxy(request: Request, path: str) -> Response:
-    return await proxy_request(request, f"http://localhost:{CODEX_PORT}", path)
+    return await proxy_request(request, f"http://localhost:{CODEX_PORT}", path, "codex")
 
 # Routes for CC (Claude Code API)
 async def cc_proxy(request: Request, path: str) -> Response:
-    return await proxy_request(request, f"http://localhost:{CC_PORT}", path)
+    return await proxy_request(request, f"http://localhost:{CC_PORT}", path, "cc")
 
 # Routes for Gemini
 async def gemini_proxy(request: Request, path: str) -> Response:
-    return await proxy_request(request, f"http://localhost:{GEMINI_PORT}", path)
+    return await proxy_request(request, f"http://localhost:{GEMINI_PORT}", path, "gemini")
 
 # We register these as handlers for all methods
 from litestar.handlers import HTTPRouteHandler
@@ -90,11 +262,34 @@ def create_proxy_handler(path_prefix: str, handler_func):
         http_method=["GET", "POST", "PUT", "DELETE", "PATCH", "HEAD", "OPTIONS"],
     )(handler_func)
 
-app = Litestar(
-    route_handlers=[
-        health_check,
+async def close_response_cache() -> None:
+    if response_cache is not None and response_cache.disk is not None:
+        response_cache.disk.close()
+
+async def close_clients() -> None:
+    await clients.aclose()
+
+if INPROC_ENABLED:
+    # ChatMock and Claude Code API run inside this process; only Gemini (Node) is still proxied over HTTP
+    from .inproc import claude_code_lifespan, mount_handlers
+
+    backend_handlers = mount_handlers() + [create_proxy_handler("gemini", gemini_proxy)]
+    lifespan = [claude_code_lifespan]
+else:
+    backend_handlers = [
         create_proxy_handler("codex", codex_proxy),
         create_proxy_handler("cc", cc_proxy),
         create_proxy_handler("gemini", gemini_proxy),
     ]
-)
\ No newline at end of file
+    lifespan = []
+
+app = Litestar(
+    on_shutdown=[close_response_cache, close_clients],
+    lifespan=lifespan,
+    route_handlers=[
+        health_check,
+        proxy_stats,
+        prometheus_metrics,
+        *backend_handlers,
+    ]
+)
@@ -0,0 +1,186 @@
+import asyncio
+import hashlib
+import json
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+# Clients can send this header (any value other than "0"/"false") to always get their own upstream call
+OPT_OUT_HEADER = "x-coder2api-no-coalesce"
+# Set on responses that were served from another request's upstream call
+COALESCED_HEADER = "x-coder2api-coalesced"
+
+# Headers that change what the backend returns; everything else (user-agent, tracing ids, ...) is ignored
+KEY_HEADERS = (
+    "authorization",
+    "x-api-key",
+    "accept",
+    "content-type",
+    "anthropic-version",
+    "anthropic-beta",
+    "openai-organization",
+    "openai-project",
+    "x-session-id",
+    "session_id",
+)
+
+# POST endpoints that are safe to share because they only compute a completion
+COMPLETION_PATH_SUFFIXES = (
+    "chat/completions",
+    "completions",
+    "responses",
+    "messages",
+    "api/chat",
+    "api/generate",
+    "embeddings",
+)
+
+# Ollama-style endpoints stream unless the body sets "stream": false
+STREAM_BY_DEFAULT_SUFFIXES = ("api/chat", "api/generate")
+
+# Headers we must not forward on a buffered response: the body has already been decoded and re-framed
+_DROP_RESPONSE_HEADERS = {"content-length", "content-encoding", "transfer-encoding", "connection", "keep-alive"}
+
+
+@dataclass
+class BufferedResponse:
+    status_code: int
+    headers: Dict[str, str]
+    content: bytes
+    media_type: Optional[str] = None
+
+
+def buffered_from_httpx(response) -> BufferedResponse:
+    headers = {k: v for k, v in response.headers.items() if k.lower() not in _DROP_RESPONSE_HEADERS}
+    return BufferedResponse(
+        status_code=response.status_code,
+        headers=headers,
+        content=response.content,
+        media_type=response.headers.get("content-type"),
+    )
+
+
+def _canonical_body(content: bytes) -> bytes:
+    # JSON bodies are re-encoded with sorted keys so key order and whitespace don't split otherwise equal requests
+    if not content:
+        return b""
+    try:
+        return json.dumps(json.loads(content), sort_keys=True, separators=(",", ":")).encode("utf-8")
+    except (ValueError, UnicodeDecodeError):
+        return content
+
+
+def parse_json_body(content: bytes) -> Optional[dict]:
+    if not content:
+        return None
+    try:
+        data = json.loads(content)
+    except (ValueError, UnicodeDecodeError):
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def request_key(method: str, path: str, query: str, headers: Dict[str, str], content: bytes) -> str:
+    h = hashlib.sha256()
+    h.update(method.upper().encode("utf-8"))
+    h.update(b"\0")
+    h.update(path.encode("utf-8"))
+    h.update(b"?")
+    h.update(query.encode("utf-8"))
+    h.update(b"\0")
+    lowered = {k.lower(): v for k, v in headers.items()}
+    for name in KEY_HEADERS:
+        value = lowered.get(name)
+        if value is not None:
+            h.update(f"{name}:{value}\n".encode("utf-8"))
+    h.update(b"\0")
+    h.update(_canonical_body(content))
+    return h.hexdigest()
+
+
+def requests_stream(path: str, body: dict) -> bool:
+    """Whether a completion body asks for a streamed answer, taking the endpoint's default into account."""
+    stream = body.get("stream")
+    if stream is None:
+        return path.rstrip("/").endswith(STREAM_BY_DEFAULT_SUFFIXES)
+    return bool(stream)
+
+
+def is_coalescable(method: str, path: str, headers: Dict[str, str], body: Optional[dict]) -> bool:
+    """
+    Only idempotent, non-streaming calls are shared: plain GETs, and completion POSTs that didn't ask for a stream.
+    """
+    opt_out = next((v for k, v in headers.items() if k.lower() == OPT_OUT_HEADER), None)
+    if opt_out is not None and opt_out.strip().lower() not in ("0", "false", "no", "off"):
+        return False
+    method = method.upper()
+    if method == "GET":
+        return True
+    if method != "POST":
+        return False
+    if not path.rstrip("/").endswith(COMPLETION_PATH_SUFFIXES):
+        return False
+    if body is None:
+        return False
+    return not requests_stream(path, body)
+
+
+@dataclass
+class SingleFlightStats:
+    leaders: int = 0
+    coalesced: int = 0
+    errors: int = 0
+    by_backend: Dict[str, Dict[str, int]] = field(default_factory=dict)
+
+    def _bump(self, backend: str, name: str) -> None:
+        counters = self.by_backend.setdefault(backend, {"leaders": 0, "coalesced": 0})
+        counters[name] = counters.get(name, 0) + 1
+
+    def as_dict(self, inflight: int) -> dict:
+        return {
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "errors": self.errors,
+            "inflight": inflight,
+            "by_backend": {k: dict(v) for k, v in self.by_backend.items()},
+        }
+
+
+class SingleFlight:
+    """
+    Collapses concurrent calls that share a key into one upstream call.
+
+    The upstream call runs in its own task so that the first caller disconnecting doesn't cancel the request
+    for everyone else waiting on it.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.stats = SingleFlightStats()
+
+    def _forget(self, key: str, task: asyncio.Future) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled() and task.exception() is not None:
+            self.stats.errors += 1
+
+    async def do(
+        self,
+        key: str,
+        fn: Callable[[], Awaitable[BufferedResponse]],
+        backend: str = "",
+    ) -> Tuple[BufferedResponse, bool]:
+        task = self._inflight.get(key)
+        shared = task is not None
+        if shared:
+            self.stats.coalesced += 1
+            self.stats._bump(backend, "coalesced")
+        else:
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t, k=key: self._forget(k, t))
+            self.stats.leaders += 1
+            self.stats._bump(backend, "leaders")
+        return await asyncio.shield(task), shared
+
+    def snapshot(self) -> dict:
+        return self.stats.as_dict(len(self._inflight))
@@ -0,0 +1,83 @@
+import os
+from typing import Dict, Optional, Tuple
+
+import httpx
+
+# Backends started by `coder2api serve --uds` listen on Unix domain sockets; the proxy finds them through these
+UDS_ENV = {
+    "codex": "CODER2API_CODEX_UDS",
+    "cc": "CODER2API_CC_UDS",
+    "gemini": "CODER2API_GEMINI_UDS",
+}
+
+# Base URL used for socket clients; only the Host header is derived from it
+UDS_BASE_URL = "http://localhost"
+
+# Connection pool per backend. Every open SSE stream holds a connection for its whole lifetime, so the pool is
+# unbounded by default (like the one-client-per-request setup it replaces); only idle keep-alive connections are capped.
+MAX_CONNECTIONS_ENV = "CODER2API_MAX_CONNECTIONS"
+MAX_KEEPALIVE_ENV = "CODER2API_MAX_KEEPALIVE"
+DEFAULT_MAX_KEEPALIVE = 32
+
+
+def backend_socket(backend: str) -> Optional[str]:
+    name = UDS_ENV.get(backend)
+    path = os.environ.get(name, "").strip() if name else ""
+    return path or None
+
+
+def limits_from_env() -> httpx.Limits:
+    max_connections = os.environ.get(MAX_CONNECTIONS_ENV, "").strip()
+    max_keepalive = os.environ.get(MAX_KEEPALIVE_ENV, "").strip()
+    return httpx.Limits(
+        max_connections=int(max_connections) if max_connections and int(max_connections) > 0 else None,
+        max_keepalive_connections=int(max_keepalive) if max_keepalive else DEFAULT_MAX_KEEPALIVE,
+    )
+
+
+class BackendClients:
+    """
+    Long-lived httpx clients, one per backend and transport.
+
+    When a backend has a socket configured and the socket exists, requests go over the Unix domain socket;
+    otherwise (not configured, or the backend hasn't bound it yet) they fall back to TCP on the base URL.
+    Keeping the clients around also reuses keep-alive connections instead of opening one per request.
+    """
+
+    def __init__(self, timeout: float = 60.0, limits: Optional[httpx.Limits] = None):
+        self.timeout = timeout
+        self.limits = limits if limits is not None else limits_from_env()
+        self._clients: Dict[Tuple[str, str], httpx.AsyncClient] = {}
+
+    def get(self, backend: str, base_url: str) -> httpx.AsyncClient:
+        uds = backend_socket(backend)
+        if uds is not None and os.path.exists(uds):
+            key = (backend, f"unix:{uds}")
+            client = self._clients.get(key)
+            if client is None:
+                client = httpx.AsyncClient(
+                    base_url=UDS_BASE_URL,
+                    # Limits belong to the transport here; the client ignores them when given one
+                    transport=httpx.AsyncHTTPTransport(uds=uds, limits=self.limits),
+                    timeout=self.timeout,
+                )
+                self._clients[key] = client
+            return client
+        key = (backend, base_url)
+        client = self._clients.get(key)
+        if client is None:
+            client = httpx.AsyncClient(base_url=base_url, timeout=self.timeout, limits=self.limits)
+            self._clients[key] = client
+        return client
+
+    def transports(self) -> Dict[str, list]:
+        out: Dict[str, list] = {}
+        for backend, target in self._clients:
+            out.setdefault(backend, []).append(target)
+        return out
+
+    async def aclose(self) -> None:
+        clients = list(self._clients.values())
+        self._clients.clear()
+        for client in clients:
+            await client.aclose()